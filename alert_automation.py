@@ -1,21 +1,81 @@
-from pricealerts import create_app
+import signal
+import sys
+import time
+
+from pricealerts import create_worker_app, settings
+from pricealerts.checker.cycle import check_alerts, CycleStats
+from pricealerts.checker.engine import PriceCheckEngine
+from pricealerts.checker.scheduler import AlertScheduler, ScheduleListener
+from pricealerts.checker.thresholds import threshold_index
 from pricealerts.db import db
-from pricealerts.models import AlertModel
-from apscheduler.schedulers.blocking import BlockingScheduler
+from pricealerts.models import AlertModel, ItemModel, PriceRollupModel
+from pricealerts.utils import http_client
+from pricealerts.utils.breaker import breakers
+from pricealerts.utils.http_cache import validator_cache
+from pricealerts.utils.metrics import metrics
+from pricealerts.utils.ratelimit import rate_limiter
+
+app = create_worker_app()
+
+metrics.register('http_cache', validator_cache.stats)
+metrics.register('http_connections', http_client.stats)
+metrics.register('stores', rate_limiter.stats)
+metrics.register('breakers', breakers.stats)
+metrics.register('thresholds', threshold_index.stats)
+
+# Kept for the life of the process: its threads and parse processes check every batch of every cycle
+engine = PriceCheckEngine(ItemModel.download_item_page, rate_limiter=rate_limiter, breakers=breakers)
+
+
+def job(item_ids, deadline):
+    """
+    Check the due alerts of the items popped by the scheduler
+    :param item_ids: Ids of the items due
+    :param deadline: time.monotonic() after which no more alerts are claimed nor product pages requested
+    :return: False if the deadline passed before all the due alerts were checked
+    """
+    cycle = CycleStats()
+    metrics.register('cycle', cycle.json)
+
+    # Many clock processes can run: the due alerts are claimed in batches, every process checking the batches
+    # it claimed first
+    while time.monotonic() < deadline:
+        alerts_needing_update = AlertModel.claim_due(item_ids, limit=settings.CHECKER_CLAIM_BATCH)
+        if not alerts_needing_update:
+            return True
+
+        # Every product page is loaded once per cycle, whatever the number of alerts watching it
+        cycle.add(check_alerts(alerts_needing_update, engine=engine, thresholds=threshold_index, deadline=deadline))
+
+    return False
+
+
+compacted = [time.monotonic()]
+
 
-from pricealerts.settings import env
+def report():
+    if time.monotonic() - compacted[0] >= settings.PRICE_COMPACT_INTERVAL:
+        app.logger.info('Price history compacted: {}'.format(PriceRollupModel.compact()))
+        compacted[0] = time.monotonic()
 
-sched = BlockingScheduler()
+    validator_cache.save()
+    snapshot = metrics.save()
+    app.logger.info('HTTP cache: {}'.format(snapshot.get('http_cache')))
+    app.logger.info('HTTP connections: {}'.format(snapshot.get('http_connections')))
+    app.logger.info('Store queues: {}'.format(snapshot.get('stores')))
+    app.logger.info('Circuit breakers: {}'.format(snapshot.get('breakers')))
+    app.logger.info('Scheduler: {}'.format(snapshot.get('scheduler')))
 
-@sched.scheduled_job('interval', seconds=env('ALERT_CHECK_INTERVAL',default=10))
-def job():
-    app = create_app()
-    with app.app_context():
-        db.init_app(app)
-        alerts_needing_update = AlertModel.find_needing_update()
 
-        for alert in alerts_needing_update:
-            alert.load_price_change()
-            alert.send_email_if_price_limit_reached()
+# Heroku stops the dynos with a SIGTERM: exit through the finally below, which stops the parse processes
+signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
 
-sched.start()
\ No newline at end of file
+with app.app_context():
+    validator_cache.load()
+    listener = ScheduleListener(db.engine) if ScheduleListener.available(db.engine) else None
+    scheduler = AlertScheduler(job, listener, report=report, watchers=[threshold_index])
+    metrics.register('scheduler', scheduler.stats)
+    try:
+        scheduler.run()
+    finally:
+        engine.shutdown()
@@ -0,0 +1,217 @@
+# -*- coding: utf-8 -*-
+"""
+benchmarks/bench_corpus.py
+
+Throughput of ItemModel.fetch_item_data on the recorded product page corpus, per store: the pages are replayed by a
+local stub store, so the whole load path (HTTP client, parser backend and extractor) is measured without hitting the
+real sites. For every store it reports the pages loaded per second, the p50 / p99 latency of parsing a page and the
+peak resident memory, and checks every page is still extracted correctly. Every store runs in its own process, so
+the peak memory of one doesn't hide the others'.
+
+The results are saved in benchmarks/results/<commit>[-<backend>].json, and compared with the ones of another commit
+to catch parser and extractor regressions:
+
+    $ python -m benchmarks.bench_corpus --repeat 50
+    $ python -m benchmarks.bench_corpus --repeat 50 --compare <baseline-ref>
+
+The comparison exits with status 1 when a page isn't extracted correctly or a store loses more than --tolerance of
+its throughput or p99 latency.
+"""
+import argparse
+import datetime
+import glob
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+
+from benchmarks.corpus import load_corpus
+from benchmarks.stub_store import StubStore
+from pricealerts import settings
+from pricealerts.models import ItemModel
+from pricealerts.utils.parsers import get_backend
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results')
+
+
+def percentile(values, fraction):
+    """
+    :param values: Sorted values
+    :param fraction: Percentile wanted, between 0 and 1
+    """
+    return values[min(len(values) - 1, int(round(fraction * (len(values) - 1))))]
+
+
+def run_store(store, padding, repeat, backend=None):
+    """
+    Load every corpus page of one store through ItemModel.fetch_item_data
+    :param backend: HTML parser backend, None for the HTML_PARSER_BACKEND setting
+    :return: A dict with the throughput, parse latency, peak RSS and extraction errors of the store
+    """
+    # Every page is parsed: no fingerprint skip nor streaming early exit
+    settings.SCRAPER_FINGERPRINT = False
+    settings.SCRAPER_STREAMING = False
+    if backend:
+        settings.HTML_PARSER_BACKEND = backend
+
+    pages = load_corpus([store])
+    contents = dict((page.url_path, page.content(padding)) for page in pages)
+    errors = []
+
+    with StubStore(pages=contents) as stub:
+        urls = [(page, stub.url(page.url_path)) for page in pages]
+        rounds = []  # seconds spent loading all the pages, once per repeat
+        for i in range(repeat + 1):
+            start = time.monotonic()
+            for page, url in urls:
+                try:
+                    data = ItemModel.fetch_item_data(url, page.extractor)
+                except Exception as ex:
+                    data = ex
+                if data != page.expected and i == 0:
+                    errors.append('{}: {!r}'.format(page.path, data))
+            if i > 0:
+                # The first round opens the pooled connection and warms up the parser
+                rounds.append(time.monotonic() - start)
+    rounds.sort()
+
+    latencies = []
+    for _ in range(repeat):
+        for page in pages:
+            backend = get_backend(page.extractor.parser)
+            start = time.monotonic()
+            try:
+                backend.extract(contents[page.url_path], page.extractor)
+            except Exception:
+                pass
+            latencies.append(time.monotonic() - start)
+    latencies.sort()
+
+    return {
+        'store': store,
+        'pages': len(pages),
+        # The median round, less sensitive to the noise of the machine than the mean
+        'pages_per_sec': len(pages) / percentile(rounds, 0.5),
+        'p50_ms': percentile(latencies, 0.5) * 1000,
+        'p99_ms': percentile(latencies, 0.99) * 1000,
+        # ru_maxrss is in kilobytes on Linux
+        'peak_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        'errors': errors
+    }
+
+
+def git_commit():
+    """
+    :return: The short hash of the checked out commit, with a -dirty suffix if the tree has changes
+    """
+    try:
+        commit = subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD']).decode('utf-8').strip()
+        dirty = subprocess.check_output(['git', 'status', '--porcelain', '--untracked-files=no']).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+    return commit + '-dirty' if dirty else commit
+
+
+def load_results(ref):
+    """
+    :param ref: A results file, or the commit whose results are loaded from benchmarks/results
+    """
+    if os.path.exists(ref):
+        path = ref
+    elif os.path.exists(os.path.join(RESULTS_DIR, '{}.json'.format(ref))):
+        path = os.path.join(RESULTS_DIR, '{}.json'.format(ref))
+    else:
+        paths = sorted(glob.glob(os.path.join(RESULTS_DIR, '{}*.json'.format(ref))))
+        if not paths:
+            sys.exit('No benchmark results for {} in {}'.format(ref, RESULTS_DIR))
+        path = paths[0]
+
+    with open(path) as f:
+        return json.load(f)
+
+
+def compare(results, baseline, tolerance):
+    """
+    Print the change of every store against the baseline
+    :return: The stores which regressed
+    """
+    for option in ('padding_kb', 'repeat', 'backend', 'python'):
+        if results[option] != baseline[option]:
+            print('Warning: {} was {} in {}, the results may not be comparable'.format(
+                option, baseline[option], baseline['commit']))
+
+    print('\nCompared with {}:'.format(baseline['commit']))
+    print('{:<12} {:>14} {:>10} {:>10}'.format('store', 'pages/s', 'p50', 'p99'))
+    regressions = []
+    for store, result in sorted(results['stores'].items()):
+        before = baseline['stores'].get(store)
+        if before is None:
+            print('{:<12} {:>14}'.format(store, 'new'))
+            continue
+
+        changes = dict((metric, result[metric] / before[metric] - 1 if before[metric] else 0.0)
+                       for metric in ('pages_per_sec', 'p50_ms', 'p99_ms'))
+        regressed = result['errors'] or changes['pages_per_sec'] < -tolerance or changes['p99_ms'] > tolerance
+        print('{store:<12} {pages_per_sec:>+13.1%} {p50_ms:>+10.1%} {p99_ms:>+10.1%}{flag}'.format(
+            store=store, flag='  REGRESSION' if regressed else '', **changes))
+        if regressed:
+            regressions.append(store)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--padding-kb", type=int, default=0, help="Tracking markup added to every page")
+    parser.add_argument("--repeat", type=int, default=50, help="Times every page is loaded")
+    parser.add_argument("--backend", help="HTML parser backend, defaults to the HTML_PARSER_BACKEND setting")
+    parser.add_argument("--compare", help="Commit or results file to compare with")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="Change allowed before reporting a regression")
+    parser.add_argument("--store", help="Run only this store and print its results as JSON")
+    args = parser.parse_args()
+
+    if args.store:
+        print(json.dumps(run_store(args.store, args.padding_kb * 1024, args.repeat, args.backend)))
+        return
+
+    results = {
+        'commit': git_commit(),
+        'date': datetime.datetime.utcnow().isoformat(),
+        'python': platform.python_version(),
+        'backend': args.backend,
+        'padding_kb': args.padding_kb,
+        'repeat': args.repeat,
+        'stores': {}
+    }
+    for store in sorted(set(page.store for page in load_corpus())):
+        command = [sys.executable, '-m', 'benchmarks.bench_corpus', '--store', store,
+                   '--padding-kb', str(args.padding_kb), '--repeat', str(args.repeat)]
+        if args.backend:
+            command.extend(['--backend', args.backend])
+        output = subprocess.check_output(command)
+        results['stores'][store] = json.loads(output.decode('utf-8').strip().splitlines()[-1])
+
+    print('{:<12} {:>6} {:>10} {:>10} {:>10} {:>14} {:>8}'.format('store', 'pages', 'pages/s', 'p50 ms', 'p99 ms',
+                                                                  'peak RSS KB', 'errors'))
+    for store, result in sorted(results['stores'].items()):
+        print('{store:<12} {pages:>6} {pages_per_sec:>10.1f} {p50_ms:>10.2f} {p99_ms:>10.2f} {peak_rss_kb:>14} '
+              '{0:>8}'.format(len(result['errors']), **result))
+        for error in result['errors']:
+            print('    {}'.format(error))
+
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    path = os.path.join(RESULTS_DIR, '{}{}.json'.format(results['commit'], '-' + args.backend if args.backend else ''))
+    with open(path, 'w') as f:
+        json.dump(results, f, indent=2)
+    print('Results saved in {}'.format(os.path.relpath(path)))
+
+    if args.compare:
+        regressions = compare(results, load_results(args.compare), args.tolerance)
+        if regressions:
+            sys.exit('Regressions in {}'.format(', '.join(regressions)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+"""
+benchmarks/bench_parsers.py
+
+Compare the HTML parser backends (pricealerts/utils/parsers.py) on the product page corpus: parse latency, peak
+memory and whether every page is still extracted correctly. Every backend runs in its own process, so the peak
+resident memory of one doesn't hide the others'.
+
+    $ python -m benchmarks.bench_parsers --padding-kb 300 --repeat 5
+"""
+import argparse
+import json
+import resource
+import subprocess
+import sys
+import time
+
+from benchmarks.corpus import load_corpus
+from pricealerts.utils.parsers import BACKENDS, get_backend
+
+
+def run_backend(name, padding, repeat):
+    """
+    Parse every corpus page with one backend
+    :return: A dict with the latency, peak RSS and extraction errors of the backend
+    """
+    backend = get_backend(name)
+    pages = [(page, page.content(padding)) for page in load_corpus()]
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    latencies = []
+    errors = []
+    for page, content in pages:
+        for _ in range(repeat):
+            start = time.monotonic()
+            try:
+                data = backend.extract(content, page.extractor)
+            except Exception as ex:
+                data = ex
+            latencies.append(time.monotonic() - start)
+
+        if data != page.expected:
+            errors.append('{}: {!r}'.format(page.path, data))
+
+    latencies.sort()
+    return {
+        'backend': backend.name,
+        'pages': len(pages),
+        'mean_ms': sum(latencies) / len(latencies) * 1000,
+        'p50_ms': latencies[len(latencies) // 2] * 1000,
+        'max_ms': latencies[-1] * 1000,
+        # ru_maxrss is in kilobytes on Linux
+        'peak_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - rss_before,
+        'errors': errors
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--padding-kb", type=int, default=300, help="Tracking markup added to every page")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--backend", help="Run only this backend and print its results as JSON")
+    args = parser.parse_args()
+
+    if args.backend:
+        print(json.dumps(run_backend(args.backend, args.padding_kb * 1024, args.repeat)))
+        return
+
+    results = []
+    for name in sorted(BACKENDS):
+        output = subprocess.check_output([sys.executable, '-m', 'benchmarks.bench_parsers', '--backend', name,
+                                          '--padding-kb', str(args.padding_kb), '--repeat', str(args.repeat)])
+        results.append(json.loads(output.decode('utf-8').strip().splitlines()[-1]))
+
+    print('{:<12} {:>10} {:>10} {:>10} {:>14} {:>8}'.format('backend', 'mean ms', 'p50 ms', 'max ms',
+                                                             'peak RSS KB', 'errors'))
+    for result in results:
+        print('{backend:<12} {mean_ms:>10.1f} {p50_ms:>10.1f} {max_ms:>10.1f} {peak_rss_kb:>14} '
+              '{0:>8}'.format(len(result['errors']), **result))
+        for error in result['errors']:
+            print('    {}'.format(error))
+
+    correct = [result for result in results if not result['errors']]
+    if correct:
+        fastest = min(correct, key=lambda result: result['mean_ms'])
+        print('Fastest backend extracting every page correctly: {}'.format(fastest['backend']))
+
+
+if __name__ == "__main__":
+    main()
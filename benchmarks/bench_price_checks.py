@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+"""
+benchmarks/bench_price_checks.py
+
+Measure how many alerts per second the clock process can check, sequentially (one load_item_data() after the other,
+as alert_automation.job used to do) and with the concurrent PriceCheckEngine, parsing the pages in the download
+threads and in parse processes.
+
+The product pages are served by local stub stores with a simulated response time, so the numbers only depend on
+the checker. Run it from the project root (the pricealerts settings must be available in the environment):
+
+    $ python -m benchmarks.bench_price_checks --alerts 500 --stores 5 --latency 0.05
+
+With --corpus the stores serve the corpus pages, padded to the size of real product pages, so the parsing weighs
+as much as it does with the real stores:
+
+    $ python -m benchmarks.bench_price_checks --alerts 500 --corpus --padding-kb 300 --skip-sequential
+"""
+import argparse
+import os
+import time
+
+from benchmarks.corpus import load_corpus
+from benchmarks.stub_store import StubStore
+from pricealerts import settings
+from pricealerts.checker.engine import PriceCheckEngine
+from pricealerts.models import ItemModel
+
+
+def bench_sequential(jobs):
+    start = time.monotonic()
+    for key, url, *args in jobs:
+        ItemModel.fetch_item_data(url, *args)
+    return time.monotonic() - start
+
+
+def bench_engine(jobs, max_workers, per_host_limit, parse_workers):
+    with PriceCheckEngine(ItemModel.download_item_page, max_workers=max_workers, per_host_limit=per_host_limit,
+                          parse_workers=parse_workers) as engine:
+        start = time.monotonic()
+        results = engine.run(jobs)
+        elapsed = time.monotonic() - start
+
+    failed = [result for result in results.values() if not result.ok]
+    if failed:
+        raise RuntimeError('{} product pages were not loaded: {}'.format(len(failed), failed[0].error))
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--alerts", type=int, default=200)
+    parser.add_argument("--stores", type=int, default=4)
+    parser.add_argument("--latency", type=float, default=0.05, help="Stub store response time in seconds")
+    parser.add_argument("--workers", type=int, default=20)
+    parser.add_argument("--per-host", type=int, default=4)
+    parser.add_argument("--parse-workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--corpus", action='store_true', help="Serve the corpus pages instead of small generated ones")
+    parser.add_argument("--padding-kb", type=int, default=300, help="Tracking markup added to the corpus pages")
+    parser.add_argument("--skip-sequential", action='store_true')
+    args = parser.parse_args()
+
+    # Every page is parsed, as if they all changed since the last check
+    settings.SCRAPER_FINGERPRINT = False
+
+    pages = None
+    corpus = load_corpus() if args.corpus else []
+    if corpus:
+        pages = dict((page.url_path, page.content(args.padding_kb * 1024)) for page in corpus)
+
+    stores = [StubStore(latency=args.latency, pages=pages).start() for _ in range(args.stores)]
+    try:
+        if corpus:
+            jobs = [(i, stores[i % len(stores)].url(page.url_path), page.extractor)
+                    for i, page in ((i, corpus[i % len(corpus)]) for i in range(args.alerts))]
+        else:
+            jobs = [(i, stores[i % len(stores)].url('/product/{}'.format(i))) for i in range(args.alerts)]
+
+        print('{} alerts over {} stub stores, {:.0f} ms per page'.format(args.alerts, args.stores,
+                                                                        args.latency * 1000))
+        if not args.skip_sequential:
+            elapsed = bench_sequential(jobs)
+            print('sequential : {:>8.1f} alerts/s ({:.2f} s)'.format(len(jobs) / elapsed, elapsed))
+
+        elapsed = bench_engine(jobs, args.workers, args.per_host, 0)
+        print('engine     : {:>8.1f} alerts/s ({:.2f} s, workers={}, per host={}, parsed in the threads)'.format(
+            len(jobs) / elapsed, elapsed, args.workers, args.per_host))
+
+        elapsed = bench_engine(jobs, args.workers, args.per_host, args.parse_workers)
+        print('pipeline   : {:>8.1f} alerts/s ({:.2f} s, workers={}, per host={}, parse processes={})'.format(
+            len(jobs) / elapsed, elapsed, args.workers, args.per_host, args.parse_workers))
+    finally:
+        for store in stores:
+            store.stop()
+
+
+if __name__ == "__main__":
+    main()
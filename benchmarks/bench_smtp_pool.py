@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+"""
+benchmarks/bench_smtp_pool.py
+
+Throughput of the SMTP fallback of NotificationDispatcher.send_email: one connection per email, as send_email used to
+do (connect, EHLO, AUTH, send, QUIT), against the SMTPConnectionPool reusing authenticated sessions.
+
+The emails are sent to a local aiosmtpd server (pip install aiosmtpd, see requirements/development.txt). A real
+server is far away: --handshake delays the EHLO of every session, standing for the TCP, TLS and AUTH round trips,
+and --latency delays every MAIL, RCPT and DATA command. Run it from the project root:
+
+    $ python -m benchmarks.bench_smtp_pool --emails 200 --threads 8 --handshake 0.15 --latency 0.03
+"""
+import argparse
+import asyncio
+import smtplib
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from email.message import EmailMessage
+
+from aiosmtpd.controller import Controller
+from aiosmtpd.smtp import AuthResult
+
+from pricealerts.utils.smtp_pool import SMTPConnectionPool
+
+
+class SlowHandler(object):
+    """
+    Accepts every email after the configured delays, counting the sessions and the emails
+    """
+
+    def __init__(self, handshake, latency):
+        self.handshake = handshake
+        self.latency = latency
+        self.lock = threading.Lock()
+        self.sessions = 0
+        self.emails = 0
+
+    async def handle_EHLO(self, server, session, envelope, hostname, responses):
+        with self.lock:
+            self.sessions += 1
+        await asyncio.sleep(self.handshake)
+        session.host_name = hostname
+        return responses
+
+    async def handle_MAIL(self, server, session, envelope, address, mail_options):
+        await asyncio.sleep(self.latency)
+        envelope.mail_from = address
+        return '250 OK'
+
+    async def handle_RCPT(self, server, session, envelope, address, rcpt_options):
+        await asyncio.sleep(self.latency)
+        envelope.rcpt_tos.append(address)
+        return '250 OK'
+
+    async def handle_DATA(self, server, session, envelope):
+        await asyncio.sleep(self.latency)
+        with self.lock:
+            self.emails += 1
+        return '250 Message accepted for delivery'
+
+
+def accept_any(server, session, envelope, mechanism, auth_data):
+    return AuthResult(success=True)
+
+
+def build_email(n):
+    msg = EmailMessage()
+    msg['From'] = 'Pricing Alert Service <alerts@techfitu.com>'
+    msg['To'] = 'buyer{}@gmail.com'.format(n)
+    msg['Subject'] = 'NEW ALERT FOR PRICE DROP'
+    msg.set_content('The product Item{} has dropped its price.'.format(n))
+    return msg
+
+
+def send_with_new_connection(host, port, msg):
+    smtp = smtplib.SMTP(host, port, timeout=10)
+    smtp.login('alerts', '1234')
+    smtp.send_message(msg)
+    smtp.quit()
+
+
+def bench(send, emails, threads):
+    start = time.monotonic()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        list(pool.map(send, [build_email(n) for n in range(emails)]))
+    return time.monotonic() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--emails", type=int, default=200)
+    parser.add_argument("--threads", type=int, default=8, help="Delivery workers sending at once")
+    parser.add_argument("--handshake", type=float, default=0.15, help="Seconds to open a session")
+    parser.add_argument("--latency", type=float, default=0.03, help="Seconds per SMTP command of a message")
+    args = parser.parse_args()
+
+    handler = SlowHandler(args.handshake, args.latency)
+    controller = Controller(handler, hostname='127.0.0.1', port=8025, authenticator=accept_any,
+                            auth_require_tls=False)
+    controller.start()
+    try:
+        print('{:<24} {:>12} {:>12} {:>10}'.format('', 'emails/sec', 'seconds', 'sessions'))
+
+        handler.sessions = 0
+        elapsed = bench(lambda msg: send_with_new_connection('127.0.0.1', 8025, msg), args.emails, args.threads)
+        print('{:<24} {:>12.1f} {:>12.2f} {:>10}'.format('connection per email', args.emails / elapsed, elapsed,
+                                                         handler.sessions))
+
+        handler.sessions = 0
+        pool = SMTPConnectionPool('127.0.0.1', 8025, username='alerts', password='1234', max_size=args.threads,
+                                  factory=smtplib.SMTP)
+        elapsed = bench(pool.send_message, args.emails, args.threads)
+        pool.close()
+        print('{:<24} {:>12.1f} {:>12.2f} {:>10}'.format('connection pool', args.emails / elapsed, elapsed,
+                                                         handler.sessions))
+        print('Pool: {}'.format(pool.stats()))
+    finally:
+        controller.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+"""
+benchmarks/bench_streaming.py
+
+Compare the buffered extraction of product data (download the whole page, build a BeautifulSoup tree) with the
+streaming one (feed the page in chunks to an incremental parser and stop once the product data was found).
+
+The corpus pages are served by a local stub store, padded with tracking markup to the size of real product pages.
+For every page it reports the KB read, the ms spent and the peak KB of memory allocated by each mode:
+
+    $ python -m benchmarks.bench_streaming --padding-kb 1500
+"""
+import argparse
+import time
+import tracemalloc
+
+from bs4 import BeautifulSoup, SoupStrainer
+
+from benchmarks.corpus import load_corpus
+from benchmarks.stub_store import StubStore
+from pricealerts.utils import http_client
+from pricealerts.utils.streaming import stream_item_data
+
+
+def buffered(url, extractor):
+    req = http_client.get(url)
+    soup = BeautifulSoup(req.content, 'html.parser', parse_only=SoupStrainer(name=['title', 'p', 'span', 'img']))
+    return extractor.extract(soup), len(req.content)
+
+
+def streaming(url, extractor):
+    req = http_client.get(url, stream=True)
+    read = [0]
+    iter_content = req.iter_content
+
+    def counted_iter_content(*args, **kwargs):
+        for chunk in iter_content(*args, **kwargs):
+            read[0] += len(chunk)
+            yield chunk
+
+    req.iter_content = counted_iter_content
+    return stream_item_data(req, extractor), read[0]
+
+
+def measure(mode, url, extractor, repeat):
+    tracemalloc.start()
+    start = time.monotonic()
+    for _ in range(repeat):
+        data, read = mode(url, extractor)
+    elapsed = (time.monotonic() - start) / repeat
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return data, read, elapsed, peak
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--padding-kb", type=int, default=1500, help="Tracking markup added to every page")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    corpus = load_corpus()
+    pages = dict((page.url_path, page.content(args.padding_kb * 1024)) for page in corpus)
+
+    with StubStore(pages=pages) as store:
+        print('{:<48} {:>9} {:>10} {:>9} {:>10} {:>9} {:>10}'.format(
+            'page', 'buf KB', 'buf ms', 'buf peak', 'str KB', 'str ms', 'str peak'))
+        totals = [0, 0, 0, 0, 0, 0]
+        for page in corpus:
+            url = store.url(page.url_path)
+            row = []
+            for mode in (buffered, streaming):
+                data, read, elapsed, peak = measure(mode, url, page.extractor, args.repeat)
+                if data != page.expected:
+                    raise RuntimeError('{} extracted {} from {}, expected {}'.format(
+                        mode.__name__, data, page.path, page.expected))
+                row.extend([read / 1024, elapsed * 1000, peak / 1024])
+
+            totals = [total + value for total, value in zip(totals, row)]
+            print('{:<48} {:>9.0f} {:>10.1f} {:>9.0f} {:>10.0f} {:>9.1f} {:>10.0f}'.format(page.path[:48], *row))
+
+        count = len(corpus)
+        print('{:<48} {:>9.0f} {:>10.1f} {:>9.0f} {:>10.0f} {:>9.1f} {:>10.0f}'.format(
+            'average', *[total / count for total in totals]))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+"""
+benchmarks/corpus.py
+
+Product pages used by the benchmarks, stored in benchmarks/corpus/<store>/ and described in corpus/index.json with
+the extraction rule of their store and the (name, price, image) expected from them.
+"""
+import json
+import os
+
+from pricealerts.utils.extractors import PriceExtractor
+
+CORPUS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'corpus')
+
+# Tracking markup appended to the pages to simulate the size of real product pages
+PADDING_BLOCK = b'<script>(function(){var t=window._tq=window._tq||[];t.push(["track","view",' \
+                b'"0123456789abcdef0123456789abcdef"]);})();</script>\n<div class="ad-slot" data-slot="1"></div>\n'
+
+
+class CorpusPage(object):
+    def __init__(self, store, path, tag_name, query_string, expected, url_prefix=None):
+        self.store = store
+        self.path = path
+        self.url_prefix = url_prefix
+        self.extractor = PriceExtractor(tag_name, query_string)
+        self.expected = tuple(expected)
+
+    @property
+    def url_path(self):
+        return '/' + self.path
+
+    def content(self, padding=0):
+        """
+        :param padding: Bytes of tracking markup added before the end of the body
+        :return: The page as bytes
+        """
+        with open(os.path.join(CORPUS_DIR, self.path), 'rb') as f:
+            content = f.read()
+
+        if padding > 0:
+            blocks = PADDING_BLOCK * (padding // len(PADDING_BLOCK) + 1)
+            content = content.replace(b'</body>', blocks[:padding] + b'</body>')
+        return content
+
+
+def load_corpus(stores=None):
+    """
+    :param stores: Names of the stores whose pages are loaded, all of them if None
+    :return: List of CorpusPage
+    """
+    with open(os.path.join(CORPUS_DIR, 'index.json')) as f:
+        index = json.load(f)
+
+    return [CorpusPage(**entry) for entry in index if stores is None or entry['store'] in stores]
@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+"""
+benchmarks/record_corpus.py
+
+Record a live product page in the corpus, so the benchmarks can replay it offline. The page is downloaded once, its
+data is extracted with the store's rule and saved in corpus/index.json as the data expected from the page: check it
+by hand before committing the page.
+
+    $ python -m benchmarks.record_corpus johnlewis https://www.johnlewis.com/john-lewis-partners-amber-clear-swirl-bauble-orange/p3527237 \\
+        --tag-name p --query-string '{"class": "price price--large"}'
+"""
+import argparse
+import json
+import os
+import re
+import sys
+from urllib.parse import urlparse
+
+from benchmarks.corpus import CORPUS_DIR
+from pricealerts.utils import http_client
+from pricealerts.utils.extractors import PriceExtractor
+from pricealerts.utils.parsers import get_backend
+
+
+def page_slug(url):
+    """
+    :return: A file name for the page of url, i.e: john-lewis-partners-amber-clear-swirl-bauble-orange-p3527237
+    """
+    slug = re.sub(r'[^a-z0-9]+', '-', urlparse(url).path.lower()).strip('-')
+    return slug[-80:].strip('-') or 'index'
+
+
+def record(store, url, tag_name, query_string, name=None):
+    """
+    Download a product page and add it to the corpus
+    :return: The index entry of the page
+    """
+    req = http_client.get(url)
+    if req.status_code != 200:
+        raise RuntimeError('{} answered {}'.format(url, req.status_code))
+
+    extractor = PriceExtractor(tag_name, query_string)
+    data = get_backend().extract(req.content, extractor)
+
+    path = '{}/{}.html'.format(store, name or page_slug(url))
+    os.makedirs(os.path.join(CORPUS_DIR, store), exist_ok=True)
+    with open(os.path.join(CORPUS_DIR, path), 'wb') as f:
+        f.write(req.content)
+
+    o = urlparse(url)
+    entry = {
+        'store': store,
+        'path': path,
+        'url_prefix': '{}://{}'.format(o.scheme, o.netloc),
+        'tag_name': tag_name,
+        'query_string': query_string,
+        'expected': list(data)
+    }
+
+    index_path = os.path.join(CORPUS_DIR, 'index.json')
+    with open(index_path) as f:
+        index = [page for page in json.load(f) if page['path'] != path]
+    index.append(entry)
+    with open(index_path, 'w') as f:
+        json.dump(index, f, indent=2, ensure_ascii=False)
+        f.write('\n')
+
+    return entry
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("store", help="Folder of the store in the corpus, i.e: johnlewis")
+    parser.add_argument("url", help="Product page to record")
+    parser.add_argument("--tag-name", default="p", help="Tag holding the price")
+    parser.add_argument("--query-string", default="{}", help="Attributes of the tag holding the price, as JSON")
+    parser.add_argument("--name", help="File name of the page, defaults to one built from the url")
+    args = parser.parse_args()
+
+    try:
+        entry = record(args.store, args.url, args.tag_name, json.loads(args.query_string), args.name)
+    except Exception as ex:
+        sys.exit('{} not recorded: {}'.format(args.url, getattr(ex, 'message', ex)))
+
+    print('Recorded {path}: {expected}'.format(**entry))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+"""
+benchmarks/stub_mailgun.py
+
+Local stand-in for the Mailgun messages endpoint, so the emails can be tested without sending them. It checks the
+requests as Mailgun does for batch sending: at most `batch_limit` recipients, and recipient variables for all of them
+when some are given. The accepted requests are recorded with their form fields.
+"""
+import json
+import threading
+import time
+from urllib.parse import parse_qs
+
+from benchmarks.stub_store import StubStore, StubStoreHandler
+
+
+class StubMailgunHandler(StubStoreHandler):
+    def do_POST(self):
+        if self.server.latency:
+            time.sleep(self.server.latency)
+
+        length = int(self.headers.get('Content-Length', 0))
+        form = parse_qs(self.rfile.read(length).decode('utf-8'))
+        status, answer = self.server.accept(self.path, form)
+
+        body = json.dumps(answer).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class StubMailgun(StubStore):
+    """
+    Stub Mailgun API running in a background thread.
+
+    with StubMailgun() as mailgun:
+        requests.post(mailgun.url('/v3/techfitu.com/messages'), data={...})
+    """
+
+    def __init__(self, latency=0.0, batch_limit=1000, status=200, host='127.0.0.1', port=0):
+        """
+        :param latency: Seconds waited before answering every request
+        :param batch_limit: Recipients accepted per request
+        :param status: Status code of the answers, i.e. 500 to test the SMTP fallback
+        """
+        super(StubMailgun, self).__init__(latency=latency, host=host, port=port, handler=StubMailgunHandler)
+        self.batch_limit = batch_limit
+        self.status = status
+        self.lock = threading.Lock()
+        self.requests = []
+        self.server.accept = self.accept
+
+    def accept(self, path, form):
+        """
+        :param form: The form fields of the request, every field mapped to the list of its values
+        :return: (status code, JSON answer)
+        """
+        recipients = form.get('to', [])
+        if not recipients or 'from' not in form:
+            return 400, {'message': "'from' and 'to' parameters are missing"}
+        if len(recipients) > self.batch_limit:
+            return 400, {'message': 'Too many recipients'}
+        if 'recipient-variables' in form:
+            variables = json.loads(form['recipient-variables'][0])
+            if any(address not in variables for address in recipients):
+                return 400, {'message': 'Recipient variables missing'}
+
+        with self.lock:
+            self.requests.append((path, form))
+        if self.status != 200:
+            return self.status, {'message': 'Unavailable'}
+        return 200, {'id': '<{}@techfitu.com>'.format(len(self.requests)), 'message': 'Queued. Thank you.'}
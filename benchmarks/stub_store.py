@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+"""
+benchmarks/stub_store.py
+
+Local stand-in for an online store, so the price checker can be benchmarked without hitting real sites.
+Every path returns a small product page with the John Lewis markup, or the page registered for the path, after an
+optional delay that simulates the store's response time.
+"""
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+
+PRODUCT_PAGE = """<!DOCTYPE html>
+<html>
+<head><title>{name}</title></head>
+<body>
+<h1>{name}</h1>
+<img src="/images/{slug}.jpg" alt="{name}">
+<p class="price price--large">&pound;{price}</p>
+<p>Free delivery on orders over &pound;50</p>
+</body>
+</html>
+"""
+
+
+class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # Clients closing their connections early are expected, don't print their tracebacks
+        pass
+
+
+class StubStoreHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # Headers and body are written separately, don't let Nagle's algorithm delay the body
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        if self.server.latency:
+            time.sleep(self.server.latency)
+
+        body = self.server.render(self.path)
+        if body is None:
+            self.send_error(404)
+            return
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        try:
+            self.wfile.write(body)
+        except (BrokenPipeError, ConnectionResetError):
+            # Streaming clients close the connection once they found the product data
+            self.close_connection = True
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StubStore(object):
+    """
+    Stub store running in a background thread.
+
+    with StubStore(latency=0.05) as store:
+        requests.get(store.url('/product/1'))
+    """
+
+    def __init__(self, latency=0.0, pages=None, host='127.0.0.1', port=0, handler=StubStoreHandler):
+        """
+        :param latency: Seconds waited before answering every request
+        :param pages: Dict mapping paths to the bytes served for them, None to serve a generated page for every path
+        """
+        self.pages = pages
+        self.server = ThreadingHTTPServer((host, port), handler)
+        self.server.latency = latency
+        self.server.render = self.render
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def render(self, path):
+        if self.pages is not None:
+            return self.pages.get(path)
+
+        slug = path.strip('/').replace('/', '-') or 'home'
+        return PRODUCT_PAGE.format(name='Stub product {}'.format(slug), slug=slug, price='6.00').encode('utf-8')
+
+    @property
+    def base_url(self):
+        host, port = self.server.server_address[:2]
+        return 'http://{}:{}'.format(host, port)
+
+    def url(self, path):
+        return self.base_url + path
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
@@ -0,0 +1,21 @@
+from pricealerts import create_worker_app
+from pricealerts.delivery.worker import DeliveryWorker
+from pricealerts.models import OutboxMessageModel
+from pricealerts.utils.metrics import delivery_metrics
+from pricealerts.utils.notifications import NotificationDispatcher
+
+app = create_worker_app()
+worker = DeliveryWorker()
+
+delivery_metrics.register('outbox', OutboxMessageModel.stats)
+delivery_metrics.register('delivery', worker.stats)
+delivery_metrics.register('smtp', lambda: NotificationDispatcher.smtp_pool().stats())
+
+
+def report():
+    snapshot = delivery_metrics.save()
+    app.logger.debug('Outbox: {}, delivery: {}'.format(snapshot.get('outbox'), snapshot.get('delivery')))
+
+
+with app.app_context():
+    worker.run(report=report)
@@ -45,4 +45,12 @@ loglevel = 'error'
 # Process Naming
 proc_name = 'alert_pricing_service'
 
+# Server Hooks
+def post_fork(server, worker):
+    # Every worker syncs the columnar copy of the price history read by the admin indicators (analytics/store.py).
+    # The app is preloaded in the master process, whose threads don't survive the fork: the thread starts here.
+    from run import application
+    from pricealerts.analytics.store import start_sync
+    start_sync(application)
+
 ###### End Gunicorn settings#####
\ No newline at end of file
@@ -10,14 +10,14 @@ from flask_wtf.csrf import CSRFError, CSRFProtect
 from werkzeug.exceptions import BadRequest, NotFound
 
 from pricealerts.db import db
+from pricealerts.migrations import upgrade_schema
 from pricealerts.models import UserModel, ItemModel, StoreModel, AlertModel
 from pricealerts.settings import *
 
 LOGGING_CONFIG = None
 
 
-def create_app(test_config=None):
-    # Create logging config before Flask instance app is created
+def configure_logging():
     # Reset logging
     # (see http://www.caktusgroup.com/blog/2015/01/27/Django-Logging-Configuration-logging_config-default-settings-logger/)
 
@@ -68,9 +68,14 @@ def create_app(test_config=None):
     }
     dictConfig(LOGGING)
 
-    # create and configure the app
-    app = Flask(__name__, instance_relative_config=True)
 
+def configure_app(app, test_config=None):
+    """
+    Load the settings of the app and set up its instance folder and error emails, shared by the web and the
+    worker apps
+    :param app: The Flask app
+    :param test_config: Mapping overriding the settings, the instance config is loaded if None
+    """
     # ensure the instance folder exists with photos and logs folders inside
     try:
         os.makedirs(app.instance_path)
@@ -110,6 +115,31 @@ def create_app(test_config=None):
 
         app.logger.addHandler(mail_handler)
 
+
+def create_worker_app(test_config=None):
+    """
+    Lightweight app of the clock process (alert_automation.py): settings, logging and database only. The price checks
+    don't serve requests, so the views, templates, CSRF protection and login manager of create_app aren't set up.
+    Build it once and keep its app context, the pooled database connections are reused by every check.
+    Its commits don't notify the scheduler (AlertModel.notify_schedule), it would wake up for the items it just checked.
+    :param test_config: Mapping overriding the settings
+    """
+    configure_logging()
+    app = Flask(__name__, instance_relative_config=True)
+    app.config['SCHEDULER_NOTIFY'] = False
+    configure_app(app, test_config)
+    db.init_app(app)
+    return app
+
+
+def create_app(test_config=None):
+    # Create logging config before Flask instance app is created
+    configure_logging()
+
+    # create and configure the app
+    app = Flask(__name__, instance_relative_config=True)
+    configure_app(app, test_config)
+
     # Flask-Login needs to be created and initialized right after the application instance
     # Docs OK: https://blog.miguelgrinberg.com/post/the-flask-mega-tutorial-part-v-user-logins
     loginmanager = LoginManager(app)
@@ -195,7 +225,7 @@ def create_app(test_config=None):
     if app.config['ENV'] == 'production':
         @app.before_first_request
         def create_all_tables():
-            db.create_all()
+            upgrade_schema()
 
             # Create initial data
             user = UserModel.find_by(username='alexmtnezf@gmail.com')
@@ -205,16 +235,26 @@ def create_app(test_config=None):
                 db.session.commit()
 
 
+    @app.cli.command('upgrade-db')
+    def upgrade_db():
+        """
+        Create the missing tables and add the new columns to the existing ones (release phase of the Procfile)
+        """
+        upgraded = upgrade_schema()
+        print('Columns added: {}'.format(upgraded) if upgraded else 'The database is up to date')
+
     # Register views with blueprints
     from .views.users import user_blueprint
     from .views.alerts import alert_blueprint
     from .views.globals_views import global_bp
     from .views.twilio_api import twilio_bp
+    from .views.admin import admin_bp
 
     app.register_blueprint(user_blueprint)
     app.register_blueprint(alert_blueprint)
     app.register_blueprint(global_bp)
     app.register_blueprint(twilio_bp)
+    app.register_blueprint(admin_bp)
     csrf.exempt(twilio_bp)
 
     return app
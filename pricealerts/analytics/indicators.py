@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+"""
+analytics/indicators.py
+
+Vectorized price indicators over the arrays of the columnar price history (analytics/store.py). The observations are
+irregular (a row when the price changes, heartbeats otherwise), so the time based indicators first resample them on
+a regular grid, carrying the last price forward. The admins get the indicators of an item at
+/admin/items/<item_id>/indicators (views/admin.py).
+"""
+import numpy as np
+
+DAY = np.timedelta64(1, 'D')
+
+
+def resample(times, prices, step=DAY, start=None, end=None):
+    """
+    Price in effect at every step of a regular grid, the last one observed before it
+    :param times: Observation times, datetime64 in chronological order
+    :param prices: Prices observed
+    :param step: timedelta64 between two points of the grid
+    :param start: First point of the grid, the first observation if None
+    :param end: Last point of the grid, the last observation if None
+    :return: (grid, prices) arrays, the prices before the first observation are NaN
+    """
+    if not len(times):
+        return np.empty(0, 'M8[s]'), np.empty(0)
+
+    start = times[0] if start is None else np.datetime64(start, 's')
+    end = times[-1] if end is None else np.datetime64(end, 's')
+    grid = np.arange(start, end + np.timedelta64(1, 's'), step)
+
+    # Index of the last observation at or before every point of the grid
+    index = np.searchsorted(times, grid, side='right') - 1
+    resampled = np.where(index >= 0, np.asarray(prices, dtype=float)[np.maximum(index, 0)], np.nan)
+    return grid, resampled
+
+
+def _rolling(values, window, ufunc, identity):
+    """
+    Rolling reduction over the last `window` values in O(n) (van Herk / Gil-Werman): the values are cut in blocks
+    of `window`, and every window is covered by the suffix of one block and the prefix of the next one.
+    The first window - 1 results reduce the values available so far.
+    """
+    values = np.asarray(values, dtype=float)
+    n = len(values)
+    if window <= 1 or n == 0:
+        return values.copy()
+
+    padded = np.concatenate([values, np.full((-n) % window, identity)])
+    blocks = padded.reshape(-1, window)
+    prefix = ufunc.accumulate(blocks, axis=1).ravel()
+    suffix = ufunc.accumulate(blocks[:, ::-1], axis=1)[:, ::-1].ravel()
+
+    result = np.empty(n)
+    result[:window - 1] = ufunc.accumulate(values[:window - 1])
+    result[window - 1:] = ufunc(suffix[:n - window + 1], prefix[window - 1:n])
+    return result
+
+
+def rolling_min(values, window):
+    """
+    :param values: Regularly sampled prices, i.e. resample()d daily
+    :param window: Number of samples in the window
+    :return: The lowest price of the window ending at every sample
+    """
+    return _rolling(values, window, np.fmin, np.inf)
+
+
+def rolling_max(values, window):
+    """
+    :return: The highest price of the window ending at every sample
+    """
+    return _rolling(values, window, np.fmax, -np.inf)
+
+
+def drop_from_high(times, prices, days, now=None):
+    """
+    Percentage drop of the current price from the highest price of the last `days` days, i.e. 25.0 for a product
+    sold at 75 after selling at 100 in the period
+    :param times: Observation times, datetime64 in chronological order
+    :param prices: Prices observed
+    :param now: End of the period, the last observation if None
+    :return: The drop, None without observations
+    """
+    if not len(times):
+        return None
+
+    now = times[-1] if now is None else np.datetime64(now, 's')
+    current = np.searchsorted(times, now, side='right') - 1
+    if current < 0:
+        return None
+
+    # The price in effect at the start of the period counts as well
+    first = max(0, np.searchsorted(times, now - days * DAY, side='right') - 1)
+    high = np.max(prices[first:current + 1])
+    if high <= 0:
+        return 0.0
+    return float(high - prices[current]) / high * 100
+
+
+def volatility(times, prices, days, now=None):
+    """
+    Standard deviation of the daily log returns of the price over the last `days` days
+    :param times: Observation times, datetime64 in chronological order
+    :param prices: Prices observed
+    :param now: End of the period, the last observation if None
+    :return: The volatility, 0.0 for a steady price, None with less than two days of history
+    """
+    if not len(times):
+        return None
+
+    now = times[-1] if now is None else np.datetime64(now, 's')
+    _, daily = resample(times, prices, DAY, start=now - days * DAY, end=now)
+    daily = daily[~np.isnan(daily) & (daily > 0)]
+    if len(daily) < 2:
+        return None
+    return float(np.std(np.diff(np.log(daily))))
@@ -0,0 +1,273 @@
+# -*- coding: utf-8 -*-
+"""
+analytics/store.py
+
+Columnar on-disk copy of the price history, for analytics over millions of observations without loading ORM rows.
+
+Every item has two column files, partitioned in folders of 1000 items (PRICE_COLUMNS_DIR/<item_id // 1000>/):
+
+    <item_id>.times   observation times, datetime64[s] (int64 seconds since the epoch, UTC)
+    <item_id>.prices  prices in cents, int32
+
+Both are plain little-endian arrays, appended in chronological order, so they're memory-mapped and read into NumPy
+without copying nor parsing. They're read by the web process, serving the price indicators to the admins
+(views/admin.py): a background thread of every web worker (start_sync) appends the new PriceObservationModel rows
+every PRICE_COLUMNS_SYNC_INTERVAL seconds, the price checks of the clock process never wait for it.
+
+The database holds the price history, the columns are a copy on the local disk of the web dyno. A dyno starts
+with an empty disk: a process without columns, or whose columns missed observations rolled up since, rebuilds them
+from the database (rebuild). The rollups are replayed as their lowest and highest prices, so the rebuilt history keeps
+the range of the prices of an old hour or day, not their order.
+"""
+import datetime
+import fcntl
+import logging
+import os
+import shutil
+import threading
+import time
+
+import numpy as np
+import sqlalchemy
+
+from pricealerts import settings
+from pricealerts.db import db
+from pricealerts.models import price_cents, PriceObservationModel
+
+TIMES_DTYPE = np.dtype('<M8[s]')
+PRICES_DTYPE = np.dtype('<i4')
+EPOCH = datetime.datetime(1970, 1, 1)
+
+
+def history_columns(rows):
+    """
+    Columns of a price history read from the database: an observation is one price, a rollup two, its highest price
+    at the start of its bucket and its lowest one a second later
+    :param rows: PriceObservationModel.history, (time, min price, max price) tuples in chronological order
+    :return: (times, prices in cents) arrays
+    """
+    times, prices = [], []
+    for moment, low, high in rows:
+        times.append(moment)
+        prices.append(price_cents(high))
+        if low != high:
+            times.append(moment + datetime.timedelta(seconds=1))
+            prices.append(price_cents(low))
+    return np.asarray(times, dtype=TIMES_DTYPE), np.asarray(prices, dtype=PRICES_DTYPE)
+
+
+class ColumnarPriceStore(object):
+    """
+    :param root: Folder of the column files
+    :param partition_size: Items per partition folder
+    """
+
+    def __init__(self, root=settings.PRICE_COLUMNS_DIR, partition_size=1000):
+        self.root = root
+        self.partition_size = partition_size
+
+    def _paths(self, item_id):
+        folder = os.path.join(self.root, str(item_id // self.partition_size))
+        return os.path.join(folder, '{}.times'.format(item_id)), os.path.join(folder, '{}.prices'.format(item_id))
+
+    def items(self):
+        """
+        :return: The sorted ids of the items with a price history
+        """
+        item_ids = []
+        if not os.path.isdir(self.root):
+            return item_ids
+        for partition in os.listdir(self.root):
+            folder = os.path.join(self.root, partition)
+            if os.path.isdir(folder):
+                item_ids.extend(int(name[:-len('.times')]) for name in os.listdir(folder) if name.endswith('.times'))
+        return sorted(item_ids)
+
+    def read(self, item_id):
+        """
+        Memory-map the price history of an item, read-only
+        :return: (times, prices) arrays of the same length, empty if the item has no history
+        """
+        times_path, prices_path = self._paths(item_id)
+        if not os.path.exists(times_path) or not os.path.exists(prices_path):
+            return np.empty(0, TIMES_DTYPE), np.empty(0, PRICES_DTYPE)
+
+        # A reader can see one column appended before the other, only the rows in both are returned
+        length = min(os.path.getsize(times_path) // TIMES_DTYPE.itemsize,
+                     os.path.getsize(prices_path) // PRICES_DTYPE.itemsize)
+        if length == 0:
+            return np.empty(0, TIMES_DTYPE), np.empty(0, PRICES_DTYPE)
+        return (np.memmap(times_path, dtype=TIMES_DTYPE, mode='r', shape=(length,)),
+                np.memmap(prices_path, dtype=PRICES_DTYPE, mode='r', shape=(length,)))
+
+    def history(self, item_id, since, until):
+        """
+        Price history of an item over a period: the columns up to the watermark, and the prices recorded since then
+        read from the database. The whole period is read from the database while the columns are being built.
+        :param since: Start of the period
+        :param until: End of the period
+        :return: (times, prices in cents) arrays
+        """
+        watermark = self.watermark()
+        if watermark is None or watermark <= since:
+            return history_columns(PriceObservationModel.history(item_id, since, until))
+
+        times, prices = self.read(item_id)
+        start = np.searchsorted(times, np.datetime64(since, 's'))
+        recent_times, recent_prices = history_columns(PriceObservationModel.history(item_id, watermark, until))
+        return np.concatenate([times[start:], recent_times]), np.concatenate([prices[start:], recent_prices])
+
+    def append(self, item_id, times, prices):
+        """
+        Append observations to the history of an item
+        :param times: Observation times in chronological order, as datetime64 or datetime objects
+        :param prices: Prices in cents
+        """
+        times = np.asarray(times, dtype=TIMES_DTYPE)
+        prices = np.asarray(prices, dtype=PRICES_DTYPE)
+        if len(times) != len(prices):
+            raise ValueError('{} times for {} prices'.format(len(times), len(prices)))
+
+        # The observations already stored are skipped, so an export interrupted before its watermark was written
+        # can be run again
+        stored, _ = self.read(item_id)
+        if len(stored):
+            newer = times > stored[-1]
+            times, prices = times[newer], prices[newer]
+            if not len(times):
+                return
+
+        times_path, prices_path = self._paths(item_id)
+        os.makedirs(os.path.dirname(times_path), exist_ok=True)
+        with open(times_path, 'ab') as f:
+            f.write(times.tobytes())
+        with open(prices_path, 'ab') as f:
+            f.write(prices.tobytes())
+
+    def export(self, rows):
+        """
+        Append observation rows, grouped by item
+        :param rows: Iterable of (item_id, observed, price_cents), sorted by item and time
+        :return: The number of rows appended
+        """
+        count = 0
+        item_id, times, prices = None, [], []
+        for row_item_id, observed, cents in rows:
+            if row_item_id != item_id:
+                if times:
+                    self.append(item_id, times, prices)
+                item_id, times, prices = row_item_id, [], []
+            times.append(observed)
+            prices.append(cents)
+            count += 1
+        if times:
+            self.append(item_id, times, prices)
+        return count
+
+    def _watermark_path(self):
+        return os.path.join(self.root, 'watermark')
+
+    def watermark(self):
+        """
+        :return: Time of the last observation exported, None if nothing was
+        """
+        try:
+            with open(self._watermark_path()) as f:
+                return datetime.datetime.strptime(f.read().strip(), '%Y-%m-%dT%H:%M:%S.%f')
+        except (OSError, ValueError):
+            return None
+
+    def rebuild(self, until):
+        """
+        Replace the columns with the price history in the database, the rollups of the old prices and the
+        observations of the recent ones, read item by item
+        :param until: End of the history copied
+        :return: The number of prices appended
+        """
+        # Without a watermark the columns aren't read until they're complete again
+        if os.path.exists(self._watermark_path()):
+            os.remove(self._watermark_path())
+        for partition in os.listdir(self.root):
+            folder = os.path.join(self.root, partition)
+            if os.path.isdir(folder):
+                shutil.rmtree(folder)
+
+        count = 0
+        for item_id in PriceObservationModel.item_ids():
+            times, prices = history_columns(PriceObservationModel.history(item_id, EPOCH, until))
+            if len(times):
+                self.append(item_id, times, prices)
+                count += len(times)
+        return count
+
+    def sync(self, now=None, lag=settings.CHECKER_CYCLE_DEADLINE + 60, batch=10000):
+        """
+        Append the observations recorded since the last sync, streamed from the database in batches without
+        loading ORM objects. Only the observations older than `lag` seconds are exported: a clock process could
+        still be committing the newer ones. The columns are rebuilt first if they're missing, or if observations they
+        don't have were rolled up since the last sync.
+        :param now: utcnow() if None
+        :return: The number of prices appended
+        """
+        now = now or datetime.datetime.utcnow()
+        try:
+            os.makedirs(self.root, exist_ok=True)
+
+            # Many processes share the columns, one of them syncs at a time
+            with open(os.path.join(self.root, 'lock'), 'w') as lock:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+
+                since = self.watermark()
+                until = now - datetime.timedelta(seconds=lag)
+                rolled_up = now - datetime.timedelta(days=settings.PRICE_RAW_RETENTION)
+                if since is None or since < rolled_up:
+                    count = self.rebuild(until)
+                elif since >= until:
+                    return 0
+                else:
+                    observation = PriceObservationModel
+                    query = db.session.query(observation.item_id, observation.observed, observation.price_cents)\
+                        .filter(observation.observed >= since, observation.observed < until)
+                    count = self.export(query.order_by(observation.item_id, observation.observed).yield_per(batch))
+
+                tmp_path = self._watermark_path() + '.tmp'
+                with open(tmp_path, 'w') as f:
+                    f.write(until.strftime('%Y-%m-%dT%H:%M:%S.%f'))
+                os.replace(tmp_path, self._watermark_path())
+        except (OSError, sqlalchemy.exc.DatabaseError) as ex:
+            # Picked up by the next sync
+            logging.getLogger('root').error('Price history not synced to {}: {}'.format(self.root, str(ex)))
+            return 0
+
+        logging.getLogger('root').info('{} prices appended to {}'.format(count, self.root))
+        return count
+
+
+def start_sync(app, store=None, interval=settings.PRICE_COLUMNS_SYNC_INTERVAL):
+    """
+    Sync the columns with the database every `interval` seconds from a daemon thread, so neither the requests nor
+    the price checks wait for a sync or a rebuild. The workers of a web dyno share the columns: the one syncing holds
+    the lock, the others find them up to date.
+    :param app: The Flask app, the syncs run in its app context
+    :param store: price_store if None
+    :return: The thread started
+    """
+    store = store or price_store
+
+    def run():
+        while True:
+            with app.app_context():
+                try:
+                    store.sync()
+                except Exception:
+                    logging.getLogger('root').exception('Price history not synced to {}'.format(store.root))
+                finally:
+                    db.session.remove()
+            time.sleep(interval)
+
+    thread = threading.Thread(target=run, name='price-store-sync', daemon=True)
+    thread.start()
+    return thread
+
+
+price_store = ColumnarPriceStore()
@@ -0,0 +1,216 @@
+# -*- coding: utf-8 -*-
+"""
+checker/cycle.py
+
+One price-check cycle of the clock process: load the product page of every item with due alerts, update the items
+and notify the users whose price limit was reached. Items whose data didn't change aren't saved: their alerts are
+marked as checked with a single UPDATE at the end of the cycle, and the alerts whose price limit was reached are
+found with a single query.
+
+Only the armed alerts are notified, and marked as fired in the commit queuing their emails in the outbox, one batch
+email per item, sent by the worker process (delivery/worker.py): the users aren't emailed on every cycle while the
+price stays below their limit. The fired alerts are re-armed when the price goes back above their limit, or after
+ALERT_REARM_COOLDOWN seconds (AlertModel.rearm_many).
+
+The prices loaded are appended to the price history (PriceObservationModel) when they changed, or when the last
+observation of the item is older than PRICE_HEARTBEAT seconds, with a single INSERT.
+"""
+import collections
+import datetime
+import logging
+import time
+
+from pricealerts.checker.engine import PriceCheckEngine, url_host
+from pricealerts import settings
+from pricealerts.models import AlertModel, ItemModel, PriceObservationModel, price_cents
+from pricealerts.utils.breaker import breakers, CircuitOpenError
+from pricealerts.utils.extractors import extractor_registry
+from pricealerts.utils.http_cache import validator_cache
+from pricealerts.utils.ratelimit import rate_limiter
+
+
+class CycleStats(object):
+    """
+    Counters of one price-check cycle
+    """
+
+    def __init__(self):
+        self.alerts = 0
+        self.items = 0
+        self.fetches = 0
+        self.skipped = 0
+        self.deferred = 0
+        self.failed = 0
+        self.parses_saved = 0
+        self.writes_saved = 0
+        self.observations = 0
+        self.rearmed = 0
+        self.notified = 0
+        self.duration = 0.0
+
+    def add(self, other):
+        """
+        Add the counters of another batch of the same cycle
+        :param other: CycleStats of the batch
+        """
+        for counter in ('alerts', 'items', 'fetches', 'skipped', 'deferred', 'failed', 'parses_saved', 'writes_saved',
+                        'observations', 'rearmed', 'notified', 'duration'):
+            setattr(self, counter, getattr(self, counter) + getattr(other, counter))
+
+    @property
+    def fetches_saved(self):
+        """Product page loads avoided by checking every item once, whatever the number of alerts on it"""
+        return self.alerts - self.deferred - self.fetches - self.skipped
+
+    def json(self):
+        return {
+            'alerts': self.alerts,
+            'items': self.items,
+            'fetches': self.fetches,
+            'fetches_saved': self.fetches_saved,
+            'skipped': self.skipped,
+            'deferred': self.deferred,
+            'failed': self.failed,
+            'parses_saved': self.parses_saved,
+            'writes_saved': self.writes_saved,
+            'observations': self.observations,
+            'rearmed': self.rearmed,
+            'notified': self.notified,
+            'duration': round(self.duration, 3)
+        }
+
+    def __str__(self):
+        return 'Checked {alerts} alerts on {items} items: {fetches} fetches ({fetches_saved} saved), ' \
+               '{skipped} skipped, {deferred} alerts deferred, {failed} failed, {parses_saved} parses and ' \
+               '{writes_saved} item writes saved, {observations} prices recorded, {rearmed} alerts re-armed, {notified} notified ' \
+               'in {duration}s'.format(**self.json())
+
+
+def group_by_item(alerts):
+    """
+    Group alerts by the item they watch, keeping the order in which every item is first seen.
+    :param alerts: Iterable of AlertModel
+    :return: OrderedDict mapping item_id to the list of its alerts
+    """
+    groups = collections.OrderedDict()
+    for alert in alerts:
+        groups.setdefault(alert.item_id, []).append(alert)
+    return groups
+
+
+def index_triggered(thresholds, item_id, item_alerts, price):
+    """
+    :param thresholds: ThresholdIndex of the price limits
+    :param item_id: The item checked
+    :param item_alerts: Its alerts checked
+    :param price: Its new price
+    :return: The alerts of item_alerts whose price limit was reached
+    """
+    # The alerts were just loaded, so the index is up to date with them even if their notification didn't arrive yet
+    for alert in item_alerts:
+        thresholds.update(alert)
+    triggered_ids = set(thresholds.triggered(item_id, price))
+    return [alert for alert in item_alerts if alert.id in triggered_ids]
+
+
+def check_alerts(alerts, engine=None, thresholds=None, deadline=None):
+    """
+    Check the given alerts, loading every product page only once.
+
+    :param alerts: Alerts needing update, usually AlertModel.find_needing_update()
+    :param engine: PriceCheckEngine used to load the product pages, kept by the caller between the calls. If None, a
+    default one is created and shut down once the pages are loaded.
+    :param thresholds: ThresholdIndex finding the alerts triggered by the new prices in memory. If None, they're found
+    with AlertModel.find_triggered.
+    :param deadline: time.monotonic() after which no more product pages are requested. The alerts of the pages not
+    requested are released (AlertModel.release): they keep their due time and go first in the next cycle.
+    :return: CycleStats of the cycle
+    """
+    start = time.monotonic()
+    stats = CycleStats()
+
+    groups = group_by_item(alerts)
+    stats.alerts = sum(len(item_alerts) for item_alerts in groups.values())
+    stats.items = len(groups)
+
+    # The store rules and limits are read here, the engine workers can't load the stores from the database
+    jobs = []
+    for item_id, item_alerts in groups.items():
+        item = item_alerts[0].item
+        if item.store is not None:
+            rate_limiter.configure(url_host(item.url), item.store.rate_limit, item.store.rate_burst)
+        jobs.append((item_id, item.url, extractor_registry.get(item.store)))
+
+    cache_stats = validator_cache.stats()
+    if engine is not None:
+        results = engine.run(jobs, deadline)
+    else:
+        with PriceCheckEngine(ItemModel.download_item_page, rate_limiter=rate_limiter, breakers=breakers) as engine:
+            results = engine.run(jobs, deadline)
+    # Pages answered 304 Not Modified or with the same fingerprint as the last check weren't parsed
+    stats.parses_saved = sum(validator_cache.stats()[counter] - cache_stats[counter]
+                             for counter in ('not_modified', 'unchanged'))
+
+    deferred = [alert.id for item_id in [item_id for item_id in groups if item_id not in results]
+                for alert in groups.pop(item_id)]
+    stats.deferred = len(deferred)
+
+    now = datetime.datetime.utcnow()
+    heartbeat = datetime.timedelta(seconds=settings.PRICE_HEARTBEAT)
+    last_observed = PriceObservationModel.last_observed(
+        [item_id for item_id, result in results.items() if result.data is not None])
+    observations = []  # (item_id, price) appended to the price history
+
+    # The commits below expire the alerts: their ids and limits are read before
+    alert_ids = [alert.id for item_alerts in groups.values() for alert in item_alerts]
+    triggered_ids = None
+    if thresholds is not None:
+        triggered_ids = []
+        for item_id, item_alerts in groups.items():
+            data = results[item_id].data
+            price = data[1] if data is not None else item_alerts[0].item.price
+            triggered_ids.extend(alert.id for alert in index_triggered(thresholds, item_id, item_alerts, price))
+
+    unchanged = []  # alerts of the items with nothing to save
+    for item_id, item_alerts in groups.items():
+        result = results[item_id]
+        if isinstance(result.error, CircuitOpenError):
+            # Not requested, its store or url is failing
+            stats.skipped += 1
+        else:
+            stats.fetches += 1
+            if not result.ok:
+                stats.failed += 1
+
+        item = item_alerts[0].item
+        if result.data is not None and result.data[1] is not None:
+            last = last_observed.get(item_id)
+            if price_cents(item.price) != price_cents(result.data[1]) or last is None or now - last >= heartbeat:
+                observations.append((item_id, result.data[1]))
+
+        if result.data is None or item.has_data(result.data):
+            stats.writes_saved += 1
+            unchanged.extend(item_alerts)
+        else:
+            item.load_price_change(item_alerts, result.data)
+
+    AlertModel.mark_checked_many(unchanged)
+    PriceObservationModel.record_many(observations, now)
+    stats.observations = len(observations)
+
+    stats.rearmed = AlertModel.rearm_many(alert_ids, now)
+
+    if triggered_ids is None:
+        # The price limits of all the alerts are compared in a single query, only the armed alerts triggered are
+        # loaded with their user to be notified
+        triggered = AlertModel.find_triggered(alert_ids, armed_only=True)
+    else:
+        # Loaded after the commits in a single query, with the states just re-armed and their item and user
+        triggered = AlertModel.find_armed(triggered_ids)
+
+    stats.notified = AlertModel.fire_many(triggered, now)
+    AlertModel.release(deferred)
+
+    stats.duration = time.monotonic() - start
+    logging.getLogger('root').info(str(stats))
+    return stats
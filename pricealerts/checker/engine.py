@@ -0,0 +1,313 @@
+# -*- coding: utf-8 -*-
+"""
+checker/engine.py
+
+Concurrent price-check engine used by the clock process (alert_automation.py).
+
+Product pages are checked in two stages. They are downloaded by a pool of worker threads, bounded by a global
+concurrency limit and by a per-host limit, so one slow store can't hold up the whole cycle. The downloaded pages
+(ItemPage) are then parsed by a pool of processes sized to the cores, since the parsing holds the GIL and wouldn't
+scale with threads. When CHECKER_PARSE_QUEUE pages are waiting to be parsed, no more pages are downloaded until the
+parsers catch up, so a slow parse stage doesn't pile up downloaded pages in memory.
+
+Database work is never done inside the workers: the engine only returns the parsed (name, price, image) tuples, and
+the caller applies them to the models in its own thread.
+
+The worker threads and the parse processes are started with the first run and kept until shutdown(), so the clock
+process doesn't start a pool of processes for every batch of alerts, and the parse processes keep their compiled
+XPath between the batches. The parse processes are forked before any page is downloaded: a process forked while
+another thread holds a lock (i.e. of a logging handler) would find it locked for good. If one of them dies, the
+pages left are parsed by the download threads, and the next run starts new processes before its downloads.
+"""
+import collections
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, wait, FIRST_COMPLETED
+from concurrent.futures.process import BrokenProcessPool
+from urllib.parse import urlparse
+
+from pricealerts import settings
+from pricealerts.utils.breaker import CircuitOpenError
+from pricealerts.utils.parsers import ItemPage, parse_item_page
+
+
+class CheckResult(collections.namedtuple('CheckResult', ['key', 'url', 'data', 'error', 'elapsed'])):
+    """
+    Outcome of checking one product page.
+
+    :param key: The caller's key for the page (i.e. the alert id)
+    :param url: The product page url
+    :param data: The (name, price, image) tuple loaded from the page, None if the page could not be loaded
+    :param error: The exception raised while loading the page, None if it was loaded correctly
+    :param elapsed: Seconds spent loading the page
+    """
+
+    @property
+    def ok(self):
+        return self.error is None
+
+
+def url_host(url):
+    """
+    Return the host part of a url, used to group product pages by store.
+    :param url: A product page url
+    :return: The network location of the url, i.e. www.johnlewis.com
+    """
+    o = urlparse(url)
+    return o.netloc if o.netloc else o.path.split('/')[0]
+
+
+class PriceCheckEngine(object):
+    """
+    Fetch many product pages concurrently.
+
+    At most `max_workers` pages are in flight at any time and at most `per_host_limit` of them belong to the same
+    host. With a rate limiter, a page is also only requested when its host has a token available. Pages waiting for
+    a busy or rate limited host don't take a worker: the hosts are served in turn, so the other stores keep being
+    checked meanwhile. With circuit breakers, the pages of failing stores and urls are skipped without being
+    requested, and the pages still queued for a store are skipped as soon as its circuit opens.
+    """
+
+    def __init__(self, fetch, max_workers=None, per_host_limit=None, rate_limiter=None, breakers=None,
+                 parse_workers=None, parse_queue=None):
+        """
+        :param fetch: Callable receiving a product url, followed by the extra arguments of its job, and returning a
+        (name, price, image) tuple or an ItemPage to parse. It's called from worker threads, so it must not touch the
+        database session.
+        :param max_workers: Global concurrency limit, defaults to the CHECKER_MAX_WORKERS setting
+        :param per_host_limit: Concurrency limit per host, defaults to the CHECKER_PER_HOST_LIMIT setting
+        :param rate_limiter: HostRateLimiter spacing out the requests to every host, None to send them as soon as
+        a worker is free
+        :param breakers: BreakerRegistry skipping the pages of failing stores and urls, None to request every page
+        :param parse_workers: Processes parsing the pages, defaults to the CHECKER_PARSE_WORKERS setting. With 0 the
+        pages are parsed by the threads which downloaded them.
+        :param parse_queue: Pages waiting to be parsed that stop the downloads, defaults to the CHECKER_PARSE_QUEUE
+        setting
+        """
+        self.fetch = fetch
+        self.rate_limiter = rate_limiter
+        self.breakers = breakers
+        self.max_workers = max(1, int(max_workers or settings.CHECKER_MAX_WORKERS))
+        self.per_host_limit = max(1, int(per_host_limit or settings.CHECKER_PER_HOST_LIMIT))
+        self.parse_workers = max(0, int(settings.CHECKER_PARSE_WORKERS if parse_workers is None else parse_workers))
+        self.parse_queue = max(1, int(parse_queue or settings.CHECKER_PARSE_QUEUE))
+        self.executor = None  # ThreadPoolExecutor downloading the pages
+        self.parser = None  # ProcessPoolExecutor parsing them, started by run before the downloads
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.shutdown()
+
+    def shutdown(self):
+        """
+        Stop the worker threads and the parse processes, a later run starts new ones
+        """
+        executor, parser, self.executor, self.parser = self.executor, self.parser, None, None
+        if executor is not None:
+            executor.shutdown()
+        if parser is not None:
+            parser.shutdown()
+
+    def _start_parser(self):
+        """
+        Start the parse processes, if they aren't running. Called while no download is in flight.
+        """
+        if not self.parse_workers:
+            return
+        if self.parser is not None:
+            # A pool whose process died in the last run, without a page submitted since
+            if not getattr(self.parser, '_broken', False):
+                return
+            self.parser.shutdown(wait=False)
+        parser = ProcessPoolExecutor(max_workers=self.parse_workers)
+        # The processes are only forked when tasks are submitted
+        wait([parser.submit(os.getpid) for _ in range(self.parse_workers)])
+        self.parser = parser
+
+    def _parse(self, page):
+        """
+        Queue a downloaded page in the parse processes
+        :return: The Future of parse_item_page for the page
+        :raise BrokenProcessPool: If a parse process died, the next run starts new ones
+        """
+        if self.parser is None:
+            # Not forked while the downloads are in flight
+            raise BrokenProcessPool('Parse processes stopped')
+        try:
+            return self.parser.submit(parse_item_page, *page.parse_args())
+        except BrokenProcessPool:
+            parser, self.parser = self.parser, None
+            parser.shutdown(wait=False)
+            raise
+
+    def _load(self, key, url, args):
+        start = time.monotonic()
+        try:
+            data = self.fetch(url, *args)
+            if isinstance(data, ItemPage) and not self.parse_workers:
+                data = data.parse()
+        except Exception as ex:
+            return CheckResult(key, url, None, ex, time.monotonic() - start)
+        return CheckResult(key, url, data, None, time.monotonic() - start)
+
+    def run(self, jobs, deadline=None):
+        """
+        Check every product page and return the results once all of them have finished.
+
+        :param jobs: Iterable of (key, url, *args) tuples, args are passed to fetch after the url
+        :param deadline: time.monotonic() after which no more pages are requested, the pages in flight are finished.
+        None to request all of them.
+        :return: A dict mapping every key to its CheckResult, the keys of the pages not requested before the deadline
+        are left out
+        """
+        results = {}
+        pending = collections.OrderedDict()  # host -> deque of (key, url, args) waiting for a slot
+        for key, url, *args in jobs:
+            if self.breakers is not None:
+                try:
+                    self.breakers.allow(url)
+                except CircuitOpenError as ex:
+                    results[key] = CheckResult(key, url, None, ex, 0.0)
+                    continue
+            pending.setdefault(url_host(url), collections.deque()).append((key, url, args))
+
+        limiter = self.rate_limiter
+        if limiter is not None:
+            limiter.prepare([queue[0][1] for queue in pending.values()])
+            for host, queue in pending.items():
+                limiter.set_queue_depth(host, len(queue))
+
+        in_flight = {}  # future -> host
+        busy = collections.Counter()  # host -> pages in flight
+        parsing = {}  # future -> (CheckResult of the download, host, time the page was queued for parsing)
+        started = time.monotonic()
+
+        self._start_parser()
+        if self.executor is None:
+            self.executor = ThreadPoolExecutor(max_workers=self.max_workers)
+        executor = self.executor
+
+        while pending or in_flight or parsing:
+            if pending and deadline is not None and time.monotonic() >= deadline:
+                logging.getLogger('root').warning('Deadline passed, {} product pages not requested'.format(
+                    sum(len(queue) for queue in pending.values())))
+                for host, queue in pending.items():
+                    if limiter is not None:
+                        limiter.set_queue_depth(host, 0)
+                    if self.breakers is not None:
+                        # A probe of a half-open store left out would block it for good
+                        for key, url, args in queue:
+                            self.breakers.release(url)
+                pending.clear()
+                continue
+
+            # Fill the free workers, taking one page from every host with free slots and tokens in turn.
+            # No page is downloaded while the parse queue is full.
+            next_token = None  # seconds until a rate limited host gets a token
+            submitted = True
+            while submitted and len(in_flight) < self.max_workers and len(parsing) < self.parse_queue:
+                submitted = False
+                for host in list(pending):
+                    if len(in_flight) >= self.max_workers:
+                        break
+                    if busy[host] >= self.per_host_limit:
+                        continue
+
+                    if limiter is not None:
+                        delay = limiter.reserve(host)
+                        if delay > 0:
+                            next_token = delay if next_token is None else min(next_token, delay)
+                            continue
+
+                    key, url, args = pending[host].popleft()
+                    if not pending[host]:
+                        del pending[host]
+
+                    if limiter is not None:
+                        limiter.record_wait(host, time.monotonic() - started)
+                        limiter.set_queue_depth(host, len(pending.get(host, ())))
+
+                    in_flight[executor.submit(self._load, key, url, args)] = host
+                    busy[host] += 1
+                    submitted = True
+
+            if deadline is not None and next_token is not None:
+                next_token = max(0.0, min(next_token, deadline - time.monotonic()))
+
+            if not in_flight and not parsing:
+                # Every pending host is waiting for a token
+                time.sleep(next_token)
+                continue
+
+            done, _ = wait(list(in_flight) + list(parsing), timeout=next_token, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future in in_flight:
+                    host = in_flight.pop(future)
+                    busy[host] -= 1
+                    result = future.result()
+                    if result.ok and isinstance(result.data, ItemPage):
+                        queued = time.monotonic()
+                        try:
+                            parsing[self._parse(result.data)] = (result, host, queued)
+                            continue
+                        except BrokenProcessPool:
+                            logging.getLogger('root').error(
+                                'Parse processes stopped, {} parsed by the clock process'.format(result.url))
+                            result = self._parsed(result, None, queued)
+                else:
+                    downloaded, host, queued = parsing.pop(future)
+                    result = self._parsed(downloaded, future, queued)
+
+                if not result.ok:
+                    logging.getLogger('root').warning('Product page {} not loaded: {}'.format(
+                        result.url, getattr(result.error, 'message', result.error)))
+                results[result.key] = result
+
+                if self.breakers is not None:
+                    self._record(result, host, pending, results)
+
+        return results
+
+    @staticmethod
+    def _parsed(downloaded, future, queued):
+        """
+        CheckResult of a downloaded page once parsed
+        :param downloaded: CheckResult of the download, its data is the ItemPage
+        :param future: Future of parse_item_page for the page, None to parse it in the current thread
+        :param queued: Time the page was queued for parsing
+        """
+        page = downloaded.data
+        try:
+            if future is None:
+                data = page.parse()
+            else:
+                try:
+                    data = page.parsed(future.result())
+                except BrokenProcessPool:
+                    # Its parse process died, it isn't the page's fault
+                    data = page.parse()
+        except Exception as ex:
+            return downloaded._replace(data=None, error=ex, elapsed=downloaded.elapsed + time.monotonic() - queued)
+        return downloaded._replace(data=data, elapsed=downloaded.elapsed + time.monotonic() - queued)
+
+    def _record(self, result, host, pending, results):
+        """
+        Record the outcome of a page in the circuit breakers, skipping the pages still queued for its host if its
+        circuit opened
+        """
+        if result.ok:
+            self.breakers.record_success(result.url)
+            return
+
+        self.breakers.record_failure(result.url, result.error)
+        if host in pending and self.breakers.is_open(result.url):
+            skipped = pending.pop(host)
+            logging.getLogger('root').warning('Store {} failing, {} product pages skipped'.format(host, len(skipped)))
+            error = CircuitOpenError('Store {} failing, its circuit is open'.format(host))
+            for key, url, args in skipped:
+                results[key] = CheckResult(key, url, None, error, 0.0)
+            if self.rate_limiter is not None:
+                self.rate_limiter.set_queue_depth(host, 0)
@@ -0,0 +1,333 @@
+# -*- coding: utf-8 -*-
+"""
+checker/scheduler.py
+
+Due-time scheduler of the clock process (alert_automation.py).
+
+The due time of every item, the earliest next_check of its active alerts, is loaded once at startup in a min-heap of
+(next_due, item_id). The scheduler sleeps until the earliest item is due, pops the items due in order and only reads
+their due alerts from the database, instead of scanning the whole alerts table on every tick.
+
+The web process publishes the item of every alert it creates, edits, deactivates or deletes on the
+SCHEDULER_CHANNEL Postgres channel (NOTIFY, see AlertModel.notify_schedule). The scheduler LISTENs on it, waking up
+to re-read the due time of those items only. The whole heap is reloaded every SCHEDULER_RESYNC seconds anyway, which
+catches the changes missed while disconnected and the databases without LISTEN/NOTIFY.
+
+Many clock processes can run the scheduler side by side: every one of them wakes up for the same items, but the due
+alerts are claimed with a lease (AlertModel.claim_due) before being checked, so every alert is checked by one process.
+
+Every cycle has a budget: at most CHECKER_CYCLE_MAX_ITEMS items, checked for at most CHECKER_CYCLE_DEADLINE seconds.
+The work left over stays queued at its due time, so it's checked first by the next cycle, which starts as soon as the
+current one ends. Cycles never overlap, however long they take: an overrun only delays the items waiting, all of them
+checked together by the next cycle, and under load the alerts get slightly stale instead of piling up.
+"""
+import datetime
+import heapq
+import logging
+import select
+import time
+
+from pricealerts import settings
+from pricealerts.db import db
+from pricealerts.models import AlertModel
+
+
+class DueQueue(object):
+    """
+    Min-heap of (due, item_id), one live entry per item.
+
+    Moving or removing an item doesn't search the heap: its due time is updated in `due` and the old entry is left
+    behind, skipped when it reaches the top. The heap is rebuilt when the stale entries outnumber the live ones.
+    """
+
+    def __init__(self):
+        self.heap = []
+        self.due = {}
+
+    def __len__(self):
+        return len(self.due)
+
+    def __contains__(self, item_id):
+        return item_id in self.due
+
+    def replace(self, due_times):
+        """
+        :param due_times: dict mapping item_id to its due time, replacing all the items queued
+        """
+        self.due = dict(due_times)
+        self.heap = [(due, item_id) for item_id, due in self.due.items()]
+        heapq.heapify(self.heap)
+
+    def push(self, item_id, due):
+        """
+        Queue an item, or move it if it's already queued
+        """
+        if self.due.get(item_id) == due:
+            return
+        self.due[item_id] = due
+        heapq.heappush(self.heap, (due, item_id))
+        if len(self.heap) > 2 * len(self.due) + 64:
+            self.replace(self.due)
+
+    def remove(self, item_id):
+        self.due.pop(item_id, None)
+
+    def next_due(self):
+        """
+        :return: The due time of the earliest item, None if the queue is empty
+        """
+        while self.heap and self.due.get(self.heap[0][1]) != self.heap[0][0]:
+            heapq.heappop(self.heap)
+        return self.heap[0][0] if self.heap else None
+
+    def pop_due(self, now, limit=None):
+        """
+        :param now: Current time, a naive UTC datetime like AlertModel.next_check
+        :param limit: Maximum number of items popped, all the items due if None
+        :return: The ids of the items due at `now`, earliest first. They're no longer queued.
+        """
+        items = []
+        while (limit is None or len(items) < limit) and self.next_due() is not None and self.heap[0][0] <= now:
+            due, item_id = heapq.heappop(self.heap)
+            del self.due[item_id]
+            items.append(item_id)
+        return items
+
+    def count_due(self, now):
+        """
+        :return: The number of items due at `now`
+        """
+        return sum(1 for due in self.due.values() if due <= now)
+
+
+class ScheduleListener(object):
+    """
+    LISTEN on a Postgres channel for the ids of the items whose due time changed
+    """
+
+    def __init__(self, engine, channel=settings.SCHEDULER_CHANNEL):
+        self.engine = engine
+        self.channel = channel
+        self.connection = None
+
+    @staticmethod
+    def available(engine):
+        return engine.dialect.name == 'postgresql'
+
+    def connect(self):
+        # A dedicated connection in autocommit mode: the notifications are only delivered outside of transactions
+        self.connection = self.engine.raw_connection()
+        self.connection.connection.autocommit = True
+        cursor = self.connection.cursor()
+        cursor.execute('LISTEN "{}"'.format(self.channel))
+        cursor.close()
+
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+    def wait(self, timeout):
+        """
+        Wait for notifications
+        :param timeout: Seconds to wait at most
+        :return: The set of item ids notified, empty on timeout
+        """
+        if self.connection is None:
+            self.connect()
+
+        conn = self.connection.connection
+        if not conn.notifies and select.select([conn], [], [], timeout) == ([], [], []):
+            return set()
+
+        conn.poll()
+        item_ids = set()
+        while conn.notifies:
+            notify = conn.notifies.pop(0)
+            try:
+                item_ids.add(int(notify.payload))
+            except ValueError:
+                logging.getLogger('root').warning('Unexpected schedule notification: {!r}'.format(notify.payload))
+        return item_ids
+
+
+class AlertScheduler(object):
+    """
+    Run `check` on the items whose alerts are due, in due order, sleeping in between.
+
+    :param check: Callable receiving the ids of the due items and the time.monotonic() deadline of the cycle. It
+    checks their due alerts, and returns False if it ran out of time before checking all of them.
+    :param listener: ScheduleListener notified of the alerts changed by the web process, None to only pick the
+    changes up on the periodic reloads
+    :param resync: Seconds between two reloads of the whole queue
+    :param min_delay: Seconds before an item is checked again, even if its alerts are still due (i.e. they could
+    not be marked as checked)
+    :param max_items: Maximum number of items checked by a cycle
+    :param deadline: Seconds a cycle can take
+    :param report: Callable run after every cycle, i.e. to save the metrics
+    :param watchers: Other in-memory indexes of the alerts (i.e. ThresholdIndex), synced and refreshed with the
+    queue
+    """
+
+    def __init__(self, check, listener=None, resync=settings.SCHEDULER_RESYNC,
+                 min_delay=int(settings.ALERT_CHECK_INTERVAL), max_items=settings.CHECKER_CYCLE_MAX_ITEMS,
+                 deadline=settings.CHECKER_CYCLE_DEADLINE, report=None, watchers=None, clock=datetime.datetime.utcnow):
+        self.check = check
+        self.listener = listener
+        self.resync = resync
+        self.min_delay = datetime.timedelta(seconds=min_delay)
+        self.max_items = max_items
+        self.deadline = deadline
+        self.report = report
+        self.watchers = watchers or []
+        self.clock = clock
+        self.queue = DueQueue()
+        self.synced = None
+        self.cycles = 0
+        self.overruns = 0
+        self.cycle_duration = 0.0
+        self.backlog = 0
+        self.failures = 0
+
+    def sync(self):
+        """
+        Reload the due time of every item
+        """
+        self.queue.replace(AlertModel.due_times())
+        for watcher in self.watchers:
+            watcher.sync()
+        self.synced = time.monotonic()
+
+    def refresh(self, item_ids, not_before=None):
+        """
+        Re-read the due time of some items
+        :param item_ids: The items, the ones without active alerts left are removed from the queue
+        :param not_before: Earliest due time given to the items
+        """
+        if not item_ids:
+            return
+
+        due_times = AlertModel.due_times(item_ids)
+        for item_id in item_ids:
+            due = due_times.get(item_id)
+            if due is None:
+                self.queue.remove(item_id)
+            else:
+                self.queue.push(item_id, max(due, not_before) if not_before else due)
+
+    def timeout(self):
+        """
+        :return: Seconds to sleep until the earliest item is due or the next reload
+        """
+        if self.synced is None:
+            # The last reload failed, it's tried again after min_delay
+            return self.min_delay.total_seconds()
+
+        timeout = max(0.0, self.resync - (time.monotonic() - self.synced))
+        next_due = self.queue.next_due()
+        if next_due is not None:
+            timeout = min(timeout, max(0.0, (next_due - self.clock()).total_seconds()))
+        return timeout
+
+    def wait(self):
+        """
+        Sleep until the earliest item is due, the next reload or a change of the alerts, applying the changes
+        """
+        # No transaction is left open while sleeping
+        db.session.remove()
+
+        timeout = self.timeout()
+        if self.listener is None:
+            time.sleep(timeout)
+            return
+
+        try:
+            item_ids = self.listener.wait(timeout)
+            self.refresh(item_ids)
+            for watcher in self.watchers:
+                watcher.refresh(item_ids)
+        except Exception as ex:
+            # The changes missed are picked up on the next reload
+            logging.getLogger('root').error('Schedule listener failed: {}'.format(ex))
+            self.listener.close()
+            self.reset_session()
+            time.sleep(timeout)
+
+    @staticmethod
+    def reset_session():
+        """
+        Drop the transaction left failed by an error, so the next queries get a new one
+        """
+        try:
+            db.session.rollback()
+        finally:
+            db.session.remove()
+
+    def run_pending(self):
+        """
+        Check the items due now
+        :return: The ids of the items checked
+        """
+        if self.synced is None or time.monotonic() - self.synced >= self.resync:
+            self.sync()
+
+        now = self.clock()
+        item_ids = self.queue.pop_due(now, self.max_items)
+        if not item_ids:
+            return item_ids
+
+        start = time.monotonic()
+        finished = True
+        try:
+            finished = self.check(item_ids, start + self.deadline) is not False
+        finally:
+            # The alerts left unchecked when the time ran out keep their due time, they go first in the next cycle
+            self.refresh(item_ids, not_before=now + self.min_delay if finished else None)
+            self.cycles += 1
+            self.cycle_duration = time.monotonic() - start
+            self.backlog = self.queue.count_due(self.clock())
+            if self.backlog:
+                self.overruns += 1
+                logging.getLogger('root').warning('{} items due left for the next cycle, checked {} items in {:.1f}s'
+                                                  .format(self.backlog, len(item_ids), self.cycle_duration))
+
+        if self.report is not None:
+            try:
+                self.report()
+            except Exception:
+                logging.getLogger('root').exception('Price-check cycle report failed')
+                self.reset_session()
+        return item_ids
+
+    def run_cycle(self):
+        """
+        run_pending, surviving its errors: a database or store failing for a while must not stop the clock process.
+        After a failure the queue is reloaded, the items popped by the failed cycle are due again.
+        :return: The ids of the items checked, None if the cycle failed
+        """
+        try:
+            return self.run_pending()
+        except Exception:
+            self.failures += 1
+            logging.getLogger('root').exception('Price-check cycle failed')
+            self.reset_session()
+            self.synced = None
+            return None
+
+    def stats(self):
+        next_due = self.queue.next_due()
+        return {
+            'items': len(self.queue),
+            'next_due': next_due.isoformat() if next_due is not None else None,
+            'listening': self.listener is not None,
+            'cycles': self.cycles,
+            'overruns': self.overruns,
+            'cycle_duration': round(self.cycle_duration, 3),
+            'backlog': self.backlog,
+            'failures': self.failures
+        }
+
+    def run(self):
+        while True:
+            self.run_cycle()
+            self.wait()
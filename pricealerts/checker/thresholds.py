@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+"""
+checker/thresholds.py
+
+In-memory index of the price limits of the active alerts, used by the clock process to find the alerts triggered by
+a new price without scanning the alerts of the item.
+
+Every item holds the limits of its alerts in a sorted list: the alerts triggered by a price are the ones whose limit
+is above it, found with a bisect in O(log n + triggered). The index is loaded once and kept up to date like the
+scheduler's queue (checker/scheduler.py): the items of the alerts changed by the web process are re-read when their
+notification arrives, and everything is reloaded every SCHEDULER_RESYNC seconds.
+"""
+import bisect
+
+from pricealerts.models import AlertModel
+
+
+class ThresholdIndex(object):
+    def __init__(self):
+        self.limits = {}  # item_id -> sorted price limits of its active alerts
+        self.alert_ids = {}  # item_id -> alert ids, in the order of the limits
+        self.alerts = {}  # alert_id -> (item_id, price_limit)
+
+    def __len__(self):
+        return len(self.alerts)
+
+    def upsert(self, alert_id, item_id, price_limit):
+        """
+        Add an alert, or move it if its item or limit changed
+        """
+        if self.alerts.get(alert_id) == (item_id, price_limit):
+            return
+        self.remove(alert_id)
+
+        limits = self.limits.setdefault(item_id, [])
+        alert_ids = self.alert_ids.setdefault(item_id, [])
+        position = bisect.bisect_right(limits, price_limit)
+        limits.insert(position, price_limit)
+        alert_ids.insert(position, alert_id)
+        self.alerts[alert_id] = (item_id, price_limit)
+
+    def remove(self, alert_id):
+        entry = self.alerts.pop(alert_id, None)
+        if entry is None:
+            return
+
+        item_id, price_limit = entry
+        limits, alert_ids = self.limits[item_id], self.alert_ids[item_id]
+        # The alerts with the same limit are next to each other
+        position = bisect.bisect_left(limits, price_limit)
+        position = alert_ids.index(alert_id, position)
+        del limits[position]
+        del alert_ids[position]
+        if not limits:
+            del self.limits[item_id]
+            del self.alert_ids[item_id]
+
+    def update(self, alert):
+        """
+        Apply the current state of an alert loaded from the database
+        """
+        if alert.active:
+            self.upsert(alert.id, alert.item_id, alert.price_limit)
+        else:
+            self.remove(alert.id)
+
+    def replace(self, rows):
+        """
+        :param rows: (alert_id, item_id, price_limit) of every active alert, replacing the whole index
+        """
+        self.limits, self.alert_ids, self.alerts = {}, {}, {}
+        for row in sorted(rows, key=lambda row: (row[1], row[2])):
+            alert_id, item_id, price_limit = row
+            self.limits.setdefault(item_id, []).append(price_limit)
+            self.alert_ids.setdefault(item_id, []).append(alert_id)
+            self.alerts[alert_id] = (item_id, price_limit)
+
+    def sync(self):
+        """
+        Reload the limits of all the active alerts
+        """
+        self.replace(AlertModel.thresholds())
+
+    def refresh(self, item_ids):
+        """
+        Re-read the limits of the alerts of some items, i.e. the ones changed by the web process
+        """
+        if not item_ids:
+            return
+
+        for item_id in item_ids:
+            for alert_id in list(self.alert_ids.get(item_id, ())):
+                self.remove(alert_id)
+        for alert_id, item_id, price_limit in AlertModel.thresholds(item_ids):
+            self.upsert(alert_id, item_id, price_limit)
+
+    def triggered(self, item_id, price):
+        """
+        :param item_id: The item whose price is known
+        :param price: Its price
+        :return: The ids of the active alerts of the item whose price limit is above the price
+        """
+        limits = self.limits.get(item_id)
+        if not limits or price is None:
+            return []
+        return self.alert_ids[item_id][bisect.bisect_right(limits, price):]
+
+    def stats(self):
+        return {
+            'items': len(self.limits),
+            'alerts': len(self.alerts)
+        }
+
+
+threshold_index = ThresholdIndex()
@@ -0,0 +1,11 @@
+# -*- coding: utf-8 -*-
+
+
+class ItemNotLoadedError(Exception):
+    """
+    Indicates that the data of an item could not be loaded from its product page
+    """
+
+    def __init__(self, message, status_code=None):
+        self.message = message
+        self.status_code = status_code
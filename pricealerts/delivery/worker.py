@@ -0,0 +1,204 @@
+# -*- coding: utf-8 -*-
+"""
+delivery/worker.py
+
+Delivery worker of the notification outbox (OutboxMessageModel), run by the worker process (delivery_worker.py).
+
+The worker claims batches of due messages and sends them with a pool of threads, so one slow Mailgun, SMTP or Twilio
+call doesn't hold up the others. As in the price-check engine (checker/engine.py), the threads never touch the
+database: the messages are read and their outcome recorded by the worker's own thread, with a single commit per batch.
+
+The delivery is at-least-once: a message sent by a worker dying before recording it is sent again once its lease
+expires.
+"""
+import collections
+import datetime
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from pricealerts import settings
+from pricealerts.db import db
+from pricealerts.models import OutboxMessageModel
+from pricealerts.utils.notifications import NotificationDispatcher
+
+
+class DeliveryError(Exception):
+    """
+    :param kwargs: Keyword arguments of the next attempt if the message was partly sent, None to send it all again
+    """
+
+    def __init__(self, message, kwargs=None):
+        self.message = message
+        self.kwargs = kwargs
+
+    def __str__(self):
+        return self.message
+
+
+def deliver(channel, kwargs):
+    """
+    Send a message with the NotificationDispatcher
+    :param channel: OutboxMessageModel.EMAIL, BATCH or SMS
+    :param kwargs: Keyword arguments of the NotificationDispatcher method sending the channel
+    :raise DeliveryError: If the message wasn't sent
+    """
+    if channel == OutboxMessageModel.BATCH:
+        failed = NotificationDispatcher.send_batch_email(**kwargs)
+        if failed:
+            # Only the recipients left are retried
+            recipients = kwargs['recipients']
+            raise DeliveryError('The batch was not sent to {} of {} recipients'.format(len(failed), len(recipients)),
+                                dict(kwargs, recipients={address: recipients[address] for address in failed}))
+        return
+
+    senders = {OutboxMessageModel.EMAIL: NotificationDispatcher.send_email,
+               OutboxMessageModel.SMS: NotificationDispatcher.send_sms}
+    if channel not in senders:
+        raise DeliveryError('Unknown channel {}'.format(channel))
+    if not senders[channel](**kwargs):
+        raise DeliveryError('The {} was not sent'.format(channel))
+
+
+class DeliveryWorker(object):
+    """
+    :param send: Callable sending a message, receiving its channel and keyword arguments and raising an exception if
+    it failed. It's called from the pool threads, so it must not touch the database session.
+    :param max_workers: Messages sent at once
+    :param batch: Messages claimed at once
+    :param poll_interval: Seconds waited while the outbox is empty
+    :param retention: Days the messages sent are kept
+    :param report_interval: Seconds between two reports of run, i.e. metrics snapshots
+    """
+
+    def __init__(self, send=deliver, max_workers=settings.DELIVERY_WORKERS, batch=settings.DELIVERY_BATCH,
+                 poll_interval=settings.DELIVERY_POLL_INTERVAL, retention=settings.DELIVERY_RETENTION,
+                 report_interval=settings.DELIVERY_REPORT_INTERVAL):
+        self.send = send
+        self.pool = ThreadPoolExecutor(max_workers=max_workers)
+        self.batch = batch
+        self.poll_interval = poll_interval
+        self.retention = retention
+        self.report_interval = report_interval
+        self.purged = None
+        self.reported = None
+
+        self.sent = 0
+        self.retried = 0
+        self.dead = 0
+        self.failures = 0
+        # Seconds between the commit queuing a message and its delivery, of the last messages sent
+        self.latencies = collections.deque(maxlen=1000)
+
+    def _send(self, channel, kwargs):
+        """
+        :return: None if the message was sent, the error otherwise
+        """
+        try:
+            self.send(channel, kwargs)
+        except Exception as ex:
+            return ex
+        return None
+
+    def run_once(self, now=None):
+        """
+        Send a batch of due messages
+        :param now: utcnow() if None
+        :return: The number of messages claimed
+        """
+        messages = OutboxMessageModel.claim(self.batch, now)
+        if not messages:
+            return 0
+
+        errors = list(self.pool.map(lambda job: self._send(*job),
+                                    [(message.channel, message.kwargs()) for message in messages]))
+
+        now = now or datetime.datetime.utcnow()
+        for message, error in zip(messages, errors):
+            if error is None:
+                message.delivered(now)
+                self.sent += 1
+                self.latencies.append((now - message.created).total_seconds())
+                continue
+
+            message.failed(error, now, kwargs=getattr(error, 'kwargs', None))
+            if message.status == OutboxMessageModel.DEAD:
+                self.dead += 1
+                logging.getLogger('root').error('Outbox message {} dead-lettered after {} attempts: {}'
+                                                .format(message.idempotency_key, message.attempts, error))
+            else:
+                self.retried += 1
+                logging.getLogger('root').warning('Outbox message {} not sent, retried at {}: {}'
+                                                  .format(message.idempotency_key, message.next_attempt, error))
+
+        try:
+            db.session.commit()
+        except Exception as ex:
+            # The messages are claimed again once their lease expires
+            db.session.rollback()
+            logging.getLogger('root').error('Outcome of {} outbox messages not saved: {}'.format(len(messages), ex))
+        return len(messages)
+
+    def purge(self):
+        if self.purged is not None and time.monotonic() - self.purged < 60 * 60:
+            return
+        OutboxMessageModel.purge(datetime.datetime.utcnow() - datetime.timedelta(days=self.retention))
+        self.purged = time.monotonic()
+
+    def stats(self):
+        latencies = sorted(self.latencies)
+        return {
+            'sent': self.sent,
+            'retried': self.retried,
+            'dead': self.dead,
+            'failures': self.failures,
+            'latency_p50': round(latencies[len(latencies) // 2], 3) if latencies else None,
+            'latency_p95': round(latencies[int(len(latencies) * 0.95)], 3) if latencies else None,
+            'latency_max': round(latencies[-1], 3) if latencies else None
+        }
+
+    @staticmethod
+    def reset_session():
+        """
+        Drop the transaction left failed by an error, so the next queries get a new one
+        """
+        try:
+            db.session.rollback()
+        finally:
+            db.session.remove()
+
+    def run_cycle(self, report=None):
+        """
+        Send a batch and purge the old messages, surviving their errors like the clock process
+        (AlertScheduler.run_cycle): a database or provider failing for a while must not stop the worker process.
+        The messages of a failed batch are claimed again once their lease expires.
+        :param report: Callable run every report_interval seconds, i.e. saving the metrics
+        :return: The number of messages claimed, 0 if the batch failed
+        """
+        claimed = 0
+        try:
+            claimed = self.run_once()
+            self.purge()
+        except Exception:
+            self.failures += 1
+            logging.getLogger('root').exception('Outbox delivery failed')
+            self.reset_session()
+
+        if report is not None and (self.reported is None or time.monotonic() - self.reported >= self.report_interval):
+            self.reported = time.monotonic()
+            try:
+                report()
+            except Exception:
+                logging.getLogger('root').exception('Delivery report failed')
+                self.reset_session()
+
+        db.session.remove()
+        return claimed
+
+    def run(self, report=None):
+        """
+        :param report: Callable run every report_interval seconds, i.e. saving the metrics
+        """
+        while True:
+            if self.run_cycle(report) < self.batch:
+                time.sleep(self.poll_interval)
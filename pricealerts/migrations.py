@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+"""
+pricealerts/migrations.py
+
+Upgrade of a database created by an older version of the app. db.create_all() creates the missing tables, but
+doesn't add the new columns to the existing ones: upgrade_schema() adds them with ALTER TABLE and fills them for the
+rows already there. It only adds what is missing, so it can be run on every deploy (`flask upgrade-db`, run by the
+release phase of the Procfile).
+"""
+import datetime
+import logging
+
+import sqlalchemy
+
+from pricealerts.db import db
+from pricealerts.models import AlertModel
+
+
+def missing_columns(connection, table):
+    """
+    :param connection: Connection to the database
+    :param table: sqlalchemy Table of a model
+    :return: List of the columns of the model missing in the table, empty if the table is also missing
+    """
+    inspector = sqlalchemy.inspect(connection)
+    if table.name not in inspector.get_table_names():
+        return []
+    existing = set(column['name'] for column in inspector.get_columns(table.name))
+    return [column for column in table.columns if column.name not in existing]
+
+
+def add_column(connection, table, column):
+    """
+    ALTER TABLE adding the column, NULL allowed unless it has a server default filling the existing rows
+    """
+    dialect = connection.dialect
+    ddl = 'ALTER TABLE {} ADD COLUMN {} {}'.format(dialect.identifier_preparer.quote(table.name),
+                                                   dialect.identifier_preparer.quote(column.name),
+                                                   column.type.compile(dialect=dialect))
+    if column.server_default is not None:
+        ddl += " DEFAULT '{}' NOT NULL".format(column.server_default.arg)
+    connection.execute(ddl)
+
+    for index in table.indexes:
+        if column in index.columns.values():
+            index.create(connection)
+
+
+def backfill_alerts(connection, added):
+    """
+    Fill the new columns of the alerts already there, as the app would have set them
+    :param added: Names of the columns just added
+    """
+    alerts = AlertModel.__table__
+    items = db.Model.metadata.tables['items']
+
+    if 'next_check' in added:
+        # last_checked + check_every, computed here as date arithmetic differs on every database
+        rows = connection.execute(sqlalchemy.select([alerts.c.id, alerts.c.last_checked, alerts.c.check_every]))
+        now = datetime.datetime.utcnow()
+        updates = [{'alert_id': alert_id,
+                    'next_check': last_checked + datetime.timedelta(minutes=int(check_every or 0))
+                    if last_checked is not None else now}
+                   for alert_id, last_checked, check_every in rows]
+        if updates:
+            connection.execute(alerts.update().where(alerts.c.id == sqlalchemy.bindparam('alert_id'))
+                               .values(next_check=sqlalchemy.bindparam('next_check')), updates)
+        # NOT NULL once filled. SQLite can't alter a column, it's left nullable there
+        if connection.dialect.name != 'sqlite':
+            connection.execute('ALTER TABLE alerts ALTER COLUMN next_check SET NOT NULL')
+
+    if 'trigger_state' in added:
+        # The alerts below their limit were notified on the last check: fired, so the upgrade doesn't notify them
+        # again, they are re-armed as usual once the price goes back up
+        item_price = sqlalchemy.select([items.c.price]).where(items.c.id == alerts.c.item_id).as_scalar()
+        connection.execute(alerts.update().where(item_price <= alerts.c.price_limit)
+                           .values(trigger_state=AlertModel.FIRED, fired_at=alerts.c.last_checked))
+
+
+def upgrade_schema():
+    """
+    Create the missing tables and add the missing columns of the existing ones, with their backfill.
+    Run it within an app context.
+    :return: dict of the columns added, by table
+    """
+    db.create_all()
+
+    upgraded = {}
+    with db.engine.begin() as connection:
+        for table in db.Model.metadata.sorted_tables:
+            columns = missing_columns(connection, table)
+            for column in columns:
+                add_column(connection, table, column)
+            if columns:
+                upgraded[table.name] = [column.name for column in columns]
+
+        if AlertModel.__tablename__ in upgraded:
+            backfill_alerts(connection, upgraded[AlertModel.__tablename__])
+
+    for table_name, names in upgraded.items():
+        logging.getLogger('root').info('Table {} upgraded, columns added: {}'.format(table_name, ', '.join(names)))
+    return upgraded
@@ -4,28 +4,36 @@ common/item.py
 
 Module that contains the model definition for every table in a SQLAlchemy database.
 """
+import collections
 import datetime
+import logging
 import os
 import random
-import re
 import string
 import uuid
 
 import requests
 import sqlalchemy
-from bs4 import BeautifulSoup, SoupStrainer
 from flask import json
 from flask.globals import current_app
 from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import joinedload, validates
 from sqlalchemy.orm.exc import NoResultFound
 from werkzeug.exceptions import NotFound
 
 from pricealerts import settings
 from pricealerts.common.base_model import BaseModel, DatabaseError
+from pricealerts.common.errors import ItemNotLoadedError
 from pricealerts.db import db
 from pricealerts.settings import env
+from pricealerts.utils import http_client
+from pricealerts.utils.breaker import breakers, CircuitOpenError
+from pricealerts.utils.extractors import extractor_registry
+from pricealerts.utils.fingerprint import page_fingerprint
 from pricealerts.utils.helpers import parse_phone
-from pricealerts.utils.notifications import NotificationDispatcher
+from pricealerts.utils.http_cache import validator_cache
+from pricealerts.utils.parsers import ItemPage
+from pricealerts.utils.streaming import stream_item_data
 
 
 class ItemNotFoundError(Exception):
@@ -57,14 +65,22 @@ class StoreModel(db.Model, BaseModel):
     url_prefix = db.Column(db.String(80), unique=True)
     tag_name = db.Column(db.String(10))
     query_string = db.Column(db.String(75))
+    parser_backend = db.Column(db.String(20), nullable=True)  # None to use the HTML_PARSER_BACKEND setting
+    # Requests per second of all the clock processes together, None to use the STORE_RATE_LIMIT setting
+    rate_limit = db.Column(db.Float, nullable=True)
+    rate_burst = db.Column(db.Integer, nullable=True)  # None to use the STORE_RATE_BURST setting
 
     items = db.relationship('ItemModel', lazy='dynamic', backref='store',
                             cascade="all, delete, delete-orphan")
 
-    def __init__(self, name, url_prefix, tag_name="p", query_string=None):
+    def __init__(self, name, url_prefix, tag_name="p", query_string=None, parser_backend=None, rate_limit=None,
+                 rate_burst=None):
         self.name = name
         self.url_prefix = url_prefix
         self.tag_name = tag_name
+        self.parser_backend = parser_backend
+        self.rate_limit = rate_limit
+        self.rate_burst = rate_burst
         self.query_string = json.dumps(query_string) \
             if query_string is not None else json.dumps({'class': 'price price--large'})
 
@@ -75,6 +91,13 @@ class StoreModel(db.Model, BaseModel):
             'items': [item.json() for item in self.items.all()]
         }
 
+    def __commit_update__(self):
+        # The price extraction rule may have changed
+        extractor_registry.invalidate(self.id)
+
+    def __commit_delete__(self):
+        extractor_registry.invalidate(self.id)
+
     def get_item(self, item_id):
         try:
 
@@ -119,11 +142,6 @@ class StoreModel(db.Model, BaseModel):
         return store
 
 
-class ItemNotLoadedError(Exception):
-    def __init__(self, message):
-        self.message = message
-
-
 class ItemModel(db.Model, BaseModel):
     """
     ItemModel class
@@ -162,50 +180,103 @@ class ItemModel(db.Model, BaseModel):
         find where the item price is located in the web page, setting up the price for the imte in the database
         :return: The item updated
         """
-        matcher = re.compile('''
-                # # don't match beginning of string, the price can start anywhere
-        (\d+\.\d+)  # try to match float numbers
-        \D*         # optional separator is any number of non-digits
-        (\d+\.\d+)? # optional price boundary, try to match float numbers is a price range, ie: 45.00 - 55.12 
-        ''', re.VERBOSE)
-        only_price_img_and_title_tag_ = SoupStrainer(name=['title', 'p', 'span', 'img'])
+        store = self.store if self.store is not None else StoreModel.find_by_id(self.store_id)
+        return self.fetch_item_data(self.url, extractor_registry.get(store))
 
+    def has_data(self, item_data):
+        """
+        :param item_data: (name, price, image) tuple loaded from the product page
+        :return: True if the item already holds that data, so there's nothing to save
+        """
+        return (self.name, self.price, self.image) == tuple(item_data)
 
-        req = requests.get(self.url)
-
+    def load_price_change(self, alerts, item_data):
+        """
+        Update the item with the data loaded from its product page and mark all its alerts as checked,
+        saving everything in a single commit
+        :param alerts: The alerts checked against this item
+        :param item_data: (name, price, image) tuple loaded from the product page, None if it could not be loaded
+        """
+        if item_data is not None:
+            self.name, self.price, self.image = item_data
 
-        if req.status_code == 200:
-            html_doc = req.content
-            soup = BeautifulSoup(html_doc, 'html.parser', parse_only=only_price_img_and_title_tag_)
+        last_checked = datetime.datetime.utcnow()
+        for alert in alerts:
+            alert.last_checked = last_checked
 
-            # Get price from ebay.com
-            element = soup.find('span', attrs={'itemprop':'price'})
-            if element is None:
-                # Get price from johnlewis.com
-                element =soup.find('p', class_={'price price--large'})
-            if element is None:
-                element = soup.find('span', attrs={'aria-label':re.compile('price')})
+        try:
+            self.save_to_db()
+        except DatabaseError:
+            pass
 
-            price = matcher.search(element.text.strip())
-            if price is not None:
-                price = float(price.group(1))
+    @staticmethod
+    def fetch_item_data(url, extractor=None):
+        """
+        Load the name, price and image of the product published at url.
+        It doesn't touch the database, so it's safe to call it from the price-check engine worker threads.
+        :param url: The product page url
+        :param extractor: PriceExtractor of the item's store, the generic one if None
+        :return: A (name, price, image) tuple
+        """
+        page = ItemModel.download_item_page(url, extractor)
+        return page.parse() if isinstance(page, ItemPage) else page
 
+    @staticmethod
+    def download_item_page(url, extractor=None):
+        """
+        Download the product page published at url, the I/O half of fetch_item_data.
+        :param url: The product page url
+        :param extractor: PriceExtractor of the item's store, the generic one if None
+        :return: The (name, price, image) tuple when it's known without parsing the page (the page didn't change, or
+        was parsed while streamed), otherwise the ItemPage to parse
+        """
+        extractor = extractor or extractor_registry.default
+        streaming = settings.SCRAPER_STREAMING
 
-            name = soup.find(name="title").string
+        # Ask the store to send the page only if it changed since the last check
+        req = http_client.get(url, headers=validator_cache.request_headers(url), stream=streaming)
 
-            # item image for johnlewis.com
-            image = soup.find("img", attrs={'alt':re.compile(name)})
-            if image is not None:
-                image = image.get('src')
-            return name, price, image
+        if req.status_code == 304:
+            req.close()
+            data = validator_cache.get(url)
+            if data is not None:
+                return data
+            req = http_client.get(url, stream=streaming)
 
-        codes = {404: 'Not found', 403: 'Permission denied', 500:'Internal server error'}
-        raise ItemNotLoadedError('Product page not loaded correctly: {}'.format(codes[req.status_code]))
+        if req.status_code == 200:
+            if streaming:
+                # Only the beginning of the page is read, up to the product data
+                data = stream_item_data(req, extractor)
+                validator_cache.store(url, req.headers, data)
+                return data
+
+            fingerprint = None
+            if settings.SCRAPER_FINGERPRINT:
+                # Pages changing only outside of their price region aren't parsed again
+                fingerprint = page_fingerprint(req.content, extractor)
+                data = validator_cache.get_unchanged(url, fingerprint)
+                if data is not None:
+                    validator_cache.store(url, req.headers, data, fingerprint)
+                    return data
+
+            return ItemPage(url, req.content, extractor, req.headers, fingerprint)
+
+        req.close()
+        codes = {404: 'Not found', 403: 'Permission denied', 429: 'Too many requests', 500:'Internal server error'}
+        raise ItemNotLoadedError('Product page not loaded correctly: {}'.format(codes.get(req.status_code,
+                                                                                       req.status_code)),
+                                 status_code=req.status_code)
 
 
 class AlertModel(db.Model, BaseModel):
     __tablename__ = "alerts"
 
+    # Trigger states: an armed alert notifies its user when the price drops below its limit and becomes fired.
+    # It isn't notified again until it's re-armed, when the price goes back above the limit or after
+    # ALERT_REARM_COOLDOWN seconds.
+    ARMED = 'armed'
+    FIRED = 'fired'
+
     id = db.Column(db.Integer, primary_key=True)
     price_limit = db.Column(db.Float(precision=2), nullable=False)
     item_id = db.Column(db.Integer, db.ForeignKey('items.id'), nullable=False)
@@ -216,7 +287,10 @@ class AlertModel(db.Model, BaseModel):
     contact_email = db.Column(db.String(80), nullable=False)
     check_every = db.Column(db.Integer, default=10, nullable=False)
     last_checked = db.Column(db.DateTime(timezone=False), nullable=False, default=datetime.datetime.utcnow())
-
+    # last_checked + check_every, indexed so the clock process only selects the alerts due
+    next_check = db.Column(db.DateTime(timezone=False), nullable=False, index=True, default=datetime.datetime.utcnow)
+    trigger_state = db.Column(db.String(10), nullable=False, default=ARMED, server_default=ARMED)
+    fired_at = db.Column(db.DateTime(timezone=False), nullable=True)
 
     def __str__(self):
         return "(AlertModel<id={}, user='{}', item='{}'>)".format(self.id, self.user.name, self.item.name)
@@ -249,43 +323,795 @@ class AlertModel(db.Model, BaseModel):
             'active': self.active,
             'shared': self.shared,
             'contact_phone': self.contact_phone,
-            'contact_email': self.contact_email
+            'contact_email': self.contact_email,
+            'trigger_state': self.trigger_state,
+            'fired_at': self.fired_at
         }
 
+    @validates('last_checked', 'check_every')
+    def schedule_next_check(self, key, value):
+        """
+        Keep next_check in sync with last_checked and check_every, whatever the code setting them
+        """
+        last_checked = value if key == 'last_checked' else self.last_checked
+        check_every = value if key == 'check_every' else self.check_every
+        if last_checked is not None and check_every is not None:
+            self.next_check = last_checked + datetime.timedelta(minutes=int(check_every))
+        return value
+
+    @validates('price_limit')
+    def rearm_on_new_limit(self, key, value):
+        """
+        A new price limit is a new alert for the user: it's notified again if the price is below it
+        """
+        if value != self.price_limit:
+            self.trigger_state = AlertModel.ARMED
+            self.fired_at = None
+        return value
+
+    def notify_schedule(self):
+        """
+        Tell the clock process the due time of the alert's item may have changed (see checker/scheduler.py).
+        The notification is sent by Postgres when the transaction commits, other databases are only picked up by the
+        scheduler's periodic reloads. The clock process doesn't notify itself (SCHEDULER_NOTIFY is off in its app): its
+        scheduler refreshes the items it checked once their cycle is over.
+        """
+        if not current_app.config.get('SCHEDULER_NOTIFY', True):
+            return
+        if self.item_id is not None and db.engine.dialect.name == 'postgresql':
+            db.session.execute(sqlalchemy.text('SELECT pg_notify(:channel, :payload)'),
+                               {'channel': settings.SCHEDULER_CHANNEL, 'payload': str(self.item_id)})
+
+    def __before_commit_insert__(self):
+        super(AlertModel, self).__before_commit_insert__()
+        self.notify_schedule()
+
+    def __before_commit_update__(self):
+        super(AlertModel, self).__before_commit_update__()
+        self.notify_schedule()
+
+    def __before_commit_delete__(self):
+        super(AlertModel, self).__before_commit_delete__()
+        self.notify_schedule()
+
     # Class methods
     @classmethod
-    def find_needing_update(cls, minutes_since_last_update=env('ALERT_CHECK_INTERVAL',default=10)):
-        last_update_limit = datetime.datetime.utcnow() - datetime.timedelta(minutes=int(minutes_since_last_update))
-        return cls.query.filter(AlertModel.active == True, AlertModel.last_checked <= last_update_limit).all()
+    def find_needing_update(cls, now=None, item_ids=None):
+        """
+        :param now: The time the alerts are due at, utcnow() if None
+        :param item_ids: Only select the alerts of these items, all the items if None
+        :return: The active alerts whose next check is due, every alert following its own check_every
+        """
+        now = now or datetime.datetime.utcnow()
+        query = cls.query.filter(cls.active == True, cls.next_check <= now)
+        if item_ids is not None:
+            query = query.filter(cls.item_id.in_(item_ids))
+        return query.order_by(cls.next_check).all()
+
+    @classmethod
+    def claim_due(cls, item_ids=None, limit=None, now=None, lease=settings.CHECKER_LEASE):
+        """
+        Claim the due alerts for this clock process, so the other ones don't check them too.
+
+        The rows locked by another process are skipped (FOR UPDATE SKIP LOCKED), and the next_check of the alerts
+        claimed is moved to the end of the lease: they aren't due for anybody else until then. Checking an alert sets
+        its next_check from its check_every again, and the alerts left unchecked are given back (release), so if the
+        process dies first, its alerts become due again once the lease expires and another process picks them up.
+        :param item_ids: Only claim the alerts of these items, all the items if None
+        :param limit: Maximum number of alerts claimed, all the due alerts if None
+        :param now: The time the alerts are due at, utcnow() if None
+        :param lease: Seconds the alerts are held
+        :return: The alerts claimed
+        """
+        now = now or datetime.datetime.utcnow()
+        query = cls.query.filter(cls.active == True, cls.next_check <= now)
+        if item_ids is not None:
+            query = query.filter(cls.item_id.in_(item_ids))
+        query = query.order_by(cls.next_check)
+        if limit:
+            query = query.limit(limit)
 
-    def load_price_change(self):
         try:
-            self.item.name, self.item.price, self.item.image = self.item.load_item_data()
-        except:
-            pass
+            ids = [alert_id for alert_id, in query.with_entities(cls.id).with_for_update(skip_locked=True).all()]
+            if ids:
+                cls.query.filter(cls.id.in_(ids)).update(
+                    {cls.next_check: now + datetime.timedelta(seconds=lease)}, synchronize_session=False)
+            db.session.commit()
+        except sqlalchemy.exc.DatabaseError as ex:
+            db.session.rollback()
+            logging.getLogger('root').error('Due alerts not claimed: {}'.format(str(ex)))
+            return []
+
+        return cls.query.filter(cls.id.in_(ids)).order_by(cls.next_check).all() if ids else []
+
+    @classmethod
+    def release(cls, alert_ids):
+        """
+        Give back claimed alerts left unchecked: their next_check goes back from the end of the lease to
+        last_checked + check_every, so they keep their place among the due alerts in the next cycle
+        :param alert_ids: The alerts claimed and not checked
+        :return: The number of alerts released
+        """
+        if not alert_ids:
+            return 0
+
+        table = cls.__table__
+        try:
+            rows = db.session.query(cls.id, cls.last_checked, cls.check_every).filter(cls.id.in_(alert_ids)).all()
+            updates = [{'alert_id': alert_id,
+                        'next_check': last_checked + datetime.timedelta(minutes=int(check_every))}
+                       for alert_id, last_checked, check_every in rows]
+            if not updates:
+                return 0
+            db.session.execute(table.update().where(table.c.id == sqlalchemy.bindparam('alert_id'))
+                               .values(next_check=sqlalchemy.bindparam('next_check')), updates)
+            db.session.commit()
+        except sqlalchemy.exc.DatabaseError as ex:
+            db.session.rollback()
+            logging.getLogger('root').error('Claimed alerts not released: {}'.format(str(ex)))
+            return 0
+        return len(updates)
+
+    @classmethod
+    def find_triggered(cls, alert_ids=None, armed_only=False):
+        """
+        Compare the price limit of many alerts with the current price of their item in a single query
+        :param alert_ids: Only evaluate these alerts, all the active alerts if None
+        :param armed_only: Skip the alerts already fired
+        :return: The active alerts whose item price is below their price limit, loaded with their item and user
+        """
+        if alert_ids is not None and not alert_ids:
+            return []
+
+        query = cls.query.join(ItemModel, cls.item_id == ItemModel.id)\
+            .filter(cls.active == True, ItemModel.price < cls.price_limit)
+        if alert_ids is not None:
+            query = query.filter(cls.id.in_(alert_ids))
+        if armed_only:
+            query = query.filter(cls.trigger_state == cls.ARMED)
+        return query.options(joinedload(cls.user)).order_by(cls.id).all()
+
+    @classmethod
+    def find_armed(cls, alert_ids):
+        """
+        :param alert_ids: The alerts to load, i.e. triggered
+        :return: The active alerts among them not fired yet, loaded with their item and user in a single query
+        """
+        if not alert_ids:
+            return []
+
+        return cls.query.filter(cls.id.in_(alert_ids), cls.active == True, cls.trigger_state == cls.ARMED)\
+            .options(joinedload(cls.user), joinedload(cls.item)).order_by(cls.id).all()
+
+    @classmethod
+    def thresholds(cls, item_ids=None):
+        """
+        :param item_ids: Only read the alerts of these items, all the items if None
+        :return: (alert_id, item_id, price_limit) of the active alerts, without loading them as objects
+        """
+        query = db.session.query(cls.id, cls.item_id, cls.price_limit).filter(cls.active == True)
+        if item_ids is not None:
+            query = query.filter(cls.item_id.in_(item_ids))
+        return query.all()
+
+    @classmethod
+    def due_times(cls, item_ids=None):
+        """
+        :param item_ids: Only read the due time of these items, all the items if None
+        :return: dict mapping the id of every item with active alerts to the earliest next_check of its alerts
+        """
+        query = db.session.query(cls.item_id, sqlalchemy.func.min(cls.next_check)).filter(cls.active == True)
+        if item_ids is not None:
+            query = query.filter(cls.item_id.in_(item_ids))
+        return dict(query.group_by(cls.item_id).all())
+
+    @classmethod
+    def mark_checked_many(cls, alerts):
+        """
+        Mark many alerts as checked with one UPDATE per check frequency, used for the alerts whose item didn't change
+        :param alerts: The alerts
+        """
+        if not alerts:
+            return
+
+        last_checked = datetime.datetime.utcnow()
+        frequencies = collections.defaultdict(list)
+        for alert in alerts:
+            frequencies[alert.check_every].append(alert.id)
+
+        try:
+            for check_every, ids in frequencies.items():
+                cls.query.filter(cls.id.in_(ids)).update(
+                    {cls.last_checked: last_checked,
+                     cls.next_check: last_checked + datetime.timedelta(minutes=check_every)},
+                    synchronize_session=False)
+            db.session.commit()
+        except sqlalchemy.exc.DatabaseError as ex:
+            db.session.rollback()
+            logging.getLogger('root').error('{} alerts not marked as checked: {}'.format(len(alerts), str(ex)))
+
+    @classmethod
+    def rearm_many(cls, alert_ids, now=None, cooldown=settings.ALERT_REARM_COOLDOWN,
+                   margin=settings.ALERT_REARM_MARGIN):
+        """
+        Re-arm the fired alerts whose item price went back above their limit, or that were fired more than `cooldown`
+        seconds ago, with a single UPDATE
+        :param alert_ids: The alerts just checked
+        :param now: utcnow() if None
+        :param cooldown: Seconds before a fired alert is re-armed whatever the price, 0 to only re-arm on the price
+        :param margin: Percentage above the limit the price must go back to, so a price moving around the limit
+        doesn't notify on every move
+        :return: The number of alerts re-armed
+        """
+        if not alert_ids:
+            return 0
+
+        now = now or datetime.datetime.utcnow()
+        item_price = db.session.query(ItemModel.price).filter(ItemModel.id == cls.item_id).correlate(cls).as_scalar()
+        rearm = item_price >= cls.price_limit * (1 + margin / 100.0)
+        if cooldown:
+            rearm = sqlalchemy.or_(rearm, cls.fired_at <= now - datetime.timedelta(seconds=cooldown))
+
+        try:
+            count = cls.query.filter(cls.id.in_(alert_ids), cls.trigger_state == cls.FIRED, rearm)\
+                .update({cls.trigger_state: cls.ARMED, cls.fired_at: None}, synchronize_session=False)
+            db.session.commit()
+        except sqlalchemy.exc.DatabaseError as ex:
+            db.session.rollback()
+            logging.getLogger('root').error('{} alerts not re-armed: {}'.format(len(alert_ids), str(ex)))
+            return 0
+        return count
+
+    @classmethod
+    def fire_many(cls, alerts, now=None):
+        """
+        Queue the price drop emails of the alerts triggered and mark them as fired, in a single commit: an alert is
+        fired if and only if its email is in the outbox (OutboxMessageModel). The subscribers of the same item get
+        their emails from a single batch message, sent with one Mailgun request per MAILGUN_BATCH_LIMIT recipients.
+        :param alerts: The armed alerts whose price limit was reached
+        :param now: utcnow() if None
+        :return: The number of alerts fired
+        """
+        if not alerts:
+            return 0
+
+        now = now or datetime.datetime.utcnow()
+        items = collections.OrderedDict()
+        for alert in alerts:
+            items.setdefault(alert.item_id, []).append(alert)
+
+        try:
+            for item_id, item_alerts in items.items():
+                for n, batch in enumerate(cls.price_drop_batches(item_alerts)):
+                    OutboxMessageModel.enqueue(OutboxMessageModel.BATCH,
+                                               'batch:price-drop:{}:{}:{}'.format(item_id, now.isoformat(), n),
+                                               **batch)
+            cls.query.filter(cls.id.in_([alert.id for alert in alerts]))\
+                .update({cls.trigger_state: cls.FIRED, cls.fired_at: now}, synchronize_session=False)
+            db.session.commit()
+        except sqlalchemy.exc.DatabaseError as ex:
+            db.session.rollback()
+            logging.getLogger('root').error('{} alerts not fired: {}'.format(len(alerts), str(ex)))
+            return 0
+        return len(alerts)
+
+    def load_price_change(self, item_data=None):
+        """
+        Update the alert's item with the data published in the product page and mark the alert as checked
+        :param item_data: (name, price, image) tuple already loaded by the price-check engine. If None, the product
+        page is loaded here.
+        """
+        try:
+            if item_data is None:
+                # Failing stores and product pages aren't requested again until their backoff expires
+                item_data = breakers.call(self.item.url, self.item.load_item_data)
+            self.item.name, self.item.price, self.item.image = item_data
+        except (CircuitOpenError, ItemNotLoadedError, requests.RequestException) as ex:
+            logging.getLogger('root').warning('Alert {} not updated: {}'.format(self.id, getattr(ex, 'message', ex)))
+
+        self.mark_checked()
+
+    def mark_checked(self):
         self.last_checked = datetime.datetime.utcnow()
 
         try:
             self.save_to_db()
-        except:
-            pass
+        except DatabaseError as ex:
+            logging.getLogger('root').error('Alert {} not marked as checked: {}'.format(self.id, ex.message))
+
+    @staticmethod
+    def price_drop_batches(alerts, limit=settings.MAILGUN_BATCH_LIMIT):
+        """
+        Price drop emails of the alerts of one item, personalized for every recipient with Mailgun's recipient
+        variables: %recipient.name% and %recipient.contact_email%. As the single emails did, every alert notifies
+        its contact email and its user's email.
+        :param alerts: Alerts of the same item
+        :param limit: Recipients per batch
+        :return: The keyword arguments of NotificationDispatcher.send_batch_email, one dict per batch
+        """
+        item = alerts[0].item
+        subject = "NEW ALERT FOR PRICE DROP from TechFitU <{}>".format(env('SMTP_USER'))
+        message = "!Congratulations %recipient.contact_email%, you have a chance to save money !<br/>" \
+                  "The product {} has dropped its price. " \
+                  "Got to the product <a href='{}'>link</a> to see its currrent status" \
+                  " You are a truly awesome prices hunter!".format(item.name, item.url)
+
+        recipients = collections.OrderedDict()
+        for alert in alerts:
+            variables = {'name': alert.user.name, 'contact_email': alert.contact_email}
+            for address in (alert.contact_email, alert.user.username):
+                recipients.setdefault(address, variables)
+
+        addresses = list(recipients)
+        return [{'subject': subject, 'message': message,
+                 'recipients': collections.OrderedDict((address, recipients[address])
+                                                       for address in addresses[start:start + limit])}
+                for start in range(0, len(addresses), limit)]
+
+
+def price_cents(price):
+    """
+    :param price: A price as loaded from a product page
+    :return: The price in integer cents, None if the price is unknown
+    """
+    return int(round(price * 100)) if price is not None else None
+
+
+class PriceObservationModel(db.Model):
+    """
+    Append-only price history of the items: a row when the price of an item changes, and a heartbeat row every
+    PRICE_HEARTBEAT seconds while it doesn't. Rows older than PRICE_RAW_RETENTION days are folded into hourly
+    rollups (PriceRollupModel.compact). The rows are kept compact: no audit columns, the price in integer cents.
+    """
+    __tablename__ = 'price_observations'
+    __table_args__ = (db.Index('ix_price_observations_item_observed', 'item_id', 'observed'),)
+
+    id = db.Column(db.BigInteger().with_variant(db.Integer, 'sqlite'), primary_key=True)
+    item_id = db.Column(db.Integer, db.ForeignKey('items.id', ondelete='CASCADE'), nullable=False)
+    observed = db.Column(db.DateTime(timezone=False), nullable=False)
+    price_cents = db.Column(db.Integer, nullable=False)
+
+    def __init__(self, item_id, observed, price_cents):
+        self.item_id = item_id
+        self.observed = observed
+        self.price_cents = price_cents
+
+    def json(self):
+        return {
+            'item_id': self.item_id,
+            'observed': self.observed,
+            'price': self.price_cents / 100.0
+        }
+
+    @classmethod
+    def last_observed(cls, item_ids):
+        """
+        :param item_ids: The items
+        :return: dict mapping the id of every item with observations to the time of its latest one
+        """
+        if not item_ids:
+            return {}
+        query = db.session.query(cls.item_id, sqlalchemy.func.max(cls.observed)).filter(cls.item_id.in_(item_ids))
+        return dict(query.group_by(cls.item_id).all())
+
+    @classmethod
+    def record_many(cls, prices, observed=None):
+        """
+        Append observations with a single INSERT, without loading them as objects
+        :param prices: List of (item_id, price) tuples
+        :param observed: Time of the observations, utcnow() if None
+        """
+        rows = [{'item_id': item_id, 'observed': observed or datetime.datetime.utcnow(),
+                 'price_cents': price_cents(price)}
+                for item_id, price in prices if price is not None]
+        if not rows:
+            return
+
+        try:
+            db.session.execute(cls.__table__.insert(), rows)
+            db.session.commit()
+        except sqlalchemy.exc.DatabaseError as ex:
+            db.session.rollback()
+            logging.getLogger('root').error('{} price observations not saved: {}'.format(len(rows), str(ex)))
+
+    @classmethod
+    def lowest_price(cls, item_id, since):
+        """
+        :param item_id: The item
+        :param since: Start of the period, i.e. 30 days ago
+        :return: The lowest price of the item since then, raw observations and rollups included, None if unknown
+        """
+        lowest = [db.session.query(sqlalchemy.func.min(cls.price_cents)).filter(
+            cls.item_id == item_id, cls.observed >= since).scalar()]
+        lowest.append(db.session.query(sqlalchemy.func.min(PriceRollupModel.min_cents)).filter(
+            PriceRollupModel.item_id == item_id, PriceRollupModel.bucket >= since).scalar())
+        lowest = [cents for cents in lowest if cents is not None]
+        return min(lowest) / 100.0 if lowest else None
+
+    @classmethod
+    def history(cls, item_id, since, until=None):
+        """
+        :param item_id: The item
+        :param since: Start of the period
+        :param until: End of the period, now if None
+        :return: List of (time, min price, max price) tuples in chronological order: the rollups of the old data and
+        the observations of the recent one
+        """
+        until = until or datetime.datetime.utcnow()
+        rollups = db.session.query(PriceRollupModel.bucket, PriceRollupModel.min_cents, PriceRollupModel.max_cents)\
+            .filter(PriceRollupModel.item_id == item_id, PriceRollupModel.bucket >= since,
+                    PriceRollupModel.bucket < until).all()
+        observations = db.session.query(cls.observed, cls.price_cents, cls.price_cents)\
+            .filter(cls.item_id == item_id, cls.observed >= since, cls.observed < until).all()
+        return [(observed, low / 100.0, high / 100.0) for observed, low, high in sorted(rollups + observations)]
+
+    @classmethod
+    def item_ids(cls):
+        """
+        :return: The sorted ids of the items with a price history, observations or rollups
+        """
+        query = db.session.query(cls.item_id).union(db.session.query(PriceRollupModel.item_id))
+        return sorted(item_id for item_id, in query.all())
+
+
+class PriceRollupModel(db.Model):
+    """
+    Min / max price of an item over an hour or a day, downsampled from the old price observations
+    """
+    __tablename__ = 'price_rollups'
+
+    HOUR = 'hour'
+    DAY = 'day'
+
+    item_id = db.Column(db.Integer, db.ForeignKey('items.id', ondelete='CASCADE'), primary_key=True)
+    resolution = db.Column(db.String(4), primary_key=True)
+    bucket = db.Column(db.DateTime(timezone=False), primary_key=True)
+    min_cents = db.Column(db.Integer, nullable=False)
+    max_cents = db.Column(db.Integer, nullable=False)
+    observations = db.Column(db.Integer, nullable=False)
+
+    def json(self):
+        return {
+            'item_id': self.item_id,
+            'resolution': self.resolution,
+            'bucket': self.bucket,
+            'min_price': self.min_cents / 100.0,
+            'max_price': self.max_cents / 100.0,
+            'observations': self.observations
+        }
+
+    @staticmethod
+    def truncate(moment, resolution):
+        """
+        :return: The start of the hour or the day of moment
+        """
+        moment = moment.replace(minute=0, second=0, microsecond=0)
+        return moment.replace(hour=0) if resolution == PriceRollupModel.DAY else moment
+
+    @classmethod
+    def _fold(cls, source, older, rollups):
+        """
+        Insert the rollups selected from the rows of source older than the cutoff, and delete those rows
+        :param source: The table rolled up
+        :param older: Condition of the rows older than the cutoff, the start of an hour or a day so every bucket is
+        complete when it's written
+        :param rollups: SELECT of the rollup columns, grouped by item and bucket
+        :return: The number of rows folded
+        """
+        db.session.execute(cls.__table__.insert().from_select(
+            ['item_id', 'resolution', 'bucket', 'min_cents', 'max_cents', 'observations'], rollups.where(older)))
+        return db.session.execute(source.delete().where(older)).rowcount
+
+    @classmethod
+    def compact(cls, now=None):
+        """
+        Apply the retention policy of the price history: observations older than PRICE_RAW_RETENTION days are
+        downsampled into hourly rollups, hourly rollups older than PRICE_HOURLY_RETENTION days into daily ones, and
+        daily rollups older than PRICE_DAILY_RETENTION days are deleted (kept forever if 0)
+        :param now: utcnow() if None
+        :return: dict with the number of rows folded or deleted per step
+        """
+        now = now or datetime.datetime.utcnow()
+        func = sqlalchemy.func
+        observation, rollup = PriceObservationModel, cls
+
+        hour = func.date_trunc(cls.HOUR, observation.observed)
+        hourly = sqlalchemy.select([observation.item_id, sqlalchemy.literal(cls.HOUR), hour,
+                                    func.min(observation.price_cents), func.max(observation.price_cents),
+                                    func.count()]).group_by(observation.item_id, hour)
+        day = func.date_trunc(cls.DAY, rollup.bucket)
+        daily = sqlalchemy.select([rollup.item_id, sqlalchemy.literal(cls.DAY), day, func.min(rollup.min_cents),
+                                   func.max(rollup.max_cents), func.sum(rollup.observations)])\
+            .group_by(rollup.item_id, day)
+
+        raw_cutoff = cls.truncate(now - datetime.timedelta(days=settings.PRICE_RAW_RETENTION), cls.HOUR)
+        hourly_cutoff = cls.truncate(now - datetime.timedelta(days=settings.PRICE_HOURLY_RETENTION), cls.DAY)
+
+        compacted = {'observations': 0, 'hourly': 0, 'daily': 0}
+        try:
+            compacted['observations'] = cls._fold(observation.__table__, observation.observed < raw_cutoff, hourly)
+            compacted['hourly'] = cls._fold(
+                cls.__table__, sqlalchemy.and_(rollup.resolution == cls.HOUR, rollup.bucket < hourly_cutoff), daily)
+            if settings.PRICE_DAILY_RETENTION:
+                daily_cutoff = now - datetime.timedelta(days=settings.PRICE_DAILY_RETENTION)
+                compacted['daily'] = cls.query.filter(cls.resolution == cls.DAY, cls.bucket < daily_cutoff)\
+                    .delete(synchronize_session=False)
+            db.session.commit()
+        except sqlalchemy.exc.DatabaseError as ex:
+            db.session.rollback()
+            logging.getLogger('root').error('Price history not compacted: {}'.format(str(ex)))
+        return compacted
+
+
+class OutboxMessageModel(db.Model):
+    """
+    Transactional outbox of the notifications: the emails and SMS are added to the session of the change they're
+    about (a new alert, a price drop...) and committed with it, then sent by the delivery workers
+    (delivery/worker.py, the worker process) outside of the web requests and the price checks.
+
+    The payload holds the keyword arguments of NotificationDispatcher.send_<channel>. Every message has an idempotency
+    key naming the event it notifies, i.e. email:alert-created:<alert_id>: an event is queued once whatever the number
+    of times the code queuing it runs. The messages are claimed by one worker at a time (claim) and retried with an
+    exponential backoff, up to DELIVERY_MAX_ATTEMPTS attempts before being dead-lettered.
+    """
+    __tablename__ = 'outbox'
+    __table_args__ = (db.Index('ix_outbox_status_next_attempt', 'status', 'next_attempt'),)
+
+    EMAIL = 'email'
+    BATCH = 'batch'  # The same email personalized for many recipients
+    SMS = 'sms'
+
+    PENDING = 'pending'
+    SENT = 'sent'
+    DEAD = 'dead'
+
+    id = db.Column(db.BigInteger().with_variant(db.Integer, 'sqlite'), primary_key=True)
+    channel = db.Column(db.String(10), nullable=False)
+    idempotency_key = db.Column(db.String(120), nullable=False, unique=True)
+    payload = db.Column(db.Text, nullable=False)
+    status = db.Column(db.String(10), nullable=False, default=PENDING)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    created = db.Column(db.DateTime(timezone=False), nullable=False, default=datetime.datetime.utcnow)
+    next_attempt = db.Column(db.DateTime(timezone=False), nullable=False, default=datetime.datetime.utcnow)
+    sent_at = db.Column(db.DateTime(timezone=False), nullable=True)
+    last_error = db.Column(db.String(255), nullable=True)
+
+    def __init__(self, channel, idempotency_key, payload):
+        self.channel = channel
+        self.idempotency_key = idempotency_key
+        self.payload = json.dumps(payload)
+        self.status = OutboxMessageModel.PENDING
+        self.attempts = 0
+
+    def json(self):
+        return {
+            'id': self.id,
+            'channel': self.channel,
+            'idempotency_key': self.idempotency_key,
+            'status': self.status,
+            'attempts': self.attempts,
+            'created': self.created,
+            'next_attempt': self.next_attempt,
+            'sent_at': self.sent_at,
+            'last_error': self.last_error
+        }
+
+    def kwargs(self):
+        """
+        :return: The keyword arguments of the NotificationDispatcher method sending the message
+        """
+        return json.loads(self.payload)
+
+    @classmethod
+    def enqueue(cls, channel, idempotency_key, **payload):
+        """
+        Add a message to the session, it's queued when the caller commits
+        :param channel: EMAIL or SMS
+        :param idempotency_key: Name of the event notified
+        :param payload: Keyword arguments of NotificationDispatcher.send_<channel>
+        :return: The message, the one already queued for the event if any
+        """
+        message = cls.query.filter_by(idempotency_key=idempotency_key).first()
+        if message is None:
+            message = cls(channel, idempotency_key, payload)
+            db.session.add(message)
+        return message
+
+    @classmethod
+    def claim(cls, limit, now=None, lease=settings.DELIVERY_LEASE):
+        """
+        Claim the pending messages due for this worker, like AlertModel.claim_due: the rows locked by another worker
+        are skipped, and the next attempt of the messages claimed is moved to the end of the lease. If the worker dies
+        before recording the outcome, the messages are sent again once the lease expires.
+        :param limit: Maximum number of messages claimed
+        :param now: utcnow() if None
+        :param lease: Seconds the messages are held
+        :return: The messages claimed, oldest first
+        """
+        now = now or datetime.datetime.utcnow()
+        query = cls.query.filter(cls.status == cls.PENDING, cls.next_attempt <= now)\
+            .order_by(cls.next_attempt).limit(limit)
+
+        try:
+            ids = [message_id for message_id, in query.with_entities(cls.id).with_for_update(skip_locked=True).all()]
+            if ids:
+                cls.query.filter(cls.id.in_(ids)).update(
+                    {cls.next_attempt: now + datetime.timedelta(seconds=lease)}, synchronize_session=False)
+            db.session.commit()
+        except sqlalchemy.exc.DatabaseError as ex:
+            db.session.rollback()
+            logging.getLogger('root').error('Outbox messages not claimed: {}'.format(str(ex)))
+            return []
+
+        return cls.query.filter(cls.id.in_(ids)).order_by(cls.created).all() if ids else []
+
+    def delivered(self, now=None):
+        self.status = OutboxMessageModel.SENT
+        self.sent_at = now or datetime.datetime.utcnow()
+        self.attempts += 1
+        self.last_error = None
+
+    def failed(self, error, now=None, max_attempts=settings.DELIVERY_MAX_ATTEMPTS, backoff=settings.DELIVERY_BACKOFF,
+               max_backoff=settings.DELIVERY_MAX_BACKOFF, kwargs=None):
+        """
+        Schedule the next attempt after a failed delivery, or dead-letter the message after max_attempts
+        :param error: Description of the failure
+        :param backoff: Seconds before the first retry, doubled after every failure up to max_backoff
+        :param kwargs: Keyword arguments of the next attempt if the message was partly sent, i.e. a batch without the
+        recipients already notified
+        """
+        now = now or datetime.datetime.utcnow()
+        if kwargs is not None:
+            self.payload = json.dumps(kwargs)
+        self.attempts += 1
+        self.last_error = str(error)[:255]
+        if self.attempts >= max_attempts:
+            self.status = OutboxMessageModel.DEAD
+        else:
+            self.next_attempt = now + datetime.timedelta(seconds=min(backoff * 2 ** (self.attempts - 1), max_backoff))
+
+    @classmethod
+    def purge(cls, before):
+        """
+        Delete the messages sent before a time
+        :return: The number of messages deleted
+        """
+        try:
+            count = cls.query.filter(cls.status == cls.SENT, cls.sent_at < before).delete(synchronize_session=False)
+            db.session.commit()
+        except sqlalchemy.exc.DatabaseError as ex:
+            db.session.rollback()
+            logging.getLogger('root').error('Outbox not purged: {}'.format(str(ex)))
+            return 0
+        return count
+
+    @classmethod
+    def stats(cls, now=None):
+        """
+        :return: The depth of the outbox: messages pending and dead-lettered, and the age in seconds of the oldest
+        pending one
+        """
+        now = now or datetime.datetime.utcnow()
+        rows = db.session.query(cls.status, sqlalchemy.func.count(cls.id), sqlalchemy.func.min(cls.created))\
+            .filter(cls.status != cls.SENT).group_by(cls.status).all()
+        counts = {status: (count, oldest) for status, count, oldest in rows}
+        pending, oldest = counts.get(cls.PENDING, (0, None))
+        return {
+            'pending': pending,
+            'dead': counts.get(cls.DEAD, (0, None))[0],
+            'oldest_pending': round((now - oldest).total_seconds(), 3) if oldest is not None else None
+        }
 
-    def send_email_if_price_limit_reached(self):
-        if self.item.price < self.price_limit:
-            subject = "NEW ALERT FOR PRICE DROP from TechFitU <{}>".format(env('SMTP_USER')),
-            message = "!Congratulations {}, you have a chance to save money !<br/>"
-            "The product {} has dropped its price. "
-            "Got to the product <a href='{}'>link</a> to see its currrent status"
-            " You are a truly awesome prices hunter!".format(self.contact_email,
-                                                             self.item.name,
-                                                             self.item.url)
 
-            return NotificationDispatcher.send_email(self.user.name, self.user.username, self.contact_email,
-                                              subject=subject, message=message)
+class HttpValidatorModel(db.Model):
+    """
+    Validators and parsed data of the last version of every product page, persisted by the clock processes from their
+    in-memory cache (utils/http_cache.py), so a new or restarted process still sends conditional requests
+    """
+    __tablename__ = 'http_validators'
+
+    url = db.Column(db.String(255), primary_key=True)
+    etag = db.Column(db.String(255), nullable=True)
+    last_modified = db.Column(db.String(64), nullable=True)
+    fingerprint = db.Column(db.String(64), nullable=True)
+    data = db.Column(db.Text, nullable=False)
+    updated = db.Column(db.DateTime(timezone=False), nullable=False, default=datetime.datetime.utcnow)
+
+    def entry(self):
+        """
+        :return: The cache entry of the page
+        """
+        return {'etag': self.etag, 'last_modified': self.last_modified, 'fingerprint': self.fingerprint,
+                'data': json.loads(self.data)}
 
-        return False
+    @classmethod
+    def load_entries(cls):
+        """
+        :return: dict of the cache entry of every product page, by url
+        """
+        return {row.url: row.entry() for row in cls.query.all()}
+
+    @classmethod
+    def save_entries(cls, entries, now=None):
+        """
+        Insert, update or delete the rows of product pages with a single commit
+        :param entries: dict of the new cache entry of every page changed, by url, None for the pages deleted
+        :return: True if the entries were saved
+        """
+        now = now or datetime.datetime.utcnow()
+        try:
+            rows = {row.url: row for row in cls.query.filter(cls.url.in_(list(entries))).all()} if entries else {}
+            for url, entry in entries.items():
+                row = rows.get(url)
+                if entry is None:
+                    if row is not None:
+                        db.session.delete(row)
+                    continue
+                if row is None:
+                    row = cls(url=url)
+                    db.session.add(row)
+                row.etag = entry['etag'][:255] if entry['etag'] else None
+                row.last_modified = entry['last_modified'][:64] if entry['last_modified'] else None
+                row.fingerprint = entry['fingerprint']
+                row.data = json.dumps(entry['data'])
+                row.updated = now
+            db.session.commit()
+        except sqlalchemy.exc.DatabaseError as ex:
+            db.session.rollback()
+            logging.getLogger('root').error('HTTP cache not saved: {}'.format(str(ex)))
+            return False
+        return True
 
 
+class MetricsSnapshotModel(db.Model):
+    """
+    Last metrics snapshot saved by every clock and worker process (utils/metrics.py). The processes run on their own
+    dynos, the web process reads their snapshots from here.
+    """
+    __tablename__ = 'metrics_snapshots'
+
+    component = db.Column(db.String(20), primary_key=True)
+    process = db.Column(db.String(80), primary_key=True)
+    updated = db.Column(db.DateTime(timezone=False), nullable=False)
+    snapshot = db.Column(db.Text, nullable=False)
+
+    @classmethod
+    def save(cls, component, process, snapshot, now=None, max_age=settings.METRICS_MAX_AGE):
+        """
+        Replace the snapshot of a process, and delete the snapshots of the processes stopped for max_age seconds
+        :param component: Name of the metrics registry, i.e: checker
+        :param process: Name of the process saving the snapshot, one row is kept per process
+        :param snapshot: JSON serializable dict
+        :return: True if the snapshot was saved
+        """
+        now = now or datetime.datetime.utcnow()
+        try:
+            row = cls.query.get((component, process))
+            if row is None:
+                row = cls(component=component, process=process)
+                db.session.add(row)
+            row.updated = now
+            row.snapshot = json.dumps(snapshot)
+            cls.query.filter(cls.component == component, cls.process != process,
+                             cls.updated < now - datetime.timedelta(seconds=max_age))\
+                .delete(synchronize_session=False)
+            db.session.commit()
+        except sqlalchemy.exc.DatabaseError as ex:
+            db.session.rollback()
+            logging.getLogger('root').error('Metrics {} not saved: {}'.format(component, str(ex)))
+            return False
+        return True
+
+    @classmethod
+    def load(cls, component, now=None, max_age=settings.METRICS_MAX_AGE):
+        """
+        :return: dict of the last snapshot of every process saved in the last max_age seconds, by process
+        """
+        now = now or datetime.datetime.utcnow()
+        rows = cls.query.filter(cls.component == component,
+                                cls.updated >= now - datetime.timedelta(seconds=max_age)).all()
+        return {row.process: json.loads(row.snapshot) for row in rows}
+
 
 class TokenNotFound(Exception):
     """
@@ -32,12 +32,61 @@ USE_TZ = True
 JSON_AS_ASCII = True  # If False When using json.dumps() every non-ascii character won't be escaped to ascii representation
 ALERT_UPDATE_TIMEOUT = env('ALERT_UPDATE_TIMEOUT', default=10) # in minutes
 ALERT_CHECK_INTERVAL = env('ALERT_CHECK_INTERVAL', default=30) # in seconds
+SCHEDULER_CHANNEL = env('SCHEDULER_CHANNEL', default='alert_schedule') # Postgres channel notified of the alerts changed
+SCHEDULER_RESYNC = int(env('SCHEDULER_RESYNC', default=15 * 60)) # in seconds, between full reloads of the due times
+CHECKER_LEASE = int(env('CHECKER_LEASE', default=10 * 60)) # in seconds, alerts held by the clock process checking them
+CHECKER_PROCESSES = int(env('CHECKER_PROCESSES', default=1)) # clock processes running, they share the store rate limits
+CHECKER_CLAIM_BATCH = int(env('CHECKER_CLAIM_BATCH', default=200)) # alerts claimed and checked at once
+CHECKER_CYCLE_MAX_ITEMS = int(env('CHECKER_CYCLE_MAX_ITEMS', default=1000)) # items checked at most by a cycle
+CHECKER_CYCLE_DEADLINE = int(env('CHECKER_CYCLE_DEADLINE', default=5 * 60)) # in seconds, spent at most by a cycle
+CHECKER_MAX_WORKERS = int(env('CHECKER_MAX_WORKERS', default=20)) # product pages fetched at the same time
+CHECKER_PER_HOST_LIMIT = int(env('CHECKER_PER_HOST_LIMIT', default=4)) # product pages fetched at the same time per store
+CHECKER_PARSE_WORKERS = int(env('CHECKER_PARSE_WORKERS', default=os.cpu_count() or 1)) # processes parsing pages, 0 to parse them in the fetch threads
+CHECKER_PARSE_QUEUE = int(env('CHECKER_PARSE_QUEUE', default=32)) # downloaded pages waiting to be parsed
+HTTP_POOL_CONNECTIONS = int(env('HTTP_POOL_CONNECTIONS', default=20)) # hosts with connections kept alive
+HTTP_POOL_MAXSIZE = int(env('HTTP_POOL_MAXSIZE', default=10)) # connections kept alive per host
+HTTP_CONNECT_TIMEOUT = float(env('HTTP_CONNECT_TIMEOUT', default=3.05)) # in seconds
+HTTP_READ_TIMEOUT = float(env('HTTP_READ_TIMEOUT', default=10)) # in seconds
+STORE_RATE_LIMIT = float(env('STORE_RATE_LIMIT', default=1)) # product pages requested per second per store
+STORE_RATE_BURST = int(env('STORE_RATE_BURST', default=5)) # product pages requested at once per store
+SCRAPER_RESPECT_ROBOTS = env('SCRAPER_RESPECT_ROBOTS', cast=bool, default=True) # honour robots.txt Crawl-delay
+ROBOTS_CACHE_TTL = int(env('ROBOTS_CACHE_TTL', default=24 * 60 * 60)) # in seconds
+HTML_PARSER_BACKEND = env('HTML_PARSER_BACKEND', default='html.parser') # html.parser, lxml or selector
+SCRAPER_STREAMING = env('SCRAPER_STREAMING', cast=bool, default=False) # stop reading product pages once parsed
+SCRAPER_MAX_PAGE_BYTES = int(env('SCRAPER_MAX_PAGE_BYTES', default=1024 * 1024)) # read at most from a product page
+SCRAPER_CHUNK_SIZE = int(env('SCRAPER_CHUNK_SIZE', default=16 * 1024)) # bytes read at once in streaming mode
+SCRAPER_FINGERPRINT = env('SCRAPER_FINGERPRINT', cast=bool, default=True) # skip parsing pages whose price didn't change
+SCRAPER_FINGERPRINT_WINDOW = int(env('SCRAPER_FINGERPRINT_WINDOW', default=1024)) # bytes hashed after the price tag
+SCRAPER_BREAKER_THRESHOLD = int(env('SCRAPER_BREAKER_THRESHOLD', default=3)) # failures in a row opening a store
+SCRAPER_BREAKER_BACKOFF = int(env('SCRAPER_BREAKER_BACKOFF', default=60)) # in seconds, doubled on every failed probe
+SCRAPER_BREAKER_MAX_BACKOFF = int(env('SCRAPER_BREAKER_MAX_BACKOFF', default=6 * 60 * 60)) # in seconds
+SCRAPER_URL_BACKOFF = int(env('SCRAPER_URL_BACKOFF', default=10 * 60)) # in seconds, doubled on every failure
+METRICS_MAX_AGE = int(env('METRICS_MAX_AGE', default=60 * 60)) # in seconds, then a silent process is left out of the metrics
+PRICE_HEARTBEAT = int(env('PRICE_HEARTBEAT', default=24 * 60 * 60)) # in seconds, between observations of a steady price
+PRICE_RAW_RETENTION = int(env('PRICE_RAW_RETENTION', default=30)) # in days, then downsampled to hourly rollups
+PRICE_HOURLY_RETENTION = int(env('PRICE_HOURLY_RETENTION', default=365)) # in days, then downsampled to daily rollups
+PRICE_DAILY_RETENTION = int(env('PRICE_DAILY_RETENTION', default=0)) # in days, 0 to keep the daily rollups forever
+PRICE_COLUMNS_DIR = env('PRICE_COLUMNS_DIR', default=os.path.join(BASE_DIR, 'instance', 'price_columns')) # local copy, rebuilt from the database
+PRICE_COLUMNS_SYNC_INTERVAL = int(env('PRICE_COLUMNS_SYNC_INTERVAL', default=5 * 60)) # in seconds, between syncs of the local copy
+PRICE_COMPACT_INTERVAL = int(env('PRICE_COMPACT_INTERVAL', default=60 * 60)) # in seconds, between compactions
+ALERT_REARM_COOLDOWN = int(env('ALERT_REARM_COOLDOWN', default=7 * 24 * 60 * 60)) # in seconds, 0 to only re-arm on the price
+ALERT_REARM_MARGIN = float(env('ALERT_REARM_MARGIN', default=0)) # percentage above the limit re-arming a fired alert
+DELIVERY_WORKERS = int(env('DELIVERY_WORKERS', default=8)) # notifications sent at once by the worker process
+DELIVERY_BATCH = int(env('DELIVERY_BATCH', default=50)) # outbox messages claimed at once
+DELIVERY_LEASE = int(env('DELIVERY_LEASE', default=120)) # in seconds, before a claimed message can be sent again
+DELIVERY_MAX_ATTEMPTS = int(env('DELIVERY_MAX_ATTEMPTS', default=8)) # then the message is dead-lettered
+DELIVERY_BACKOFF = int(env('DELIVERY_BACKOFF', default=30)) # in seconds, doubled after every failed attempt
+DELIVERY_MAX_BACKOFF = int(env('DELIVERY_MAX_BACKOFF', default=60 * 60)) # in seconds
+DELIVERY_POLL_INTERVAL = float(env('DELIVERY_POLL_INTERVAL', default=2)) # in seconds, while the outbox is empty
+DELIVERY_REPORT_INTERVAL = int(env('DELIVERY_REPORT_INTERVAL', default=60)) # in seconds, between metrics snapshots
+DELIVERY_RETENTION = int(env('DELIVERY_RETENTION', default=7)) # in days, the messages sent are kept
 ADMINS_EMAIL = env('ADMINS_EMAIL').split(';')
 
 # MAILGUN EMAIL SETTINGS
 EMAILS_ALLOWED = ['gmail.com', 'yahoo.com', 'outlook.com']
 API_KEY = env('API_KEY')
 API_BASE_URL = env('API_BASE_URL')
+MAILGUN_BATCH_LIMIT = int(env('MAILGUN_BATCH_LIMIT', default=1000)) # recipients per batch sending request
 
 SMTP_SERVER=env('SMTP_SERVER')
 SMTP_PORT=env('SMTP_PORT')
@@ -45,6 +94,10 @@ SMTP_USER=env('SMTP_USER')
 SMTP_PASS=env('SMTP_PASS')
 EMAIL_FROM = env('EMAIL_FROM')
 EMAIL_SEND_TIMEOUT = int(env('EMAIL_SEND_TIMEOUT', default=10))
+SMTP_POOL_SIZE = int(env('SMTP_POOL_SIZE', default=4)) # SMTP connections open at once per process
+SMTP_POOL_CHECK_AFTER = int(env('SMTP_POOL_CHECK_AFTER', default=30)) # in seconds idle, before a NOOP health check
+SMTP_POOL_MAX_IDLE = int(env('SMTP_POOL_MAX_IDLE', default=4 * 60)) # in seconds, then the connection is closed
+SMTP_POOL_MAX_MESSAGES = int(env('SMTP_POOL_MAX_MESSAGES', default=100)) # messages sent per SMTP session
 
 # Twilio credentials for SMS
 ACCOUNT_SID=env('ACCOUNT_SID')
@@ -0,0 +1,225 @@
+# -*- coding: utf-8 -*-
+"""
+utils/breaker.py
+
+Circuit breakers per store host and negative cache per product url.
+
+A host failing SCRAPER_BREAKER_THRESHOLD checks in a row (connection errors, timeouts, 403, 429, 5xx) is opened: its
+pages aren't requested until its backoff expires. Then a single probe request is let through (half-open): if it
+works the host is closed again, otherwise it's opened for twice as long, up to SCRAPER_BREAKER_MAX_BACKOFF.
+
+A product url failing on its own (404, 410, no price in the page) is skipped with the same exponential backoff,
+without affecting the other pages of its store. Other errors (i.e. a bug parsing the page) tell nothing about the
+store nor the page: they're recorded as neither.
+"""
+import threading
+import time
+from urllib.parse import urlparse
+
+import requests
+
+from pricealerts import settings
+from pricealerts.common.errors import ItemNotLoadedError
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class CircuitOpenError(Exception):
+    """
+    Indicates that a product page was not requested because its host or url is failing
+    """
+
+    def __init__(self, message):
+        self.message = message
+
+
+def is_url_failure(error):
+    """
+    Tell failures of a single product page apart from failures of its whole store
+    :param error: The exception raised while loading the page
+    :return: True if only the page is failing, False otherwise
+    """
+    return isinstance(error, ItemNotLoadedError) and (error.status_code is None or error.status_code in (404, 410))
+
+
+def is_store_failure(error):
+    """
+    :param error: The exception raised while loading the page
+    :return: True if the store of the page is failing: connection error, timeout, 403, 429, 5xx
+    """
+    if isinstance(error, ItemNotLoadedError):
+        return not is_url_failure(error)
+    return isinstance(error, requests.RequestException)
+
+
+class CircuitBreaker(object):
+    """
+    Breaker of one host
+    """
+
+    def __init__(self, threshold, backoff, max_backoff):
+        self.threshold = threshold
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.state = CLOSED
+        self.failures = 0
+        self.trips = 0
+        self.retry_at = None
+        self.probing = False
+
+    def allow(self, now):
+        if self.state == CLOSED:
+            return True
+        if self.state == OPEN and now >= self.retry_at:
+            self.state = HALF_OPEN
+        if self.state == HALF_OPEN and not self.probing:
+            self.probing = True
+            return True
+        return False
+
+    def release(self):
+        """
+        Give back the probe allowed but not requested, the next page of the host is the probe
+        """
+        if self.state == HALF_OPEN:
+            self.probing = False
+
+    def record_success(self):
+        self.state = CLOSED
+        self.failures = 0
+        self.trips = 0
+        self.retry_at = None
+        self.probing = False
+
+    def record_failure(self, now):
+        self.failures += 1
+        self.probing = False
+        if self.state == HALF_OPEN or self.failures >= self.threshold:
+            self.trips += 1
+            self.state = OPEN
+            self.retry_at = now + min(self.backoff * 2 ** (self.trips - 1), self.max_backoff)
+
+    def json(self, now):
+        return {
+            'state': self.state,
+            'failures': self.failures,
+            'trips': self.trips,
+            'retry_in': round(max(0.0, self.retry_at - now), 1) if self.retry_at is not None else None
+        }
+
+
+class BreakerRegistry(object):
+    """
+    Circuit breakers of every host and negative cache of every url
+    """
+
+    def __init__(self, threshold=None, backoff=None, max_backoff=None, url_backoff=None, clock=time.monotonic):
+        """
+        :param threshold: Failures in a row opening a host, defaults to SCRAPER_BREAKER_THRESHOLD
+        :param backoff: Seconds a host stays open after its first trip, defaults to SCRAPER_BREAKER_BACKOFF
+        :param max_backoff: Maximum seconds a host or url is skipped, defaults to SCRAPER_BREAKER_MAX_BACKOFF
+        :param url_backoff: Seconds a failing url is skipped after its first failure, defaults to
+        SCRAPER_URL_BACKOFF
+        """
+        self.threshold = threshold or settings.SCRAPER_BREAKER_THRESHOLD
+        self.backoff = backoff or settings.SCRAPER_BREAKER_BACKOFF
+        self.max_backoff = max_backoff or settings.SCRAPER_BREAKER_MAX_BACKOFF
+        self.url_backoff = url_backoff or settings.SCRAPER_URL_BACKOFF
+        self.clock = clock
+        self.lock = threading.Lock()
+        self.breakers = {}
+        self.failing_urls = {}  # url -> (failures in a row, time of the next retry)
+
+    def _breaker(self, host):
+        # Must be called with the lock held
+        breaker = self.breakers.get(host)
+        if breaker is None:
+            breaker = self.breakers[host] = CircuitBreaker(self.threshold, self.backoff, self.max_backoff)
+        return breaker
+
+    def allow(self, url):
+        """
+        Check if a product page can be requested
+        :raise CircuitOpenError: If the page or its store is failing
+        """
+        now = self.clock()
+        with self.lock:
+            failing = self.failing_urls.get(url)
+            if failing is not None and now < failing[1]:
+                raise CircuitOpenError('Product page failing, retried in {:.0f}s'.format(failing[1] - now))
+
+            host = urlparse(url).netloc
+            if not self._breaker(host).allow(now):
+                raise CircuitOpenError('Store {} failing, its circuit is open'.format(host))
+
+    def release(self, url):
+        """
+        Tell a product page allowed won't be requested after all, i.e. dropped at the deadline of a cycle
+        """
+        with self.lock:
+            breaker = self.breakers.get(urlparse(url).netloc)
+            if breaker is not None:
+                breaker.release()
+
+    def record_success(self, url):
+        with self.lock:
+            self._breaker(urlparse(url).netloc).record_success()
+            self.failing_urls.pop(url, None)
+
+    def record_failure(self, url, error):
+        """
+        :param error: The exception raised while loading the page
+        """
+        now = self.clock()
+        with self.lock:
+            breaker = self._breaker(urlparse(url).netloc)
+            if is_url_failure(error):
+                # The store answered, only this page is broken
+                breaker.record_success()
+                failures = self.failing_urls.get(url, (0, None))[0] + 1
+                backoff = min(self.url_backoff * 2 ** (failures - 1), self.max_backoff)
+                self.failing_urls[url] = (failures, now + backoff)
+            elif is_store_failure(error):
+                breaker.record_failure(now)
+            else:
+                # Neither the store nor the page: a probe ending this way is given back to the next page
+                breaker.release()
+
+    def is_open(self, url):
+        """
+        :return: True if the store of url is failing and its pages aren't requested
+        """
+        with self.lock:
+            breaker = self.breakers.get(urlparse(url).netloc)
+            return breaker is not None and breaker.state == OPEN
+
+    def call(self, url, load, *args):
+        """
+        Load a product page unless it or its store is failing, and record the outcome
+        :param url: The product page url
+        :param load: Callable loading the page, called with args
+        :return: What load returns
+        :raise CircuitOpenError: If the page wasn't requested
+        """
+        self.allow(url)
+        try:
+            result = load(*args)
+        except Exception as ex:
+            self.record_failure(url, ex)
+            raise
+        self.record_success(url)
+        return result
+
+    def stats(self):
+        now = self.clock()
+        with self.lock:
+            return {
+                'hosts': dict((host, breaker.json(now)) for host, breaker in self.breakers.items()
+                              if breaker.state != CLOSED or breaker.failures),
+                'failing_urls': len([1 for failures, retry_at in self.failing_urls.values() if retry_at > now])
+            }
+
+
+breakers = BreakerRegistry()
@@ -0,0 +1,166 @@
+# -*- coding: utf-8 -*-
+"""
+utils/extractors.py
+
+Per-store extraction rules for product pages.
+
+Every StoreModel says where its prices are published through its tag_name and query_string (a JSON object with the
+attributes of the price tag). The registry compiles those rules once per store and keeps them in memory; a rule is
+compiled again when the store row changes. Only when the store's rule doesn't match the page the generic rules
+below are tried, so a misconfigured store still gets its prices loaded while it's fixed.
+"""
+import json
+import logging
+import re
+import threading
+
+from pricealerts.common.errors import ItemNotLoadedError
+
+# Compiled once, used for every product page
+PRICE_PATTERN = re.compile(r'''
+        # don't match beginning of string, the price can start anywhere
+(\d+\.\d+)  # try to match float numbers
+\D*         # optional separator is any number of non-digits
+(\d+\.\d+)? # optional price boundary, try to match float numbers is a price range, ie: 45.00 - 55.12
+''', re.VERBOSE)
+
+# Rules tried, in order, when the store's rule doesn't find the price: ebay.com, johnlewis.com and aria labels
+GENERIC_RULES = [
+    ('span', {'itemprop': 'price'}),
+    ('p', {'class': 'price price--large'}),
+    ('span', {'aria-label': re.compile('price')}),
+]
+
+
+def parse_price(text):
+    """
+    Find the first price in a text
+    :param text: The text of the price tag, i.e: '£45.00 - £55.12'
+    :return: The price as a float, None if the text has no price
+    """
+    price = PRICE_PATTERN.search(text.strip())
+    return float(price.group(1)) if price is not None else None
+
+
+class PriceExtractor(object):
+    """
+    Compiled extraction rule of a store
+    """
+
+    def __init__(self, tag_name=None, attrs=None, fallbacks=GENERIC_RULES, parser=None):
+        """
+        :param tag_name: Name of the tag holding the price, i.e: 'p'
+        :param attrs: Attributes of the tag holding the price, i.e: {'class': 'price price--large'}
+        :param fallbacks: (tag_name, attrs) rules tried when this one doesn't match the page
+        :param parser: Name of the parser backend for the store's pages, None to use the HTML_PARSER_BACKEND setting
+        """
+        self.tag_name = tag_name
+        self.attrs = attrs or {}
+        self.fallbacks = fallbacks
+        self.parser = parser
+
+    @classmethod
+    def from_store(cls, store):
+        """
+        Compile the rule of a StoreModel
+        :param store: The store
+        :return: The PriceExtractor of the store
+        """
+        try:
+            attrs = json.loads(store.query_string) if store.query_string else {}
+        except ValueError:
+            logging.getLogger('root').error('Store {} has an invalid query string: {}'.format(store.name,
+                                                                                            store.query_string))
+            attrs = {}
+
+        return cls(store.tag_name, attrs, parser=store.parser_backend)
+
+    def rules(self):
+        """
+        :return: The (tag_name, attrs) rules of the extractor, in the order they are tried
+        """
+        rules = [(self.tag_name, self.attrs)] if self.tag_name else []
+        return rules + list(self.fallbacks)
+
+    def find_price_element(self, soup):
+        if self.tag_name:
+            element = soup.find(self.tag_name, attrs=self.attrs)
+            if element is not None:
+                return element
+
+        for tag_name, attrs in self.fallbacks:
+            element = soup.find(tag_name, attrs=attrs)
+            if element is not None:
+                if self.tag_name:
+                    logging.getLogger('root').warning(
+                        'Price found with the generic rule {} {}, not with the store rule {} {}'.format(
+                            tag_name, attrs, self.tag_name, self.attrs))
+                return element
+
+        return None
+
+    def extract(self, soup):
+        """
+        Extract the product data from a parsed product page
+        :param soup: The BeautifulSoup of the page
+        :return: A (name, price, image) tuple
+        """
+        element = self.find_price_element(soup)
+        if element is None:
+            raise ItemNotLoadedError('Price not found in the product page')
+        price = parse_price(element.text)
+
+        name = soup.find(name="title").string
+        if name is not None:
+            # A plain str, the NavigableString keeps the whole tree alive and can't be sent to the parse processes
+            name = str(name)
+
+        # item image for johnlewis.com
+        image = soup.find("img", attrs={'alt': lambda alt: alt is not None and name is not None and name in alt})
+        if image is not None:
+            image = image.get('src')
+
+        return name, price, image
+
+
+class ExtractorRegistry(object):
+    """
+    Compiled PriceExtractor of every store, keyed by store id.
+    An extractor is compiled again when the store's tag_name or query_string change, even if the row was changed
+    from another process.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.extractors = {}
+        self.default = PriceExtractor()
+
+    def get(self, store):
+        """
+        :param store: A StoreModel, None if the item's store is unknown
+        :return: The store's PriceExtractor, or the generic one if store is None
+        """
+        if store is None:
+            return self.default
+
+        signature = (store.tag_name, store.query_string, store.parser_backend)
+        with self.lock:
+            cached = self.extractors.get(store.id)
+            if cached is not None and cached[0] == signature:
+                return cached[1]
+
+        extractor = PriceExtractor.from_store(store)
+        with self.lock:
+            self.extractors[store.id] = (signature, extractor)
+        return extractor
+
+    def invalidate(self, store_id):
+        with self.lock:
+            self.extractors.pop(store_id, None)
+
+    def clear(self):
+        with self.lock:
+            self.extractors.clear()
+
+
+extractor_registry = ExtractorRegistry()
@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+"""
+utils/fingerprint.py
+
+Content fingerprints of product pages.
+
+Most product pages change between checks only in their ads and tracking markup. The fingerprint is a CRC-32 of the
+page title and of the SCRAPER_FINGERPRINT_WINDOW bytes starting at the marker of the store's rule (its most selective
+attribute, i.e: class="price price--large"), so a change of the product image alone isn't noticed until the title or
+the price change. When the store has no rule, the rule is a regular expression, or the page has no title or marker,
+the whole body is hashed instead. A page whose fingerprint didn't change since the last check isn't parsed again.
+"""
+import zlib
+
+from pricealerts import settings
+
+
+def rule_marker(attrs):
+    """
+    Bytes locating the tag of a rule in a page
+    :param attrs: Attributes of the rule
+    :return: The attribute of the rule with the longest value, i.e: b'class="price price--large"', None if the rule
+    has no attributes or has regular expressions
+    """
+    if not attrs or any(hasattr(value, 'pattern') for value in attrs.values()):
+        return None
+    name, value = max(attrs.items(), key=lambda attr: len(attr[1]))
+    return '{}="{}"'.format(name, value).encode('utf-8')
+
+
+def page_fingerprint(html_doc, extractor, window=None):
+    """
+    :param html_doc: The product page, as bytes
+    :param extractor: PriceExtractor of the item's store
+    :param window: Bytes hashed after the price marker, defaults to the SCRAPER_FINGERPRINT_WINDOW setting
+    :return: The fingerprint, as a string
+    """
+    window = window or settings.SCRAPER_FINGERPRINT_WINDOW
+    marker = rule_marker(extractor.attrs) if extractor.tag_name else None
+
+    if marker is not None:
+        position = html_doc.find(marker)
+        title_start = html_doc.find(b'<title')
+        title_end = html_doc.find(b'</title>', title_start)
+        if position >= 0 and title_start >= 0 and title_end >= 0:
+            crc = zlib.crc32(marker)
+            crc = zlib.crc32(html_doc[title_start:title_end], crc)
+            crc = zlib.crc32(html_doc[position:position + window], crc)
+            return 'region:{:08x}'.format(crc)
+
+    return 'body:{:08x}'.format(zlib.crc32(html_doc))
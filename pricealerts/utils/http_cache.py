@@ -0,0 +1,164 @@
+# -*- coding: utf-8 -*-
+"""
+utils/http_cache.py
+
+Conditional-GET cache for product pages.
+
+For every product url it keeps the ETag / Last-Modified validators returned by the store, together with the data
+parsed from that version of the page. The next check sends them back as If-None-Match / If-Modified-Since, and
+when the store answers 304 Not Modified the cached data is returned without downloading or parsing the page again.
+Stores that don't send validators still get the content fingerprint of their pages cached (utils/fingerprint.py):
+a downloaded page with the same fingerprint as the last one isn't parsed again either.
+The cache is kept in memory, read by the fetch threads of the price-check engine. The clock process loads it from
+the database when it starts (HttpValidatorModel), and saves the pages changed after every cycle: it survives restarts
+and new dynos. Many clock processes each keep their own copy, only reloaded when they start; an entry made stale by
+another process only costs a full download, the validators and fingerprint still match the data cached with them.
+"""
+import logging
+import threading
+
+
+class ValidatorCache(object):
+    """
+    HTTP validators and parsed data of product pages, keyed by url
+    """
+
+    def __init__(self, persistent=False):
+        """
+        :param persistent: Load and save the cache in the database, else it's only kept in memory
+        """
+        self.persistent = persistent
+        self.lock = threading.Lock()
+        self.entries = {}
+        self.changed = set()  # Urls stored or forgotten since the last save
+        self.hits = 0  # Requests sent with validators
+        self.misses = 0  # Requests sent without validators, the page was never seen or had no validators
+        self.not_modified = 0  # 304 responses answered from the cache
+        self.unchanged = 0  # 200 responses answered from the cache, their fingerprint didn't change
+
+    def request_headers(self, url):
+        """
+        Conditional request headers for url
+        :param url: The product page url
+        :return: A dict with the If-None-Match and If-Modified-Since headers, empty if url has no validators
+        """
+        with self.lock:
+            entry = self.entries.get(url)
+            if entry is None or not (entry.get('etag') or entry.get('last_modified')):
+                self.misses += 1
+                return {}
+
+            self.hits += 1
+            headers = {}
+            if entry.get('etag'):
+                headers['If-None-Match'] = entry['etag']
+            if entry.get('last_modified'):
+                headers['If-Modified-Since'] = entry['last_modified']
+            return headers
+
+    def get(self, url):
+        """
+        Data cached for url, to be used when the store answers 304 Not Modified
+        :param url: The product page url
+        :return: The cached (name, price, image) tuple, None if url isn't cached
+        """
+        with self.lock:
+            entry = self.entries.get(url)
+            if entry is None:
+                return None
+
+            self.not_modified += 1
+            return tuple(entry['data'])
+
+    def get_unchanged(self, url, fingerprint):
+        """
+        Data cached for url, to be used when the downloaded page has the same fingerprint as the cached one
+        :param url: The product page url
+        :param fingerprint: Fingerprint of the downloaded page
+        :return: The cached (name, price, image) tuple, None if url isn't cached or its page changed
+        """
+        with self.lock:
+            entry = self.entries.get(url)
+            if entry is None or entry.get('fingerprint') != fingerprint:
+                return None
+
+            self.unchanged += 1
+            return tuple(entry['data'])
+
+    def store(self, url, headers, data, fingerprint=None):
+        """
+        Remember the validators of a product page response and the data parsed from it
+        :param url: The product page url
+        :param headers: The response headers
+        :param data: The (name, price, image) tuple parsed from the response
+        :param fingerprint: Content fingerprint of the response, None if it wasn't computed
+        """
+        etag = headers.get('ETag')
+        last_modified = headers.get('Last-Modified')
+
+        with self.lock:
+            if not etag and not last_modified and fingerprint is None:
+                # The store doesn't support conditional requests for this page
+                if self.entries.pop(url, None) is not None:
+                    self.changed.add(url)
+                return
+
+            self.entries[url] = {'etag': etag, 'last_modified': last_modified, 'fingerprint': fingerprint,
+                                 'data': list(data)}
+            self.changed.add(url)
+
+    def load(self):
+        """
+        Load the cache from the database, from the thread owning the database session
+        """
+        if not self.persistent:
+            return
+
+        # Imported here, the models use this module
+        from pricealerts.models import HttpValidatorModel
+        try:
+            entries = HttpValidatorModel.load_entries()
+        except Exception as ex:
+            logging.getLogger('root').error('HTTP cache not loaded: {}'.format(str(ex)))
+            return
+
+        with self.lock:
+            # The pages stored meanwhile are newer
+            entries.update((url, self.entries.get(url)) for url in self.changed)
+            self.entries = {url: entry for url, entry in entries.items() if entry is not None}
+
+    def save(self):
+        """
+        Save the pages stored or forgotten since the last save in the database, from the thread owning the database
+        session
+        """
+        if not self.persistent:
+            return
+
+        from pricealerts.models import HttpValidatorModel
+        with self.lock:
+            changed, self.changed = self.changed, set()
+            entries = {url: self.entries.get(url) for url in changed}
+
+        if entries and not HttpValidatorModel.save_entries(entries):
+            # Saved with the next ones
+            with self.lock:
+                self.changed.update(changed)
+
+    def clear(self):
+        with self.lock:
+            self.entries = {}
+            self.changed = set()
+
+    def stats(self):
+        with self.lock:
+            return {
+                'entries': len(self.entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'not_modified': self.not_modified,
+                'unchanged': self.unchanged
+            }
+
+
+validator_cache = ValidatorCache(persistent=True)
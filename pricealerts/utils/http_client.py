@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+"""
+utils/http_client.py
+
+Process-wide HTTP client used for every outbound call: product pages, store discovery and the Mailgun API.
+
+All the calls share one requests Session per process, so TCP+TLS connections to the same host are kept alive and
+reused instead of opened for every request. The session is created lazily and again after a fork, so every gunicorn
+worker and the clock process get their own connection pools.
+"""
+import os
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from pricealerts import settings
+
+
+class PooledSession(requests.Session):
+    """
+    requests Session with connection pools sized from the settings and a default timeout for every request
+    """
+
+    def __init__(self, pool_connections=None, pool_maxsize=None, timeout=None):
+        """
+        :param pool_connections: Number of hosts with a pool of connections kept alive
+        :param pool_maxsize: Connections kept alive per host
+        :param timeout: Default (connect, read) timeout in seconds, used when a request doesn't set one
+        """
+        super(PooledSession, self).__init__()
+        self.timeout = timeout or (settings.HTTP_CONNECT_TIMEOUT, settings.HTTP_READ_TIMEOUT)
+
+        adapter = HTTPAdapter(pool_connections=pool_connections or settings.HTTP_POOL_CONNECTIONS,
+                              pool_maxsize=pool_maxsize or settings.HTTP_POOL_MAXSIZE)
+        self.mount('http://', adapter)
+        self.mount('https://', adapter)
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault('timeout', self.timeout)
+        return super(PooledSession, self).request(method, url, **kwargs)
+
+    def connection_stats(self):
+        """
+        Connection reuse statistics of the pools currently kept alive
+        :return: A dict with the number of requests sent, connections opened and requests that reused a connection
+        """
+        requests_sent = connections = 0
+        for adapter in set(self.adapters.values()):
+            pools = adapter.poolmanager.pools
+            for key in pools.keys():
+                pool = pools.get(key)
+                if pool is not None:
+                    requests_sent += pool.num_requests
+                    connections += pool.num_connections
+
+        return {
+            'requests': requests_sent,
+            'connections': connections,
+            'reused': max(0, requests_sent - connections)
+        }
+
+
+_lock = threading.Lock()
+_session = None
+_session_pid = None
+
+
+def session():
+    """
+    The session of the current process, created on first use
+    :return: A PooledSession
+    """
+    global _session, _session_pid
+
+    with _lock:
+        if _session is None or _session_pid != os.getpid():
+            # Connections can't be shared with the parent process after a fork
+            _session = PooledSession()
+            _session_pid = os.getpid()
+        return _session
+
+
+def get(url, **kwargs):
+    return session().get(url, **kwargs)
+
+
+def post(url, **kwargs):
+    return session().post(url, **kwargs)
+
+
+def stats():
+    return session().connection_stats()
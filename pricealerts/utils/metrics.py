@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+"""
+utils/metrics.py
+
+Metrics of the clock process: every component registers a callable returning its counters, and a snapshot of all of
+them is saved in the database (MetricsSnapshotModel) after every price-check cycle. Many clock processes can run on
+their own dynos: every one of them keeps its own row, and the web process serves the snapshots of all of them with
+their totals to the admins (views/admin.py).
+
+The worker process delivering the notifications (delivery_worker.py) saves its own snapshot, outbox depth and delivery
+latency, under the delivery component.
+"""
+import datetime
+import logging
+import numbers
+import os
+import socket
+import threading
+
+from pricealerts.models import MetricsSnapshotModel
+
+
+def process_name():
+    """
+    :return: Name of the process saving the snapshots: the Heroku dyno (i.e: clock.1), kept across restarts, or the
+    host and pid
+    """
+    return os.environ.get('DYNO') or '{}:{}'.format(socket.gethostname(), os.getpid())
+
+
+def aggregate(snapshots):
+    """
+    Merge the snapshots of many processes: the integer counters are summed, the other numbers (durations, latency
+    percentiles, ratios) keep their maximum and the other values are left out
+    :param snapshots: List of snapshots, or of dicts nested in them
+    :return: The merged dict
+    """
+    totals = {}
+    for key in set(key for snapshot in snapshots for key in snapshot):
+        values = [snapshot[key] for snapshot in snapshots if snapshot.get(key) is not None]
+        if not values:
+            continue
+        if all(isinstance(value, dict) for value in values):
+            totals[key] = aggregate(values)
+        elif all(isinstance(value, numbers.Integral) and not isinstance(value, bool) for value in values):
+            totals[key] = sum(values)
+        elif all(isinstance(value, numbers.Real) and not isinstance(value, bool) for value in values):
+            totals[key] = max(values)
+    return totals
+
+
+class MetricsRegistry(object):
+    def __init__(self, component=None):
+        """
+        :param component: Name of the snapshots in the database, i.e: checker, None to keep them only in memory
+        """
+        self.component = component
+        self.lock = threading.Lock()
+        self.sources = {}
+
+    def register(self, name, source):
+        """
+        :param name: Name of the metrics in the snapshot, i.e: breakers
+        :param source: Callable returning the metrics as a JSON serializable dict
+        """
+        with self.lock:
+            self.sources[name] = source
+
+    def snapshot(self):
+        with self.lock:
+            sources = dict(self.sources)
+
+        snapshot = {'updated': datetime.datetime.utcnow().isoformat()}
+        for name, source in sources.items():
+            try:
+                snapshot[name] = source()
+            except Exception as ex:
+                logging.getLogger('root').error('Metrics {} not collected: {}'.format(name, str(ex)))
+        return snapshot
+
+    def save(self):
+        """
+        Save a snapshot of the metrics as the one of this process
+        :return: The snapshot
+        """
+        snapshot = self.snapshot()
+        if self.component is not None:
+            MetricsSnapshotModel.save(self.component, process_name(), snapshot)
+        return snapshot
+
+    def load(self):
+        """
+        :return: dict with the last snapshot of every process running, by process, and their totals. None if no
+        process saved a snapshot lately.
+        """
+        if self.component is None:
+            return None
+
+        processes = MetricsSnapshotModel.load(self.component)
+        if not processes:
+            return None
+        return {
+            'updated': max(snapshot['updated'] for snapshot in processes.values()),
+            'totals': aggregate([{key: value for key, value in snapshot.items() if key != 'updated'}
+                                 for snapshot in processes.values()]),
+            'processes': processes
+        }
+
+
+metrics = MetricsRegistry('checker')
+delivery_metrics = MetricsRegistry('delivery')
@@ -1,9 +1,11 @@
 # -*- coding: utf-8 -*-
+import json
 import logging
 import os
+import re
 import sys
 import smtplib
-import requests
+import threading
 from email.message import EmailMessage
 import email.utils
 
@@ -11,16 +13,61 @@ from twilio.base.exceptions import TwilioRestException
 
 sys.path.insert(0, os.path.dirname(os.path.dirname((os.path.abspath(__file__)))))
 
+from twilio.http.http_client import TwilioHttpClient
 from twilio.rest import Client
 from pricealerts.settings import env
+from pricealerts.utils import http_client
+from pricealerts.utils.smtp_pool import SMTPConnectionPool
+
+def personalize(text, variables):
+    """
+    Replace the %recipient.<name>% placeholders of a batch email as Mailgun does
+    :param text: Subject or body of the email
+    :param variables: The recipient's variables
+    """
+    return re.sub(r'%recipient\.(\w+)%', lambda match: str(variables.get(match.group(1), '')), text)
+
 
 class NotificationDispatcher(object):
+    _twilio_client = None
+    _smtp_pool = None
+    _lock = threading.Lock()
+
+    @classmethod
+    def twilio_client(cls):
+        """
+        Twilio client shared by every SMS sent from this process, keeping its connections alive
+        """
+        if cls._twilio_client is None:
+            cls._twilio_client = Client(
+                env('ACCOUNT_SID'),
+                env('AUTH_TOKEN'),
+                http_client=TwilioHttpClient(pool_connections=True))
+        return cls._twilio_client
+
+    @classmethod
+    def smtp_pool(cls, secure=None, timeout=env('EMAIL_SEND_TIMEOUT', default=10)):
+        """
+        SMTP connection pool shared by every email sent from this process through the SMTP server
+        :param secure: (keyfile, certfile) arguments of STARTTLS, used by the connections of the pool once it's created
+        """
+        with cls._lock:
+            if cls._smtp_pool is None:
+                use_ssl = bool(env('SMTP_SSL', default=True))
+                cls._smtp_pool = SMTPConnectionPool(
+                    env('SMTP_SERVER'),
+                    int(env('SMTP_PORT', default=0)) or smtplib.SMTP_PORT,
+                    username=env('SMTP_USER', default=None),
+                    password=env('SMTP_PASS', default=None),
+                    secure=secure,
+                    timeout=int(timeout),
+                    factory=smtplib.SMTP_SSL if use_ssl else smtplib.SMTP)
+            return cls._smtp_pool
+
     @classmethod
     def send_sms(cls, from_name, to_name, to_phone, text):
         try:
-            client = Client(
-                env('ACCOUNT_SID'),
-                env('AUTH_TOKEN'))
+            client = cls.twilio_client()
 
             message = client.messages.create(
                 body='\nFrom: {}\nTo: {}\n{}'.format(from_name, to_name, text),
@@ -41,7 +88,7 @@ class NotificationDispatcher(object):
         Docs: http://blog.tecladocode.com/learn-python-send-emails/
 
         """
-        response = requests.post(
+        response = http_client.post(
             env('API_BASE_URL'),
             auth=("api", env('API_KEY')),
             data={"from": "{} <{}>".format(env('BRAND_NAME') + " - " + env('PRODUCT_NAME'), env('EMAIL_FROM')),
@@ -60,39 +107,62 @@ class NotificationDispatcher(object):
             msg['Date'] = email.utils.localtime()
             msg.set_content(message)
 
-            username = env('SMTP_USER', default=None)
-            password = env('SMTP_PASS', default=None)
-            port = int(env('SMTP_PORT', default=None))
-            if not port:
-                port = smtplib.SMTP_PORT
-
             try:
-                if bool(env('SMTP_SSL', default=True)) == True:
-                    smtp = smtplib.SMTP_SSL(env('SMTP_SERVER'), port, timeout=int(timeout))
-
-                else:
-                    smtp = smtplib.SMTP(env('SMTP_SERVER'), port, timeout=int(timeout))
-
-                if username:
-                    if secure is not None:
-                        smtp.ehlo()
-                        smtp.starttls(*secure)
-                        smtp.ehlo()
-                    smtp.login(username, password)
-                smtp.send_message(msg)
-                smtp.quit()
+                # The authenticated sessions are kept alive and reused by the next emails
+                cls.smtp_pool(secure, timeout).send_message(msg)
             except Exception as ex:
                 logging.getLogger('root').error('Error sending email to users using SMTP server.\n{}'.format(str(ex)))
                 return False
 
+        return True
 
 
-        return True
+    @classmethod
+    def send_batch_email(cls, subject, message, recipients):
+        """
+        Send the same email to many recipients with a single Mailgun request (batch sending). Mailgun sends every
+        recipient its own email, replacing the %recipient.<name>% placeholders with the recipient's variables.
+        If Mailgun fails, the emails are personalized here and sent one by one with the SMTP server.
+        Docs: https://documentation.mailgun.com/en/latest/user_manual.html#batch-sending
+        :param subject: The subject, may hold placeholders
+        :param message: The html body, may hold placeholders
+        :param recipients: dict mapping the email address of every recipient to its variables, at most
+        MAILGUN_BATCH_LIMIT of them
+        :return: The addresses the email wasn't sent to
+        """
+        sender = "{} <{}>".format(env('BRAND_NAME') + " - " + env('PRODUCT_NAME'), env('EMAIL_FROM'))
+        response = http_client.post(
+            env('API_BASE_URL'),
+            auth=("api", env('API_KEY')),
+            data={"from": sender,
+                  "to": list(recipients),
+                  "subject": subject,
+                  "html": message,
+                  "recipient-variables": json.dumps(recipients)
+                  })
+        if response.status_code == 200:
+            return []
 
+        failed = []
+        for address, variables in recipients.items():
+            msg = EmailMessage()
+            msg['From'] = sender
+            msg['To'] = address
+            msg['Subject'] = personalize(subject, variables)
+            msg['Date'] = email.utils.localtime()
+            msg.set_content(personalize(message, variables))
+
+            try:
+                cls.smtp_pool().send_message(msg)
+            except Exception as ex:
+                logging.getLogger('root').error(
+                    'Error sending email to {} using SMTP server.\n{}'.format(address, str(ex)))
+                failed.append(address)
+        return failed
 
     @classmethod
     def send_test_email(cls):
-        return requests.post(
+        return http_client.post(
             env('API_BASE_URL'),
             auth=("api", env('API_KEY')),
             data={"from": env('EMAIL_FROM'),
@@ -0,0 +1,197 @@
+# -*- coding: utf-8 -*-
+"""
+utils/parsers.py
+
+HTML parser backends used to extract the product data from the pages.
+
+- 'html.parser': BeautifulSoup with the parser of the standard library, the slowest one but always available.
+- 'lxml': BeautifulSoup with the lxml parser.
+- 'selector': lxml tree queried with the store's rule compiled to XPath, no BeautifulSoup tree is built.
+
+The backend is chosen for the whole deployment with the HTML_PARSER_BACKEND setting, and a store can override it
+with its parser_backend column. The lxml based backends fall back to 'html.parser' if lxml isn't installed.
+
+Downloaded pages are parsed by parse_item_page, which the price-check engine runs in a pool of processes so the
+parsing isn't serialized by the GIL of the clock process.
+"""
+import logging
+import threading
+
+from bs4 import BeautifulSoup, SoupStrainer
+
+from pricealerts import settings
+from pricealerts.common.errors import ItemNotLoadedError
+from pricealerts.utils.extractors import parse_price
+from pricealerts.utils.http_cache import validator_cache
+
+try:
+    from lxml import etree, html as lxml_html
+except ImportError:  # pragma: no cover
+    etree = lxml_html = None
+
+EXSLT_REGEXP_NS = {'re': 'http://exslt.org/regular-expressions'}
+
+
+class SoupBackend(object):
+    """
+    Build a BeautifulSoup tree of the tags that may hold the product data and let the extractor search it
+    """
+
+    def __init__(self, name, features):
+        self.name = name
+        self.features = features
+        self.strainer = SoupStrainer(name=['title', 'p', 'span', 'img'])
+
+    def extract(self, html_doc, extractor):
+        """
+        :param html_doc: The product page, as bytes
+        :param extractor: PriceExtractor of the item's store
+        :return: A (name, price, image) tuple
+        """
+        soup = BeautifulSoup(html_doc, self.features, parse_only=self.strainer)
+        return extractor.extract(soup)
+
+    def title(self, html_doc):
+        soup = BeautifulSoup(html_doc, self.features, parse_only=SoupStrainer('title'))
+        return soup.title.string if soup.title is not None else None
+
+
+def _xpath_literal(value):
+    if '"' not in value:
+        return '"{}"'.format(value)
+    if "'" not in value:
+        return "'{}'".format(value)
+    return 'concat("{}")'.format('", \'"\', "'.join(value.split('"')))
+
+
+def rule_to_xpath(tag_name, attrs):
+    """
+    Translate a (tag_name, attrs) rule to an XPath expression matching the same tags BeautifulSoup's find() does
+    :return: The XPath expression, i.e: //p[@class="price price--large"]
+    """
+    conditions = []
+    for name, value in attrs.items():
+        if hasattr(value, 'pattern'):
+            conditions.append('re:test(@{}, {})'.format(name, _xpath_literal(value.pattern)))
+        elif name == 'class':
+            conditions.append('(@class={0} or contains(concat(" ", normalize-space(@class), " "), {1}))'.format(
+                _xpath_literal(value), _xpath_literal(' {} '.format(value))))
+        else:
+            conditions.append('@{}={}'.format(name, _xpath_literal(value)))
+
+    return '//{}{}'.format(tag_name, ''.join('[{}]'.format(condition) for condition in conditions))
+
+
+class SelectorBackend(object):
+    """
+    Parse the page with lxml and evaluate the store's rules as compiled XPath expressions
+    """
+
+    def __init__(self, name='selector'):
+        self.name = name
+        self.lock = threading.Lock()
+        # XPath expression -> compiled XPath. The extractors sent to the parse processes are copies made for every
+        # page, the expressions are compiled once per process whatever the copy.
+        self.compiled = {}
+
+    def xpaths(self, extractor):
+        expressions = [rule_to_xpath(tag_name, attrs) for tag_name, attrs in extractor.rules()]
+        with self.lock:
+            for expression in expressions:
+                if expression not in self.compiled:
+                    self.compiled[expression] = etree.XPath(expression, namespaces=EXSLT_REGEXP_NS)
+            return [self.compiled[expression] for expression in expressions]
+
+    def extract(self, html_doc, extractor):
+        document = lxml_html.fromstring(html_doc)
+
+        for xpath in self.xpaths(extractor):
+            elements = xpath(document)
+            if elements:
+                price = parse_price(elements[0].text_content())
+                break
+        else:
+            raise ItemNotLoadedError('Price not found in the product page')
+
+        name = document.findtext('.//title')
+        image = None
+        if name is not None:
+            for img in document.iterfind('.//img[@alt]'):
+                if name in img.get('alt'):
+                    image = img.get('src')
+                    break
+
+        return name, price, image
+
+    def title(self, html_doc):
+        return lxml_html.fromstring(html_doc).findtext('.//title')
+
+
+BACKENDS = {
+    'html.parser': SoupBackend('html.parser', 'html.parser'),
+    'lxml': SoupBackend('lxml', 'lxml'),
+    'selector': SelectorBackend(),
+}
+
+
+def get_backend(name=None):
+    """
+    :param name: Name of the backend, defaults to the HTML_PARSER_BACKEND setting
+    :return: The parser backend
+    """
+    name = name or settings.HTML_PARSER_BACKEND
+    if name not in BACKENDS:
+        logging.getLogger('root').error('Unknown HTML parser backend {}, using html.parser'.format(name))
+        name = 'html.parser'
+
+    if name != 'html.parser' and etree is None:
+        logging.getLogger('root').warning('lxml is not installed, using html.parser instead of {}'.format(name))
+        name = 'html.parser'
+
+    return BACKENDS[name]
+
+
+def parse_item_page(html_doc, extractor):
+    """
+    Extract the product data from a downloaded product page. It's run in the parse processes of the price-check
+    engine, so it must not touch anything but its arguments.
+    :param html_doc: The product page, as bytes
+    :param extractor: PriceExtractor of the item's store
+    :return: A (name, price, image) tuple
+    """
+    return get_backend(extractor.parser).extract(html_doc, extractor)
+
+
+class ItemPage(object):
+    """
+    Product page downloaded by ItemModel.download_item_page, waiting to be parsed
+    """
+
+    def __init__(self, url, content, extractor, headers=None, fingerprint=None):
+        self.url = url
+        self.content = content
+        self.extractor = extractor
+        self.headers = headers or {}
+        self.fingerprint = fingerprint
+
+    def parse_args(self):
+        """
+        :return: The arguments of parse_item_page for this page
+        """
+        return self.content, self.extractor
+
+    def parsed(self, data):
+        """
+        Cache the data parsed from the page, in the process which downloaded it
+        :param data: The (name, price, image) tuple returned by parse_item_page
+        :return: data
+        """
+        validator_cache.store(self.url, self.headers, data, self.fingerprint)
+        return data
+
+    def parse(self):
+        """
+        Parse the page in the current thread
+        :return: A (name, price, image) tuple
+        """
+        return self.parsed(parse_item_page(*self.parse_args()))
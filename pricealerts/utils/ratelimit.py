@@ -0,0 +1,224 @@
+# -*- coding: utf-8 -*-
+"""
+utils/ratelimit.py
+
+Politeness rate limiting of the requests sent to every store.
+
+Every host gets a token bucket: it holds up to `burst` tokens, refilled at `rate` tokens per second, and a product
+page is only requested when a token is available. The rate and burst come from the StoreModel (rate_limit and
+rate_burst columns) or the STORE_RATE_LIMIT / STORE_RATE_BURST settings, lowered further when the store's robots.txt
+asks for a Crawl-delay.
+
+The limits are those of all the clock processes together. Every process has its own buckets, so they're split between
+the CHECKER_PROCESSES processes: scale the clock processes and that setting together.
+"""
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+from urllib.robotparser import RobotFileParser
+
+from pricealerts import settings
+from pricealerts.utils import http_client
+
+
+class TokenBucket(object):
+    """
+    Token bucket allowing `rate` requests per second on average and bursts of up to `burst` requests
+    """
+
+    def __init__(self, rate, burst, clock=time.monotonic):
+        self.rate = float(rate)
+        self.burst = max(1, int(burst))
+        self.clock = clock
+        self.tokens = float(self.burst)
+        self.updated = clock()
+        self.lock = threading.Lock()
+
+    def _refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self, now=None):
+        """
+        Take a token if one is available
+        :param now: Current time of the bucket's clock
+        :return: 0 if a token was taken, otherwise the seconds until the next token is available
+        """
+        with self.lock:
+            now = self.clock() if now is None else now
+            self._refill(now)
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0.0
+            return (1 - self.tokens) / self.rate
+
+    def acquire(self):
+        """
+        Wait until a token is available and take it
+        :return: Seconds waited
+        """
+        waited = 0.0
+        delay = self.reserve()
+        while delay > 0:
+            time.sleep(delay)
+            waited += delay
+            delay = self.reserve()
+        return waited
+
+
+class HostStats(object):
+    def __init__(self):
+        self.queued = 0
+        self.requests = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def json(self):
+        return {
+            'queued': self.queued,
+            'requests': self.requests,
+            'wait_avg': round(self.wait_total / self.requests, 3) if self.requests else 0.0,
+            'wait_max': round(self.wait_max, 3)
+        }
+
+
+class HostRateLimiter(object):
+    """
+    Token buckets of every store host, plus the queue depth and wait time of their product pages
+    """
+
+    def __init__(self, rate=None, burst=None, respect_robots=None, processes=None, clock=time.monotonic):
+        """
+        :param rate: Default requests per second per host, defaults to the STORE_RATE_LIMIT setting
+        :param burst: Default burst per host, defaults to the STORE_RATE_BURST setting
+        :param respect_robots: Honour the Crawl-delay of the hosts' robots.txt, defaults to the
+        SCRAPER_RESPECT_ROBOTS setting
+        :param processes: Processes sharing the limits, every one gets its share of them. Defaults to the
+        CHECKER_PROCESSES setting.
+        """
+        self.rate = float(rate or settings.STORE_RATE_LIMIT)
+        self.burst = int(burst or settings.STORE_RATE_BURST)
+        self.processes = max(1, int(processes or settings.CHECKER_PROCESSES))
+        self.respect_robots = settings.SCRAPER_RESPECT_ROBOTS if respect_robots is None else respect_robots
+        self.clock = clock
+        self.lock = threading.Lock()
+        self.limits = {}  # host -> (rate, burst) configured for its store
+        self.crawl_delays = {}  # host -> (Crawl-delay or None, time it was read)
+        self.buckets = {}
+        self.host_stats = {}
+
+    def configure(self, host, rate=None, burst=None):
+        """
+        Set the limits of a host, usually from its StoreModel
+        :param host: The store host, i.e: www.johnlewis.com
+        :param rate: Requests per second, None for the default one
+        :param burst: Burst size, None for the default one
+        """
+        limits = (float(rate or self.rate), int(burst or self.burst))
+        with self.lock:
+            if self.limits.get(host) != limits:
+                self.limits[host] = limits
+                self.buckets.pop(host, None)
+
+    def effective_limits(self, host):
+        # Must be called with the lock held
+        rate, burst = self.limits.get(host, (self.rate, self.burst))
+        crawl_delay = self.crawl_delays.get(host, (None, None))[0]
+        if crawl_delay:
+            rate, burst = min(rate, 1.0 / crawl_delay), 1
+        return rate / self.processes, max(1, burst // self.processes)
+
+    def bucket(self, host):
+        with self.lock:
+            bucket = self.buckets.get(host)
+            if bucket is None:
+                rate, burst = self.effective_limits(host)
+                bucket = self.buckets[host] = TokenBucket(rate, burst, clock=self.clock)
+            return bucket
+
+    def reserve(self, host, now=None):
+        """
+        Take a token of the host if one is available
+        :return: 0 if the page can be requested now, otherwise the seconds until it can
+        """
+        return self.bucket(host).reserve(now)
+
+    def _stats(self, host):
+        # Must be called with the lock held
+        stats = self.host_stats.get(host)
+        if stats is None:
+            stats = self.host_stats[host] = HostStats()
+        return stats
+
+    def set_queue_depth(self, host, depth):
+        with self.lock:
+            self._stats(host).queued = depth
+
+    def record_wait(self, host, seconds):
+        """
+        Record the time a product page waited in the queue of its host before being requested
+        """
+        with self.lock:
+            stats = self._stats(host)
+            stats.requests += 1
+            stats.wait_total += seconds
+            stats.wait_max = max(stats.wait_max, seconds)
+
+    def load_robots(self, url):
+        """
+        Read the Crawl-delay of the host of url from its robots.txt
+        """
+        o = urlparse(url)
+        robots_url = '{}://{}/robots.txt'.format(o.scheme or 'http', o.netloc)
+        crawl_delay = None
+        try:
+            response = http_client.get(robots_url)
+            if response.status_code == 200:
+                parser = RobotFileParser(robots_url)
+                parser.parse(response.text.splitlines())
+                user_agent = http_client.session().headers.get('User-Agent', '*')
+                crawl_delay = parser.crawl_delay(user_agent)
+        except Exception as ex:
+            logging.getLogger('root').warning('{} not loaded: {}'.format(robots_url, str(ex)))
+
+        with self.lock:
+            self.crawl_delays[o.netloc] = (float(crawl_delay) if crawl_delay else None, self.clock())
+            self.buckets.pop(o.netloc, None)
+
+    def _robots_stale(self, host, now):
+        # Must be called with the lock held
+        loaded = self.crawl_delays.get(host)
+        return loaded is None or now - loaded[1] > settings.ROBOTS_CACHE_TTL
+
+    def prepare(self, urls):
+        """
+        Read the robots.txt of the hosts of urls not read in the last ROBOTS_CACHE_TTL seconds
+        :param urls: One url per host
+        """
+        if not self.respect_robots:
+            return
+
+        now = self.clock()
+        with self.lock:
+            stale = [url for url in urls if self._robots_stale(urlparse(url).netloc, now)]
+        if not stale:
+            return
+
+        with ThreadPoolExecutor(max_workers=min(len(stale), settings.CHECKER_MAX_WORKERS)) as executor:
+            list(executor.map(self.load_robots, stale))
+
+    def stats(self):
+        """
+        :return: A dict mapping every host to its queue depth, requests, wait times and limits
+        """
+        with self.lock:
+            stats = {}
+            for host in set(self.host_stats) | set(self.limits) | set(self.crawl_delays):
+                rate, burst = self.effective_limits(host)
+                stats[host] = dict(self._stats(host).json(), rate=rate, burst=burst)
+            return stats
+
+
+rate_limiter = HostRateLimiter()
@@ -0,0 +1,213 @@
+# -*- coding: utf-8 -*-
+"""
+utils/smtp_pool.py
+
+Pool of authenticated SMTP connections for the fallback email path of NotificationDispatcher.send_email.
+
+Opening an SMTP session costs a TCP and TLS handshake plus the AUTH exchange, more than sending a message. The pool
+keeps the sessions alive between messages, so a burst of emails (i.e. the outbox drained by the worker process) is
+sent over a few connections. Connections idle for a while are checked with a NOOP before being reused, connections
+idle for too long or having sent SMTP_POOL_MAX_MESSAGES messages are closed, and a message whose connection was
+dropped by the server is sent again over a new one.
+
+As the HTTP client (utils/http_client.py), the connections aren't shared with the parent process after a fork.
+"""
+import os
+import smtplib
+import threading
+import time
+
+from pricealerts import settings
+
+# Errors of a connection dropped by the server while it was idle in the pool: the message is sent over a new one
+DROPPED_ERRORS = (smtplib.SMTPServerDisconnected, ConnectionError, TimeoutError)
+
+
+class PooledConnection(object):
+    def __init__(self, smtp):
+        self.smtp = smtp
+        self.messages = 0
+        self.last_used = time.monotonic()
+
+
+class SMTPConnectionPool(object):
+    """
+    :param host: SMTP server
+    :param port: SMTP port
+    :param username: Login of the sessions, None to send without authenticating
+    :param password: Password of the sessions
+    :param use_ssl: Connect with SMTP over SSL, else with plain SMTP
+    :param secure: (keyfile, certfile) arguments of STARTTLS, None to not upgrade the plain connections
+    :param timeout: Seconds to wait for the server
+    :param max_size: Connections open at once, the senders wait for a free one beyond
+    :param check_after: Seconds idle after which a connection is checked with a NOOP before being reused
+    :param max_idle: Seconds idle after which a connection is closed instead of reused
+    :param max_messages: Messages sent over a connection before it's closed, servers limit them per session
+    :param factory: Callable opening the connections, receiving (host, port, timeout=), smtplib.SMTP_SSL or
+    smtplib.SMTP by default
+    """
+
+    def __init__(self, host, port, username=None, password=None, use_ssl=True, secure=None, timeout=10,
+                 max_size=settings.SMTP_POOL_SIZE, check_after=settings.SMTP_POOL_CHECK_AFTER,
+                 max_idle=settings.SMTP_POOL_MAX_IDLE, max_messages=settings.SMTP_POOL_MAX_MESSAGES, factory=None):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.secure = secure
+        self.timeout = timeout
+        self.check_after = check_after
+        self.max_idle = max_idle
+        self.max_messages = max_messages
+        self.factory = factory or (smtplib.SMTP_SSL if use_ssl else smtplib.SMTP)
+
+        self.lock = threading.Lock()
+        self.slots = threading.BoundedSemaphore(max_size)
+        self.idle = []  # Connections waiting for a message, the most recently used last
+        self.pid = os.getpid()
+
+        self.opened = 0
+        self.reused = 0
+        self.dropped = 0
+        self.sent = 0
+        self.failed = 0
+
+    def _connect(self):
+        smtp = self.factory(self.host, self.port, timeout=self.timeout)
+        try:
+            if self.username:
+                if self.secure is not None:
+                    smtp.ehlo()
+                    smtp.starttls(*self.secure)
+                    smtp.ehlo()
+                smtp.login(self.username, self.password)
+        except Exception:
+            self._close(smtp)
+            raise
+
+        with self.lock:
+            self.opened += 1
+        return PooledConnection(smtp)
+
+    @staticmethod
+    def _close(smtp, quit=True):
+        try:
+            if quit:
+                smtp.quit()
+            else:
+                smtp.close()
+        except Exception:
+            smtp.close()
+
+    def _healthy(self, connection):
+        try:
+            return connection.smtp.noop()[0] == 250
+        except Exception:
+            return False
+
+    def _acquire(self):
+        """
+        :return: (connection, reused) an idle connection still alive, or a new one
+        """
+        expired = []
+        connection = None
+        with self.lock:
+            if self.pid != os.getpid():
+                # Opened by the parent process
+                self.idle = []
+                self.pid = os.getpid()
+
+            now = time.monotonic()
+            while self.idle:
+                candidate = self.idle.pop()
+                if now - candidate.last_used > self.max_idle:
+                    expired.append(candidate)
+                else:
+                    connection = candidate
+                    break
+
+        for candidate in expired:
+            self._close(candidate.smtp)
+
+        if connection is not None and time.monotonic() - connection.last_used > self.check_after \
+                and not self._healthy(connection):
+            self._close(connection.smtp, quit=False)
+            with self.lock:
+                self.dropped += 1
+            connection = None
+
+        if connection is None:
+            return self._connect(), False
+        return connection, True
+
+    def _release(self, connection):
+        connection.messages += 1
+        connection.last_used = time.monotonic()
+        if connection.messages >= self.max_messages:
+            self._close(connection.smtp)
+            return
+
+        with self.lock:
+            if self.pid == os.getpid():
+                self.idle.append(connection)
+                return
+        self._close(connection.smtp, quit=False)
+
+    def send_message(self, msg):
+        """
+        Send an email over a pooled connection
+        :param msg: The email.message.Message
+        :raise smtplib.SMTPException, OSError: If the message wasn't sent
+        """
+        with self.slots:
+            while True:
+                try:
+                    connection, reused = self._acquire()
+                except Exception:
+                    with self.lock:
+                        self.failed += 1
+                    raise
+                try:
+                    connection.smtp.send_message(msg)
+                except DROPPED_ERRORS:
+                    self._close(connection.smtp, quit=False)
+                    with self.lock:
+                        self.dropped += 1
+                    if reused:
+                        # Dropped by the server while idle, the message is sent over a new connection
+                        continue
+                    with self.lock:
+                        self.failed += 1
+                    raise
+                except Exception:
+                    # The session may be left in the middle of a transaction, it isn't reused
+                    self._close(connection.smtp)
+                    with self.lock:
+                        self.failed += 1
+                    raise
+
+                with self.lock:
+                    self.sent += 1
+                    self.reused += reused
+                self._release(connection)
+                return
+
+    def close(self):
+        """
+        Close the idle connections
+        """
+        with self.lock:
+            idle, self.idle = self.idle, []
+        for connection in idle:
+            self._close(connection.smtp)
+
+    def stats(self):
+        with self.lock:
+            return {
+                'sent': self.sent,
+                'failed': self.failed,
+                'connections': self.opened,
+                'reused': self.reused,
+                'dropped': self.dropped,
+                'idle': len(self.idle)
+            }
@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+"""
+utils/streaming.py
+
+Streaming extraction of product data.
+
+Instead of downloading the whole product page and building a BeautifulSoup tree of it, the response is read in
+chunks and fed to an incremental HTML parser, which stops the download as soon as the title, the price and the image
+of the product were found. No more than SCRAPER_MAX_PAGE_BYTES are ever read from a page.
+"""
+import codecs
+from html.parser import HTMLParser
+
+from pricealerts import settings
+from pricealerts.common.errors import ItemNotLoadedError
+from pricealerts.utils.extractors import parse_price
+
+
+def attrs_match(expected, attrs):
+    """
+    Check the attributes of a tag against the attributes of a rule, the way BeautifulSoup's find() does
+    :param expected: Attributes of the rule, values are strings or compiled regular expressions
+    :param attrs: Attributes of the tag
+    :return: True if the tag matches every attribute of the rule
+    """
+    for name, value in expected.items():
+        actual = attrs.get(name)
+        if actual is None:
+            return False
+        if hasattr(value, 'search'):
+            if value.search(actual) is None:
+                return False
+        elif actual != value and not (name == 'class' and value in actual.split()):
+            return False
+    return True
+
+
+class StreamingPriceParser(HTMLParser):
+    """
+    Incremental parser looking for the title, price and image of a product page.
+    The rules of the extractor are tried in order: the store's rule first, then the generic ones. The page is
+    complete once the title, the image and a price matched by the first rule were found, otherwise it's read to the
+    end so a later tag matching a better rule isn't missed.
+    """
+
+    def __init__(self, extractor):
+        super(StreamingPriceParser, self).__init__(convert_charrefs=True)
+        self.rules = extractor.rules()
+        self.title = None
+        self.prices = {}  # rule index -> text of the first tag matched by the rule
+        self.images = []  # (alt, src) of the images seen
+        self.capture = None  # [tag name, rule index or None for the title, nesting depth, text parts]
+
+    def handle_starttag(self, tag, attrs):
+        if self.capture is not None:
+            if tag == self.capture[0]:
+                self.capture[2] += 1
+            return
+
+        if tag == 'title' and self.title is None:
+            self.capture = [tag, None, 1, []]
+        elif tag == 'img':
+            attrs = dict(attrs)
+            if attrs.get('alt') is not None:
+                self.images.append((attrs['alt'], attrs.get('src')))
+        else:
+            attrs = dict((name, value or '') for name, value in attrs)
+            for index, (tag_name, rule_attrs) in enumerate(self.rules):
+                if tag == tag_name and index not in self.prices and attrs_match(rule_attrs, attrs):
+                    self.capture = [tag, index, 1, []]
+                    break
+
+    def handle_endtag(self, tag):
+        if self.capture is None or tag != self.capture[0]:
+            return
+
+        self.capture[2] -= 1
+        if self.capture[2] == 0:
+            text = ''.join(self.capture[3])
+            if self.capture[1] is None:
+                self.title = text
+            else:
+                self.prices[self.capture[1]] = text
+            self.capture = None
+
+    def handle_data(self, data):
+        if self.capture is not None:
+            self.capture[3].append(data)
+
+    @property
+    def image(self):
+        if self.title is None:
+            return None
+        for alt, src in self.images:
+            if self.title in alt:
+                return src
+        return None
+
+    @property
+    def price_text(self):
+        """Text of the price tag matched by the first rule, None if no rule matched yet"""
+        for index in range(len(self.rules)):
+            if index in self.prices:
+                return self.prices[index]
+        return None
+
+    def complete(self):
+        return self.title is not None and 0 in self.prices and self.image is not None
+
+    def result(self):
+        price_text = self.price_text
+        if price_text is None:
+            raise ItemNotLoadedError('Price not found in the product page')
+        return self.title, parse_price(price_text), self.image
+
+
+def response_encoding(response):
+    """
+    Encoding of a product page response, utf-8 when the store doesn't say it
+    """
+    if response.encoding and 'charset' in response.headers.get('Content-Type', '').lower():
+        return response.encoding
+    return 'utf-8'
+
+
+def stream_item_data(response, extractor, max_bytes=None, chunk_size=None):
+    """
+    Read a product page response in chunks until its title, price and image are found.
+
+    :param response: A requests response, opened with stream=True
+    :param extractor: PriceExtractor of the item's store
+    :param max_bytes: Maximum bytes read from the page, defaults to the SCRAPER_MAX_PAGE_BYTES setting
+    :param chunk_size: Bytes read at once, defaults to the SCRAPER_CHUNK_SIZE setting
+    :return: A (name, price, image) tuple
+    """
+    max_bytes = max_bytes or settings.SCRAPER_MAX_PAGE_BYTES
+    chunk_size = chunk_size or settings.SCRAPER_CHUNK_SIZE
+
+    parser = StreamingPriceParser(extractor)
+    decoder = codecs.getincrementaldecoder(response_encoding(response))(errors='replace')
+    read = 0
+    try:
+        for chunk in response.iter_content(chunk_size=chunk_size):
+            chunk = chunk[:max_bytes - read]
+            read += len(chunk)
+            parser.feed(decoder.decode(chunk))
+            if parser.complete() or read >= max_bytes:
+                break
+        else:
+            parser.feed(decoder.decode(b'', final=True))
+            parser.close()
+    finally:
+        # Stops the download if the page wasn't read to the end
+        response.close()
+
+    return parser.result()
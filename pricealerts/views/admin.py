@@ -0,0 +1,59 @@
+import datetime
+
+from flask import Blueprint, abort, jsonify
+from flask_login import current_user, login_required
+
+from pricealerts.analytics import indicators
+from pricealerts.analytics.store import price_store
+from pricealerts.utils.metrics import delivery_metrics, metrics
+
+admin_bp = Blueprint('admin', __name__, url_prefix='/admin')
+
+
+@admin_bp.route('/metrics')
+@login_required
+def checker_metrics():
+    # Last snapshot saved by every clock process and their totals: price-check cycle, circuit breakers, store queues
+    # and HTTP caches
+    if not current_user.is_admin:
+        abort(403)
+
+    snapshot = metrics.load()
+    if snapshot is None:
+        abort(404)
+    return jsonify(snapshot)
+
+
+@admin_bp.route('/metrics/delivery')
+@login_required
+def delivery_metrics_view():
+    # Last snapshot saved by every worker process and their totals: outbox depth and delivery latency
+    if not current_user.is_admin:
+        abort(403)
+
+    snapshot = delivery_metrics.load()
+    if snapshot is None:
+        abort(404)
+    return jsonify(snapshot)
+
+
+@admin_bp.route('/items/<int:item_id>/indicators')
+@login_required
+def item_indicators(item_id):
+    # Price indicators of an item over the last 90 days, read from the columnar copy of the price history synced by
+    # this process
+    if not current_user.is_admin:
+        abort(403)
+
+    now = datetime.datetime.utcnow()
+    times, prices = price_store.history(item_id, now - datetime.timedelta(days=90), now)
+    if not len(times):
+        abort(404)
+    return jsonify({
+        'item_id': item_id,
+        'low_90d': int(prices.min()) / 100.0,
+        'high_90d': int(prices.max()) / 100.0,
+        'drop_from_high_7d': indicators.drop_from_high(times, prices, 7, now),
+        'drop_from_high_30d': indicators.drop_from_high(times, prices, 30, now),
+        'volatility_30d': indicators.volatility(times, prices, 30, now)
+    })
@@ -1,18 +1,43 @@
-import requests
-from bs4 import BeautifulSoup, SoupStrainer
+
 from flask import Blueprint, url_for, request, flash, render_template
 from flask_login import login_required, current_user
 from werkzeug.utils import redirect
 
 from pricealerts import StoreModel, ItemModel, AlertModel, UserModel
 from pricealerts.forms import AlertForm
-from pricealerts.models import StoreNotFoundError, ItemNotLoadedError
+from pricealerts.common.base_model import DatabaseError
+from pricealerts.db import db
+from pricealerts.models import OutboxMessageModel, StoreNotFoundError, ItemNotLoadedError
 from pricealerts.settings import env
-from pricealerts.utils.notifications import NotificationDispatcher
+from pricealerts.utils import http_client
+from pricealerts.utils.parsers import get_backend
 
 alert_blueprint = Blueprint('alerts', __name__, url_prefix='/alerts', template_folder='templates')
 
 
+def queue_notifications(alert, user, key, subject, message, sms_text):
+    """
+    Add the email, and the SMS if the alert has a phone, notifying a change of the alert to the session: they're
+    queued in the outbox by the commit saving the alert
+    :param key: Name of the change, the idempotency key of the notifications
+    """
+    OutboxMessageModel.enqueue(OutboxMessageModel.EMAIL, 'email:' + key, user_name=user.name,
+                               user_email=user.username, to_email=alert.contact_email, subject=subject,
+                               message=message)
+
+    if alert.contact_phone is not None and alert.contact_phone != "":
+        OutboxMessageModel.enqueue(OutboxMessageModel.SMS, 'sms:' + key, from_name="Pricing Alert Service",
+                                   to_phone=alert.contact_phone, to_name=user.name, text=sms_text)
+
+
+def alert_settings(alert):
+    """
+    :return: The settings of the alert told to the user when they change, as a string
+    """
+    return '{:.2f}|{}|{}|{}|{}'.format(float(alert.price_limit), alert.contact_email, alert.contact_phone or '',
+                                       alert.check_every, bool(alert.active))
+
+
 @alert_blueprint.route('/create', methods=['GET', 'POST'])
 @login_required
 def create_alert():
@@ -40,7 +65,6 @@ def create_alert():
         try:
             store = StoreModel.find_by_url(prod_url)
         except StoreNotFoundError:
-            only_title = SoupStrainer('title')
             # Find the store on Internet
             from urllib.parse import urlparse
             o = urlparse(prod_url)
@@ -51,11 +75,8 @@ def create_alert():
                 location = o.netloc
 
             store_url = o.scheme + "://" + location
-            req = requests.get(store_url)
-            html_doc = req.content
-            soup = BeautifulSoup(html_doc, 'html.parser', parse_only=only_title)
-
-            store = StoreModel(soup.title.string, store_url).save_to_db()
+            req = http_client.get(store_url)
+            store = StoreModel(get_backend().title(req.content), store_url).save_to_db()
 
         # Create the item
         item = ItemModel(prod_url, store_id=store.id)
@@ -72,28 +93,24 @@ def create_alert():
         # Create the alert
         alert = AlertModel(price_limit, item.id, user.id, check_every=check_frequency,
                    contact_email=alert_email, contact_phone=alert_phone,
-                   active=active).save_to_db()
+                   active=active)
+        db.session.add(alert)
+        # The alert id names the notifications
+        db.session.flush()
 
-        subject = "NEW ALERT CREATED from Pricing Alert Service <{}>".format(env('SMTP_USER')),
+        subject = "NEW ALERT CREATED from Pricing Alert Service <{}>".format(env('SMTP_USER'))
         message = "New Price Alert has been created for {}.<br>{} <{}> have setup this email address ({})" \
                   "to receive alerts regarding prices drops over this product. <br/>You can now seat down" \
                   "and let us do the hard work".format(item.name, user.name, user.username, alert_email)
+        queue_notifications(alert, user, 'alert-created:{}'.format(alert.id), subject, message,
+                            'New Alert for {} and price limit {} was added.'.format(item.name, alert.price_limit))
 
-        if not NotificationDispatcher.send_email(user.name, user.username, alert.contact_email,
-                                          subject=subject, message=message):
-            flash('Error sending email to {}. A notification has been '
-                  'emitted to the system administrator'.format(alert.contact_email), category='error')
-
-
-        if alert.contact_phone is not None and alert.contact_phone != "":
-            if not NotificationDispatcher.send_sms(
-                    from_name="Pricing Alert Service",
-                    to_phone=alert.contact_phone,
-                    to_name=user.name,
-                    text='New Alert for {} and price limit {} was added.'.format(alert.item.name, alert.price_limit)):
-
-                flash('Error sending SMS to {}. A notification has been '
-                      'emitted to the system administrator'.format(alert.contact_phone), category='error')
+        # The alert and its notifications are saved in the same commit, the notifications are sent by the worker
+        # process
+        try:
+            alert.save_to_db()
+        except DatabaseError as ex:
+            flash(ex.message, category='error')
 
         # After saving all data redirect to user alerts page
         return redirect(url_for('users.user_alerts'))
@@ -115,33 +132,35 @@ def edit_alert(alert_id):
     form = AlertForm(request.form)
 
     if request.method == 'POST' and form.validate():
+        previous_settings = alert_settings(alert)
+        # Version of the alert edited: every saved edit updates it, a form sent twice edits the same version
+        version = alert.updated or alert.created
         form.populate_obj(alert)
         alert.item.url=curr_url
-        alert.save_to_db()
+        # The form field isn't named after the column, populate_obj doesn't set it
+        alert.check_every = form.check_frequency.data
 
         user = UserModel.find_one(username=current_user.username)
 
-        subject = "ALERT MODIFIED from Pricing Alert Service <{}>".format(env('EMAIL_FROM')),
-        message = "New Price Alert has been updated for {}.<br>"
-        "{} <{}> have setup this email address ({}) to receive alerts regarding prices"
-        "drops over this product. <br/>"
-        "You can now seat down and let us do "
-        "the hard work".format(alert.item.name, user.name, user.username, alert.contact_email)
-
-        if not NotificationDispatcher.send_email(user.name, user.username, alert.contact_email,
-                                          subject=subject, message=message):
-            flash('Error sending email to {}. A notification has been '
-                  'emitted to the system administrator'.format(alert.contact_emaiil), category='error')
-
-        if alert.contact_phone is not None and alert.contact_phone != "":
-            if not NotificationDispatcher.send_sms(
-                    from_name="Pricing Alert Service",
-                    to_phone=alert.contact_phone,
-                    to_name=user.name,
-                    text='New Alert for {} and price limit {} was added.'.format(alert.item.name, alert.price_limit)):
-
-                flash('Error sending SMS to {}. A notification has been '
-                      'emitted to the system administrator'.format(alert.contact_phone), category='error')
+        # The change is notified once: the form sent again, or nothing changed, doesn't queue a new email
+        new_settings = alert_settings(alert)
+        key = 'alert-updated:{}:{}'.format(alert.id, version.isoformat() if version is not None else '')
+
+        subject = "ALERT MODIFIED from Pricing Alert Service <{}>".format(env('EMAIL_FROM'))
+        message = "New Price Alert has been updated for {}.<br>" \
+                  "{} <{}> have setup this email address ({}) to receive alerts regarding prices" \
+                  "drops over this product. <br/>" \
+                  "You can now seat down and let us do " \
+                  "the hard work".format(alert.item.name, user.name, user.username, alert.contact_email)
+        if new_settings != previous_settings:
+            queue_notifications(alert, user, key, subject, message,
+                                'New Alert for {} and price limit {} was added.'.format(alert.item.name,
+                                                                                       alert.price_limit))
+
+        try:
+            alert.save_to_db()
+        except DatabaseError as ex:
+            flash(ex.message, category='error')
 
         return redirect(url_for('users.user_alerts'))
 
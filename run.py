@@ -3,6 +3,7 @@ import argparse
 
 from pricealerts import create_app
 from pricealerts.db import db
+from pricealerts.migrations import upgrade_schema
 from pricealerts.models import UserModel
 
 application = create_app()
@@ -26,7 +27,7 @@ with application.app_context():
     if application.config['ENV'] == 'production':
         @application.before_first_request
         def create_all_tables():
-            db.create_all()
+            upgrade_schema()
 
             # Create initial data
             user = UserModel.find_by(username='alexmtnezf@gmail.com')
@@ -12,7 +12,7 @@ import unittest
 from mock import patch, Mock
 from pricealerts import db
 from pricealerts.common.base_model import DatabaseError
-from pricealerts.models import AlertModel, UserModel, ItemModel, StoreModel
+from pricealerts.models import AlertModel, UserModel, ItemModel, StoreModel, OutboxMessageModel
 from tests.base_test import BaseTest
 
 
@@ -53,7 +53,9 @@ class AlertTest(BaseTest):
             'active': True,
             'shared': False,
             'contact_phone': None,
-            'contact_email': 'alex@uci.cu'
+            'contact_email': 'alex@uci.cu',
+            'trigger_state': 'armed',
+            'fired_at': None
         }
         with self.app_context():
             self.user.save_to_db()
@@ -81,6 +83,104 @@ class AlertTest(BaseTest):
             self.alert.save_to_db()
             self.assertEqual(0, len(AlertModel.find_needing_update()))
 
+    def test_find_needing_update_honours_check_every(self):
+        with self.app_context():
+            self.user.save_to_db()
+            self.store.save_to_db()
+            self.item.save_to_db()
+            self.alert.check_every = 60
+            self.alert.save_to_db()
+            self.assertEqual(0, len(AlertModel.find_needing_update()))
+            self.assertEqual(1, len(AlertModel.find_needing_update(self.last_checked + datetime.timedelta(minutes=60))))
+
+    def test_claim_due(self):
+        with self.app_context():
+            self.user.save_to_db()
+            self.store.save_to_db()
+            self.item.save_to_db()
+            self.alert.save_to_db()
+
+            now = datetime.datetime.utcnow()
+            self.assertListEqual([1], [alert.id for alert in AlertModel.claim_due(now=now, lease=60)])
+            # Held by the lease
+            self.assertListEqual([], AlertModel.claim_due(now=now))
+            self.assertListEqual([], AlertModel.find_needing_update(now))
+            # Claimed again once the lease expires, i.e. the process holding it died
+            self.assertListEqual([1], [alert.id for alert in
+                                       AlertModel.claim_due(now=now + datetime.timedelta(seconds=61))])
+
+    def test_claim_due_skips_locked_alerts(self):
+        with self.app_context():
+            self.user.save_to_db()
+            self.store.save_to_db()
+            self.item.save_to_db()
+            self.alert.save_to_db()
+
+            # Another clock process is claiming the alert in its own transaction
+            other = db.engine.connect()
+            transaction = other.begin()
+            other.execute('SELECT id FROM alerts FOR UPDATE')
+            try:
+                self.assertListEqual([], AlertModel.claim_due())
+            finally:
+                transaction.rollback()
+                other.close()
+
+            self.assertListEqual([1], [alert.id for alert in AlertModel.claim_due()])
+
+    def test_find_triggered(self):
+        with self.app_context():
+            self.user.save_to_db()
+            self.store.save_to_db()
+            self.item.save_to_db()
+            self.alert.save_to_db()
+
+            self.assertListEqual([self.alert.id], [alert.id for alert in AlertModel.find_triggered([self.alert.id])])
+            self.assertListEqual([], AlertModel.find_triggered([]))
+
+            self.item.price = 21.0
+            self.item.save_to_db()
+            self.assertListEqual([], AlertModel.find_triggered())
+
+    def test_trigger_states(self):
+        with self.app_context():
+            self.user.save_to_db()
+            self.store.save_to_db()
+            self.item.save_to_db()
+            self.alert.save_to_db()
+            now = datetime.datetime.utcnow()
+
+            self.assertEqual(1, AlertModel.fire_many([self.alert], now))
+            self.assertEqual(AlertModel.FIRED, AlertModel.query.get(1).trigger_state)
+            self.assertListEqual([], AlertModel.find_triggered([1], armed_only=True))
+            # The price drop email was queued in the same commit
+            self.assertEqual(1, OutboxMessageModel.query.count())
+
+            # Still below the limit and in the cooldown
+            self.assertEqual(0, AlertModel.rearm_many([1], now, cooldown=3600))
+            # After the cooldown
+            self.assertEqual(1, AlertModel.rearm_many([1], now + datetime.timedelta(hours=2), cooldown=3600))
+            self.assertListEqual([1], [alert.id for alert in AlertModel.find_triggered([1], armed_only=True)])
+
+            # The price went back above the limit
+            AlertModel.fire_many([self.alert], now)
+            self.item.price = 21.0
+            self.item.save_to_db()
+            self.assertEqual(1, AlertModel.rearm_many([1], now, cooldown=0))
+            self.assertEqual(AlertModel.ARMED, AlertModel.query.get(1).trigger_state)
+
+    def test_due_times(self):
+        with self.app_context():
+            self.user.save_to_db()
+            self.store.save_to_db()
+            self.item.save_to_db()
+            self.alert.save_to_db()
+            self.assertDictEqual({1: self.last_checked + datetime.timedelta(minutes=10)}, AlertModel.due_times())
+
+            self.alert.active = False
+            self.alert.save_to_db()
+            self.assertDictEqual({}, AlertModel.due_times([1]))
+
     def test_load_price_change(self):
         with self.app_context():
 
@@ -102,6 +202,19 @@ class AlertTest(BaseTest):
                 self.assertEqual(None, self.alert.item.image)
                 self.assertAlmostEqual(self.alert.last_checked,datetime.datetime.utcnow(), delta=datetime.timedelta(seconds=10))
 
+    def test_mark_checked_many(self):
+        with self.app_context():
+            self.user.save_to_db()
+            self.store.save_to_db()
+            self.item.save_to_db()
+            self.alert.save_to_db()
+
+            AlertModel.mark_checked_many([self.alert])
+            self.assertEqual(0, len(AlertModel.find_needing_update()))
+            alert = AlertModel.find_by_id(self.alert.id)
+            self.assertAlmostEqual(alert.last_checked, datetime.datetime.utcnow(), delta=datetime.timedelta(seconds=10))
+            self.assertEqual(alert.last_checked + datetime.timedelta(minutes=10), alert.next_check)
+
 
 if __name__ == '__main__':
     unittest.main()
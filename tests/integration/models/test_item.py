@@ -5,9 +5,10 @@ Class tested: StoreModel
 
 Only test methods that depends on databases or work with other classes and methods of your app
 """
+import datetime
 import unittest
 from unittest.mock import patch, Mock, MagicMock
-from pricealerts.models import ItemModel, StoreModel, ItemNotLoadedError
+from pricealerts.models import ItemModel, StoreModel, ItemNotLoadedError, AlertModel, UserModel
 
 from tests.base_test import BaseTest
 
@@ -25,7 +26,7 @@ class ItemTest(BaseTest):
         mocked_response = MagicMock()
         mocked_response.status_code = 500
         mocked_response.content = 'Some extra data not important'
-        with patch('pricealerts.models.requests.get', return_value=mocked_response) as mocked_requests:
+        with patch('pricealerts.models.http_client.get', return_value=mocked_response) as mocked_requests:
             with self.assertRaises(ItemNotLoadedError):
                 self.item.load_item_data()
                 mocked_requests.assert_called_with(url='https://www.johnlewis.com/john-lewis-partners-amber-clear-swirl-bauble-orange/p3527237')
@@ -37,6 +38,23 @@ class ItemTest(BaseTest):
                 ('John Lewis & Partners Amber Clear Swirl Bauble, Orange at John Lewis & Partners', 6.00 ,None),
                               self.item.load_item_data())
 
+    def test_load_price_change_updates_item_and_alerts(self):
+        with self.app_context():
+            store = StoreModel(name='store1', url_prefix='http://johnlewis.com').save_to_db()
+            user = UserModel('Alex', 'alexmtnezf@gmail.com', '12345').save_to_db()
+            self.item.store_id = store.id
+            self.item.save_to_db()
+            alerts = [AlertModel(price_limit=limit, item_id=self.item.id, user_id=user.id,
+                                 contact_email='alex@uci.cu', last_checked=datetime.datetime(2018, 1, 1)).save_to_db()
+                      for limit in (10, 20)]
+
+            self.item.load_price_change(alerts, ('Item1', 6.0, None))
+
+            self.assertEqual(6.0, ItemModel.find_by_id(self.item.id).price)
+            for alert in alerts:
+                self.assertAlmostEqual(datetime.datetime.utcnow(), AlertModel.find_by_id(alert.id).last_checked,
+                                       delta=datetime.timedelta(seconds=10))
+
 
 if __name__ == '__main__':
     unittest.main()
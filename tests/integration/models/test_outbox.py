@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+"""
+OutboxTest class
+Class tested: OutboxMessageModel
+
+Only test methods that depends on databases or work with other classes and methods of your app
+"""
+import datetime
+import unittest
+
+from pricealerts.db import db
+from pricealerts.models import OutboxMessageModel
+from tests.base_test import BaseTest
+
+
+class OutboxTest(BaseTest):
+    def setUp(self):
+        super(OutboxTest, self).setUp()
+        self.now = datetime.datetime.utcnow()
+
+    def test_enqueue_is_idempotent(self):
+        with self.app_context():
+            OutboxMessageModel.enqueue(OutboxMessageModel.EMAIL, 'email:alert-created:1', to_email='alex@uci.cu')
+            OutboxMessageModel.enqueue(OutboxMessageModel.EMAIL, 'email:alert-created:1', to_email='alex@uci.cu')
+            db.session.commit()
+
+            self.assertEqual(1, OutboxMessageModel.query.count())
+            self.assertDictEqual({'to_email': 'alex@uci.cu'}, OutboxMessageModel.query.first().kwargs())
+            self.assertEqual(1, OutboxMessageModel.stats()['pending'])
+
+    def test_claim_leases_the_messages(self):
+        with self.app_context():
+            OutboxMessageModel.enqueue(OutboxMessageModel.SMS, 'sms:alert-created:1', to_phone='+12104352345')
+            db.session.commit()
+
+            claimed = OutboxMessageModel.claim(10, self.now + datetime.timedelta(seconds=1), lease=60)
+            self.assertListEqual(['sms:alert-created:1'], [message.idempotency_key for message in claimed])
+            # Held until the lease expires
+            self.assertListEqual([], OutboxMessageModel.claim(10, self.now + datetime.timedelta(seconds=30)))
+
+            claimed[0].delivered(self.now)
+            db.session.commit()
+            self.assertListEqual([], OutboxMessageModel.claim(10, self.now + datetime.timedelta(minutes=5)))
+            self.assertEqual(1, OutboxMessageModel.purge(self.now + datetime.timedelta(seconds=1)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+"""
+PriceHistoryTest class
+Class tested: PriceObservationModel, PriceRollupModel
+
+Only test methods that depends on databases or work with other classes and methods of your app
+"""
+import datetime
+import unittest
+
+from pricealerts.models import ItemModel, PriceObservationModel, PriceRollupModel, StoreModel
+from tests.base_test import BaseTest
+
+
+class PriceHistoryTest(BaseTest):
+    def setUp(self):
+        super(PriceHistoryTest, self).setUp()
+
+        self.store = StoreModel(name='store1', url_prefix='http://johnlewis.com', tag_name='span',
+                                query_string={'id': 'priceblock_ourprice'})
+        self.item = ItemModel(
+            url='https://www.johnlewis.com/john-lewis-partners-amber-clear-swirl-bauble-orange/p3527237',
+            price=19.99, name='Item1', store_id=1)
+        self.now = datetime.datetime(2018, 12, 1, 10, 30)
+
+    def days_ago(self, days, minutes=0):
+        return self.now - datetime.timedelta(days=days, minutes=minutes)
+
+    def test_record_many(self):
+        with self.app_context():
+            self.store.save_to_db()
+            self.item.save_to_db()
+
+            PriceObservationModel.record_many([(1, 19.99), (1, None)], self.days_ago(1))
+            PriceObservationModel.record_many([(1, 17.49)], self.now)
+
+            self.assertDictEqual({1: self.now}, PriceObservationModel.last_observed([1, 2]))
+            self.assertEqual(17.49, PriceObservationModel.lowest_price(1, self.days_ago(30)))
+            self.assertListEqual([(self.days_ago(1), 19.99, 19.99), (self.now, 17.49, 17.49)],
+                                 PriceObservationModel.history(1, self.days_ago(30), self.now + datetime.timedelta(1)))
+
+    def test_compact(self):
+        with self.app_context():
+            self.store.save_to_db()
+            self.item.save_to_db()
+
+            # Two observations in the same hour, 40 days ago, and a recent one
+            PriceObservationModel.record_many([(1, 19.99)], self.days_ago(40, minutes=10))
+            PriceObservationModel.record_many([(1, 15.00)], self.days_ago(40, minutes=20))
+            PriceObservationModel.record_many([(1, 17.49)], self.days_ago(1))
+
+            compacted = PriceRollupModel.compact(self.now)
+            self.assertEqual(2, compacted['observations'])
+
+            rollup = PriceRollupModel.query.one()
+            self.assertEqual(PriceRollupModel.HOUR, rollup.resolution)
+            self.assertEqual(datetime.datetime(2018, 10, 22, 10), rollup.bucket)
+            self.assertEqual((1500, 1999, 2), (rollup.min_cents, rollup.max_cents, rollup.observations))
+
+            self.assertEqual(15.0, PriceObservationModel.lowest_price(1, self.days_ago(60)))
+            self.assertEqual(17.49, PriceObservationModel.lowest_price(1, self.days_ago(30)))
+
+            # A year later, the hourly rollups are folded into daily ones
+            PriceRollupModel.compact(self.now + datetime.timedelta(days=400))
+            rollup = PriceRollupModel.query.filter_by(item_id=1, bucket=datetime.datetime(2018, 10, 22)).one()
+            self.assertEqual(PriceRollupModel.DAY, rollup.resolution)
+            self.assertEqual(2, rollup.observations)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -26,7 +26,7 @@ class NotificationDispatcherTest(BaseTest):
 
         mocked_post_response = MagicMock()
         mocked_post_response.status_code = 500
-        with patch('pricealerts.utils.notifications.requests.post', return_value=mocked_post_response) as mocked_requests:
+        with patch('pricealerts.utils.notifications.http_client.post', return_value=mocked_post_response) as mocked_requests:
 
             res = notifications.NotificationDispatcher.send_email('Alxe', 'alexmtnezf@gmail.com', 'alexmtnezf@gmail.com', 'dads', 'dads')
             self.assertFalse(res)
@@ -35,9 +35,12 @@ class NotificationDispatcherTest(BaseTest):
 
         mocked_post_response = MagicMock()
         mocked_post_response.status_code = 500
-        with patch('pricealerts.utils.notifications.requests.post', return_value=mocked_post_response) as mocked_requests:
+        with patch('pricealerts.utils.notifications.http_client.post', return_value=mocked_post_response) as mocked_requests:
 
-            with patch('pricealerts.utils.notifications.smtplib') as mocked_smtplib:
+            # A new SMTP connection pool is created with the mocked connections
+            with patch('pricealerts.utils.notifications.smtplib') as mocked_smtplib, \
+                    patch.object(notifications.NotificationDispatcher, '_smtp_pool', None):
+                mocked_smtplib.SMTP_PORT = 25
                 mocked_smtplib.SMTP_SSL = Mock(side_effect=SMTPServerDisconnected)
                 mocked_smtplib.SMTP = Mock(side_effect=SMTPAuthenticationError)
                 res = notifications.NotificationDispatcher.send_email('Alxe', 'alexmtnezf@gmail.com', 'alexmtnezf@gmail.com', 'dads', 'dads')
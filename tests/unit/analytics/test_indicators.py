@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+"""
+IndicatorsTest
+
+Only test methods that don't depend on databases or other classes of your app
+"""
+import unittest
+
+import numpy as np
+
+from pricealerts.analytics.indicators import drop_from_high, resample, rolling_max, rolling_min, volatility
+from tests.unit.unit_base_test import UnitBaseTest
+
+
+def days(*offsets):
+    return np.datetime64('2018-12-01T00:00:00', 's') + np.array(offsets) * np.timedelta64(1, 'D')
+
+
+class IndicatorsTest(UnitBaseTest):
+    def test_resample_carries_the_last_price_forward(self):
+        grid, prices = resample(days(0, 2, 3), np.array([100, 80, 90]), start=days(-1)[0])
+        self.assertEqual(5, len(grid))
+        self.assertTrue(np.isnan(prices[0]))
+        self.assertListEqual([100, 100, 80, 90], prices[1:].tolist())
+
+    def test_rolling_min_and_max(self):
+        values = np.array([5, 3, 8, 6, 2, 7, 9, 4])
+        expected_min = [min(values[max(0, i - 2):i + 1]) for i in range(len(values))]
+        expected_max = [max(values[max(0, i - 2):i + 1]) for i in range(len(values))]
+        self.assertListEqual(expected_min, rolling_min(values, 3).tolist())
+        self.assertListEqual(expected_max, rolling_max(values, 3).tolist())
+        self.assertListEqual(values.tolist(), rolling_min(values, 1).tolist())
+
+    def test_drop_from_high(self):
+        times, prices = days(0, 10, 20), np.array([200, 100, 75])
+        self.assertEqual(25.0, drop_from_high(times, prices, days=5))
+        # The price in effect at the start of the period counts as well
+        self.assertEqual(62.5, drop_from_high(times, prices, days=15))
+        self.assertIsNone(drop_from_high(days(), np.array([]), days=15))
+
+    def test_volatility(self):
+        self.assertEqual(0.0, volatility(days(0, 10), np.array([100, 100]), days=10))
+        self.assertGreater(volatility(days(0, 1, 2, 3), np.array([100, 120, 90, 110]), days=3), 0.1)
+        self.assertIsNone(volatility(days(0), np.array([100]), days=10, now=days(0)[0]))
+
+
+if __name__ == '__main__':
+    unittest.main()
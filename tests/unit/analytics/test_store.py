@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+"""
+ColumnarPriceStoreTest
+
+Only test methods that don't depend on databases or other classes of your app
+"""
+import datetime
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+from mock import patch
+
+from pricealerts.analytics.store import ColumnarPriceStore, history_columns
+from tests.unit.unit_base_test import UnitBaseTest
+
+NOW = datetime.datetime(2018, 12, 1, 10, 0)
+
+
+def hours(n):
+    return NOW + datetime.timedelta(hours=n)
+
+
+class ColumnarPriceStoreTest(UnitBaseTest):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.store = ColumnarPriceStore(self.root, partition_size=10)
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def test_append_and_read(self):
+        self.store.append(1, [hours(0), hours(1)], [1999, 1749])
+        self.store.append(1, [hours(2)], [1500])
+
+        times, prices = self.store.read(1)
+        self.assertIsInstance(times, np.memmap)
+        self.assertListEqual([1999, 1749, 1500], prices.tolist())
+        self.assertEqual(np.datetime64(hours(2), 's'), times[-1])
+
+    def test_read_without_history(self):
+        times, prices = self.store.read(2)
+        self.assertEqual(0, len(times))
+        self.assertEqual(0, len(prices))
+
+    def test_export_is_idempotent(self):
+        rows = [(1, hours(0), 1999), (1, hours(1), 1749), (12, hours(0), 500)]
+        self.assertEqual(3, self.store.export(rows))
+        # An export interrupted before its watermark was saved runs again
+        self.store.export(rows + [(12, hours(1), 450)])
+
+        self.assertListEqual([1, 12], self.store.items())
+        self.assertListEqual([1999, 1749], self.store.read(1)[1].tolist())
+        self.assertListEqual([500, 450], self.store.read(12)[1].tolist())
+
+    def test_history_columns_replay_the_rollups(self):
+        rows = [(hours(-48), 17.49, 19.99), (hours(-1), 15.0, 15.0), (hours(0), 14.5, 14.5)]
+
+        times, prices = history_columns(rows)
+
+        self.assertListEqual([1999, 1749, 1500, 1450], prices.tolist())
+        self.assertEqual(np.datetime64(hours(-48) + datetime.timedelta(seconds=1), 's'), times[1])
+
+    @patch('pricealerts.analytics.store.PriceObservationModel')
+    def test_sync_rebuilds_missing_columns(self, model):
+        model.item_ids.return_value = [1, 12]
+        model.history.side_effect = lambda item_id, since, until: {
+            1: [(hours(-48), 17.49, 19.99), (hours(-1), 15.0, 15.0)],
+            12: [(hours(-2), 5.0, 5.0)]
+        }[item_id]
+        self.store.append(3, [hours(-3)], [100])
+
+        self.assertEqual(4, self.store.sync(now=NOW, lag=0))
+
+        self.assertListEqual([1, 12], self.store.items())
+        self.assertListEqual([1999, 1749, 1500], self.store.read(1)[1].tolist())
+        self.assertEqual(NOW, self.store.watermark())
+
+    @patch('pricealerts.analytics.store.PriceObservationModel')
+    def test_sync_rebuilds_columns_behind_the_rollups(self, model):
+        model.item_ids.return_value = []
+        self.store.sync(now=NOW - datetime.timedelta(days=60), lag=0)
+        self.store.sync(now=NOW, lag=0)
+
+        self.assertEqual(2, model.item_ids.call_count)
+        self.assertEqual(NOW, self.store.watermark())
+
+    @patch('pricealerts.analytics.store.PriceObservationModel')
+    def test_history_reads_the_columns_and_the_prices_since_the_watermark(self, model):
+        model.item_ids.return_value = [1]
+        model.history.return_value = [(hours(-3), 19.99, 19.99), (hours(-2), 17.49, 17.49)]
+        self.store.sync(now=NOW, lag=0)
+        model.history.reset_mock()
+        model.history.return_value = [(hours(1), 15.0, 15.0)]
+
+        times, prices = self.store.history(1, hours(-2), hours(2))
+
+        model.history.assert_called_once_with(1, NOW, hours(2))
+        self.assertListEqual([1749, 1500], prices.tolist())
+        self.assertEqual(np.datetime64(hours(1), 's'), times[-1])
+
+    @patch('pricealerts.analytics.store.PriceObservationModel')
+    def test_history_reads_the_database_without_columns(self, model):
+        model.history.return_value = [(hours(-2), 17.49, 17.49)]
+
+        times, prices = self.store.history(1, hours(-3), NOW)
+
+        model.history.assert_called_once_with(1, hours(-3), NOW)
+        self.assertListEqual([1749], prices.tolist())
+
+
+if __name__ == '__main__':
+    unittest.main()
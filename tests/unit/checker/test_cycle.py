@@ -0,0 +1,180 @@
+# -*- coding: utf-8 -*-
+"""
+CycleTest
+
+Only test methods that don't depend on databases or other classes of your app
+"""
+import datetime
+import unittest
+
+from mock import ANY, Mock, patch
+
+from pricealerts.checker.cycle import check_alerts, CycleStats, group_by_item
+from pricealerts.checker.engine import CheckResult, PriceCheckEngine
+from pricealerts.checker.thresholds import ThresholdIndex
+from pricealerts.models import AlertModel
+from tests.unit.unit_base_test import UnitBaseTest
+
+
+class CycleTest(UnitBaseTest):
+    def setUp(self):
+        self.items = {1: Mock(url='http://store.com/item/1', store=None, price=6.0),
+                      2: Mock(url='http://store.com/item/2', store=None, price=7.0)}
+        for item in self.items.values():
+            item.has_data.return_value = False
+        self.alerts = [Mock(id=alert_id, item_id=item_id, item=self.items[item_id])
+                       for alert_id, item_id in [(1, 1), (2, 2), (3, 1), (4, 1)]]
+        for alert in self.alerts:
+            alert.trigger_state = AlertModel.ARMED
+
+        self.fetch = Mock(return_value=('Item', 6.0, None))
+
+        # The trigger states are updated in the database
+        self.rearm_many = patch('pricealerts.checker.cycle.AlertModel.rearm_many', return_value=0).start()
+        self.fire_many = patch('pricealerts.checker.cycle.AlertModel.fire_many',
+                               side_effect=lambda alerts, now: len(alerts)).start()
+        self.find_armed = patch('pricealerts.checker.cycle.AlertModel.find_armed', side_effect=lambda alert_ids: [
+            alert for alert in self.alerts if alert.id in alert_ids and alert.trigger_state == AlertModel.ARMED]).start()
+        self.release = patch('pricealerts.checker.cycle.AlertModel.release', return_value=0).start()
+        self.addCleanup(patch.stopall)
+
+    def test_group_by_item(self):
+        groups = group_by_item(self.alerts)
+        self.assertListEqual([1, 2], list(groups))
+        self.assertListEqual([1, 3, 4], [alert.id for alert in groups[1]])
+
+    def test_cycle_stats_add_the_batches(self):
+        cycle, batch = CycleStats(), CycleStats()
+        batch.alerts, batch.fetches, batch.notified, batch.duration = 200, 150, 3, 12.5
+
+        cycle.add(batch)
+        cycle.add(batch)
+
+        self.assertEqual(400, cycle.alerts)
+        self.assertEqual(100, cycle.fetches_saved)
+        self.assertEqual(6, cycle.notified)
+        self.assertEqual(25.0, cycle.json()['duration'])
+
+    @patch('pricealerts.checker.cycle.AlertModel.find_triggered')
+    @patch('pricealerts.checker.cycle.PriceObservationModel')
+    @patch('pricealerts.checker.cycle.AlertModel.mark_checked_many')
+    def test_check_alerts_leaves_the_items_not_requested_before_the_deadline(self, mark_checked_many, observations,
+                                                                            find_triggered):
+        observations.last_observed.return_value = {}
+        find_triggered.return_value = []
+        engine = Mock()
+        engine.run.return_value = {1: CheckResult(1, self.items[1].url, ('Item', 6.0, None), None, 0.1)}
+
+        stats = check_alerts(self.alerts, engine=engine, deadline=100.0)
+
+        engine.run.assert_called_once_with(ANY, 100.0)
+        self.assertEqual(1, stats.deferred)
+        self.assertEqual(2, stats.fetches_saved)
+        find_triggered.assert_called_once_with([1, 3, 4], armed_only=True)
+        # The alert not requested keeps its due time instead of waiting for the end of its lease
+        self.release.assert_called_once_with([2])
+        self.assertEqual(0, self.items[2].load_price_change.call_count)
+
+    @patch('pricealerts.checker.cycle.AlertModel.find_triggered')
+    @patch('pricealerts.checker.cycle.PriceObservationModel')
+    @patch('pricealerts.checker.cycle.AlertModel.mark_checked_many')
+    def test_check_alerts_fetches_every_item_once(self, mark_checked_many, observations, find_triggered):
+        observations.last_observed.return_value = {}
+        find_triggered.return_value = [self.alerts[2]]
+        stats = check_alerts(self.alerts, engine=PriceCheckEngine(self.fetch, max_workers=2, per_host_limit=2))
+
+        self.assertEqual(2, self.fetch.call_count)
+        self.assertEqual(4, stats.alerts)
+        self.assertEqual(2, stats.items)
+        self.assertEqual(2, stats.fetches_saved)
+        self.assertEqual(1, stats.notified)
+        find_triggered.assert_called_once_with([1, 3, 4, 2], armed_only=True)
+        self.rearm_many.assert_called_once_with([1, 3, 4, 2], ANY)
+        self.fire_many.assert_called_once_with([self.alerts[2]], ANY)
+        self.items[1].load_price_change.assert_called_once_with(
+            [self.alerts[0], self.alerts[2], self.alerts[3]], ('Item', 6.0, None))
+
+    @patch('pricealerts.checker.cycle.AlertModel.find_triggered')
+    @patch('pricealerts.checker.cycle.PriceObservationModel')
+    @patch('pricealerts.checker.cycle.AlertModel.mark_checked_many')
+    def test_check_alerts_marks_failed_items_as_checked(self, mark_checked_many, observations, find_triggered):
+        observations.last_observed.return_value = {}
+        self.fetch.side_effect = ValueError('Broken page')
+        stats = check_alerts(self.alerts, engine=PriceCheckEngine(self.fetch, max_workers=2, per_host_limit=2))
+
+        self.assertEqual(2, stats.failed)
+        self.items[2].load_price_change.assert_not_called()
+        mark_checked_many.assert_called_once_with([self.alerts[0], self.alerts[2], self.alerts[3], self.alerts[1]])
+        observations.record_many.assert_called_once_with([], ANY)
+
+    @patch('pricealerts.checker.cycle.AlertModel.find_triggered')
+    @patch('pricealerts.checker.cycle.PriceObservationModel')
+    @patch('pricealerts.checker.cycle.AlertModel.mark_checked_many')
+    def test_check_alerts_does_not_save_unchanged_items(self, mark_checked_many, observations, find_triggered):
+        observations.last_observed.return_value = {}
+        self.items[2].has_data.return_value = True
+        stats = check_alerts(self.alerts, engine=PriceCheckEngine(self.fetch, max_workers=2, per_host_limit=2))
+
+        self.assertEqual(1, stats.writes_saved)
+        self.items[1].load_price_change.assert_called_once()
+        self.items[2].load_price_change.assert_not_called()
+        mark_checked_many.assert_called_once_with([self.alerts[1]])
+
+    @patch('pricealerts.checker.cycle.AlertModel.find_triggered')
+    @patch('pricealerts.checker.cycle.PriceObservationModel')
+    @patch('pricealerts.checker.cycle.AlertModel.mark_checked_many')
+    def test_check_alerts_records_price_changes_and_heartbeats(self, mark_checked_many, observations, find_triggered):
+        now = datetime.datetime.utcnow()
+        # Item 1 changed its price, item 2 didn't and was observed recently
+        observations.last_observed.return_value = {1: now, 2: now - datetime.timedelta(minutes=5)}
+        self.fetch.return_value = ('Item', 7.0, None)
+        stats = check_alerts(self.alerts, engine=PriceCheckEngine(self.fetch, max_workers=2, per_host_limit=2))
+
+        self.assertEqual(1, stats.observations)
+        observations.record_many.assert_called_once_with([(1, 7.0)], ANY)
+
+        # Without a recent observation, the steady price of item 2 is recorded as a heartbeat
+        observations.reset_mock()
+        observations.last_observed.return_value = {1: now, 2: now - datetime.timedelta(days=2)}
+        check_alerts(self.alerts, engine=PriceCheckEngine(self.fetch, max_workers=2, per_host_limit=2))
+        observations.record_many.assert_called_once_with([(1, 7.0), (2, 7.0)], ANY)
+
+    @patch('pricealerts.checker.cycle.AlertModel.find_triggered')
+    @patch('pricealerts.checker.cycle.PriceObservationModel')
+    @patch('pricealerts.checker.cycle.AlertModel.mark_checked_many')
+    def test_check_alerts_with_threshold_index(self, mark_checked_many, observations, find_triggered):
+        observations.last_observed.return_value = {}
+        for alert in self.alerts:
+            alert.active = True
+            alert.price_limit = 6.5 if alert.id in (3, 4) else 5.0
+        thresholds = ThresholdIndex()
+
+        check_alerts(self.alerts, engine=PriceCheckEngine(self.fetch, max_workers=2, per_host_limit=2),
+                     thresholds=thresholds)
+
+        # The new price of item 1 is 6.0: alerts 3 and 4 are triggered, without querying the database
+        find_triggered.assert_not_called()
+        self.find_armed.assert_called_once_with([3, 4])
+        self.fire_many.assert_called_once_with([self.alerts[2], self.alerts[3]], ANY)
+        self.assertEqual(4, len(thresholds))
+
+    @patch('pricealerts.checker.cycle.AlertModel.find_triggered')
+    @patch('pricealerts.checker.cycle.PriceObservationModel')
+    @patch('pricealerts.checker.cycle.AlertModel.mark_checked_many')
+    def test_check_alerts_only_notifies_armed_alerts(self, mark_checked_many, observations, find_triggered):
+        observations.last_observed.return_value = {}
+        for alert in self.alerts:
+            alert.active = True
+            alert.price_limit = 6.5 if alert.id in (3, 4) else 5.0
+        # Alert 4 was already notified of the drop
+        self.alerts[3].trigger_state = AlertModel.FIRED
+
+        stats = check_alerts(self.alerts, engine=PriceCheckEngine(self.fetch, max_workers=2, per_host_limit=2),
+                             thresholds=ThresholdIndex())
+
+        self.assertEqual(1, stats.notified)
+        self.fire_many.assert_called_once_with([self.alerts[2]], ANY)
+
+
+if __name__ == '__main__':
+    unittest.main()
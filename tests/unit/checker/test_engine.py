@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+"""
+PriceCheckEngineTest
+
+Only test methods that don't depend on databases or other classes of your app
+"""
+import threading
+import time
+import unittest
+from collections import Counter
+
+from mock import Mock
+
+from pricealerts.checker.engine import PriceCheckEngine, url_host
+from pricealerts.common.errors import ItemNotLoadedError
+from pricealerts.utils.extractors import PriceExtractor
+from pricealerts.utils.parsers import ItemPage
+from tests.unit.unit_base_test import UnitBaseTest
+
+
+class PriceCheckEngineTest(UnitBaseTest):
+    def setUp(self):
+        self.lock = threading.Lock()
+        self.running = Counter()
+        self.max_running = Counter()
+
+    def fetch(self, url):
+        host = url_host(url)
+        with self.lock:
+            self.running[host] += 1
+            self.max_running[host] = max(self.max_running[host], self.running[host])
+        time.sleep(0.01)
+        with self.lock:
+            self.running[host] -= 1
+
+        if url.endswith('/broken'):
+            raise ValueError('Broken page')
+        return 'Item {}'.format(url), 6.0, None
+
+    def test_url_host(self):
+        self.assertEqual('www.johnlewis.com', url_host('https://www.johnlewis.com/p3527237'))
+
+    def test_run_returns_one_result_per_key(self):
+        jobs = [(i, 'http://store{}.com/item/{}'.format(i % 3, i)) for i in range(12)]
+        results = PriceCheckEngine(self.fetch, max_workers=4, per_host_limit=2).run(jobs)
+
+        self.assertEqual(set(range(12)), set(results))
+        self.assertTrue(all(result.ok for result in results.values()))
+        self.assertEqual(('Item http://store1.com/item/4', 6.0, None), results[4].data)
+
+    def test_run_respects_per_host_limit(self):
+        jobs = [(i, 'http://store{}.com/item/{}'.format(i % 2, i)) for i in range(20)]
+        PriceCheckEngine(self.fetch, max_workers=10, per_host_limit=2).run(jobs)
+
+        self.assertEqual(2, self.max_running['store0.com'])
+        self.assertEqual(2, self.max_running['store1.com'])
+
+    def test_run_stops_requesting_pages_after_the_deadline(self):
+        jobs = [(i, 'http://store.com/item/{}'.format(i)) for i in range(10)]
+        fetch = Mock(side_effect=lambda url: time.sleep(0.05) or ('Item', 6.0, None))
+        results = PriceCheckEngine(fetch, max_workers=2, per_host_limit=2).run(jobs, time.monotonic() + 0.03)
+
+        # The pages in flight when the deadline passed are finished
+        self.assertEqual(2, fetch.call_count)
+        self.assertEqual({0, 1}, set(results))
+        self.assertTrue(all(result.ok for result in results.values()))
+
+    def test_run_captures_errors(self):
+        results = PriceCheckEngine(self.fetch, max_workers=2, per_host_limit=1).run(
+            [(1, 'http://store.com/broken'), (2, 'http://store.com/item')])
+
+        self.assertFalse(results[1].ok)
+        self.assertIsNone(results[1].data)
+        self.assertIsInstance(results[1].error, ValueError)
+        self.assertTrue(results[2].ok)
+
+    def fetch_page(self, url):
+        css_class = 'was-price' if url.endswith('/broken') else 'price price--large'
+        content = '<html><head><title>Item</title></head><body><p class="{}">&pound;6.00</p>' \
+                  '</body></html>'.format(css_class).encode('utf-8')
+        return ItemPage(url, content, PriceExtractor('p', {'class': 'price price--large'}))
+
+    def test_run_parses_pages_in_processes(self):
+        jobs = [(i, 'http://store{}.com/item/{}'.format(i % 2, i)) for i in range(6)] + [(6, 'http://store.com/broken')]
+        for parse_workers in (0, 2):
+            with PriceCheckEngine(self.fetch_page, max_workers=4, per_host_limit=2, parse_workers=parse_workers,
+                                  parse_queue=1) as engine:
+                results = engine.run(jobs)
+
+            self.assertEqual(set(range(7)), set(results))
+            self.assertTrue(all(results[i].data == ('Item', 6.0, None) for i in range(6)))
+            self.assertIsInstance(results[6].error, ItemNotLoadedError)
+
+    def test_runs_share_the_parse_processes(self):
+        jobs = [(i, 'http://store{}.com/item/{}'.format(i % 2, i)) for i in range(4)]
+        with PriceCheckEngine(self.fetch_page, max_workers=4, per_host_limit=2, parse_workers=2) as engine:
+            engine.run(jobs)
+            parser, executor = engine.parser, engine.executor
+            results = engine.run(jobs)
+
+            self.assertIs(parser, engine.parser)
+            self.assertIs(executor, engine.executor)
+            self.assertTrue(all(result.data == ('Item', 6.0, None) for result in results.values()))
+        self.assertIsNone(engine.parser)
+
+    def test_parse_processes_start_before_the_downloads(self):
+        jobs = [(i, 'http://store{}.com/item/{}'.format(i % 2, i)) for i in range(4)]
+        processes = []
+
+        def fetch(url):
+            processes.append(len(engine.parser._processes))
+            return self.fetch_page(url)
+
+        with PriceCheckEngine(fetch, max_workers=4, per_host_limit=2, parse_workers=2) as engine:
+            engine.run(jobs)
+            self.assertListEqual([2] * 4, processes)
+
+            # The pool broke in the last run: the next one starts new processes before its downloads
+            parser, engine.parser = engine.parser, None
+            parser.shutdown()
+            results = engine.run(jobs)
+            self.assertListEqual([2] * 8, processes)
+            self.assertTrue(all(result.data == ('Item', 6.0, None) for result in results.values()))
+
+
+if __name__ == '__main__':
+    unittest.main()
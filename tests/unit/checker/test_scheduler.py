@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+"""
+SchedulerTest
+
+Only test methods that don't depend on databases or other classes of your app
+"""
+import datetime
+import unittest
+
+from mock import Mock, patch
+
+from pricealerts.checker.scheduler import AlertScheduler, DueQueue
+from tests.unit.unit_base_test import UnitBaseTest
+
+NOW = datetime.datetime(2018, 12, 1, 10, 0)
+
+
+def minutes(n):
+    return NOW + datetime.timedelta(minutes=n)
+
+
+class DueQueueTest(UnitBaseTest):
+    def setUp(self):
+        self.queue = DueQueue()
+        self.queue.replace({1: minutes(5), 2: minutes(-1), 3: minutes(2)})
+
+    def test_pop_due_in_order(self):
+        self.assertEqual(minutes(-1), self.queue.next_due())
+        self.assertListEqual([2, 3], self.queue.pop_due(minutes(3)))
+        self.assertListEqual([1], list(self.queue.due))
+        self.assertListEqual([], self.queue.pop_due(minutes(3)))
+
+    def test_pop_due_limit(self):
+        self.assertListEqual([2], self.queue.pop_due(NOW, limit=1))
+        self.assertEqual(0, self.queue.count_due(NOW))
+        self.assertEqual(1, self.queue.count_due(minutes(2)))
+
+    def test_push_moves_the_item(self):
+        self.queue.push(2, minutes(10))
+        self.queue.push(4, minutes(1))
+        # The old entry of item 2 is only dropped once it reaches the top
+        self.assertEqual(2, len([entry for entry in self.queue.heap if entry[1] == 2]))
+        self.assertListEqual([4, 3, 1], self.queue.pop_due(minutes(5)))
+        self.assertListEqual([2], self.queue.pop_due(minutes(10)))
+
+    def test_remove(self):
+        self.queue.remove(2)
+        self.assertNotIn(2, self.queue)
+        self.assertEqual(minutes(2), self.queue.next_due())
+        self.assertListEqual([3, 1], self.queue.pop_due(minutes(10)))
+        self.assertIsNone(self.queue.next_due())
+
+
+class AlertSchedulerTest(UnitBaseTest):
+    def setUp(self):
+        self.check = Mock()
+        self.scheduler = AlertScheduler(self.check, resync=3600, min_delay=30, clock=lambda: NOW)
+
+    @patch('pricealerts.checker.scheduler.AlertModel.due_times')
+    def test_run_pending_checks_the_due_items(self, due_times):
+        due_times.side_effect = [{1: minutes(5), 2: minutes(-1), 3: minutes(0)},
+                                 {2: minutes(9)}]
+
+        self.assertListEqual([2, 3], self.scheduler.run_pending())
+        self.assertListEqual([2, 3], self.check.call_args[0][0])
+        due_times.assert_called_with([2, 3])
+
+        # Item 2 was checked again in 9 minutes, item 3 has no active alerts left
+        self.assertDictEqual({1: minutes(5), 2: minutes(9)}, self.scheduler.queue.due)
+        self.assertEqual(5 * 60, round(self.scheduler.timeout()))
+
+    @patch('pricealerts.checker.scheduler.AlertModel.due_times')
+    def test_items_still_due_are_delayed(self, due_times):
+        due_times.side_effect = [{1: minutes(-1)}, {1: minutes(-1)}]
+
+        self.scheduler.run_pending()
+        self.assertDictEqual({1: NOW + datetime.timedelta(seconds=30)}, self.scheduler.queue.due)
+        self.assertListEqual([], self.scheduler.run_pending())
+
+    @patch('pricealerts.checker.scheduler.AlertModel.due_times')
+    def test_cycle_budget_carries_the_items_over(self, due_times):
+        self.scheduler.max_items = 2
+        due_times.side_effect = [{1: minutes(-3), 2: minutes(-2), 3: minutes(-1)},
+                                 {1: minutes(10), 2: minutes(-2)}]
+        # Item 2 wasn't checked before the deadline
+        self.check.return_value = False
+
+        self.assertListEqual([1, 2], self.scheduler.run_pending())
+        self.assertDictEqual({1: minutes(10), 2: minutes(-2), 3: minutes(-1)}, self.scheduler.queue.due)
+        self.assertEqual(2, self.scheduler.stats()['backlog'])
+        self.assertEqual(1, self.scheduler.stats()['overruns'])
+
+        # The leftovers go first in the next cycle
+        due_times.side_effect = [{}]
+        self.check.return_value = True
+        self.assertListEqual([2, 3], self.scheduler.run_pending())
+        self.assertEqual(0, self.scheduler.stats()['backlog'])
+
+    @patch('pricealerts.checker.scheduler.AlertModel.due_times')
+    def test_refresh_applies_changes(self, due_times):
+        self.scheduler.queue.replace({1: minutes(5), 2: minutes(6)})
+        due_times.return_value = {1: minutes(1), 3: minutes(2)}
+
+        self.scheduler.refresh({1, 2, 3})
+        self.assertDictEqual({1: minutes(1), 3: minutes(2)}, self.scheduler.queue.due)
+
+    @patch('pricealerts.checker.scheduler.db')
+    @patch('pricealerts.checker.scheduler.AlertModel.due_times')
+    def test_failed_cycle_does_not_stop_the_loop(self, due_times, db):
+        due_times.return_value = {1: minutes(-1)}
+        self.check.side_effect = [OSError('server closed the connection unexpectedly'), True]
+
+        self.assertIsNone(self.scheduler.run_cycle())
+        self.assertEqual(1, self.scheduler.stats()['failures'])
+        db.session.rollback.assert_called_once_with()
+        # The queue is reloaded after min_delay, with the item popped by the failed cycle
+        self.assertEqual(30, self.scheduler.timeout())
+
+        due_times.return_value = {1: minutes(-1)}
+        self.assertListEqual([1], self.scheduler.run_cycle())
+        self.assertEqual(2, self.check.call_count)
+
+    @patch('pricealerts.checker.scheduler.db')
+    @patch('pricealerts.checker.scheduler.AlertModel.due_times')
+    def test_failed_report_is_logged(self, due_times, db):
+        due_times.return_value = {1: minutes(-1)}
+        self.scheduler.report = Mock(side_effect=IOError('Disk full'))
+
+        self.assertListEqual([1], self.scheduler.run_cycle())
+        self.assertEqual(0, self.scheduler.stats()['failures'])
+        db.session.rollback.assert_called_once_with()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+"""
+ThresholdIndexTest
+
+Only test methods that don't depend on databases or other classes of your app
+"""
+import unittest
+
+from mock import Mock, patch
+
+from pricealerts.checker.thresholds import ThresholdIndex
+from tests.unit.unit_base_test import UnitBaseTest
+
+
+class ThresholdIndexTest(UnitBaseTest):
+    def setUp(self):
+        self.index = ThresholdIndex()
+        # (alert_id, item_id, price_limit)
+        self.index.replace([(1, 1, 20.0), (2, 1, 10.0), (3, 1, 15.0), (4, 2, 50.0), (5, 1, 15.0)])
+
+    def test_triggered(self):
+        self.assertListEqual([3, 5, 1], self.index.triggered(1, 12.0))
+        # The price must be below the limit
+        self.assertListEqual([1], self.index.triggered(1, 15.0))
+        self.assertListEqual([], self.index.triggered(1, 25.0))
+        self.assertListEqual([], self.index.triggered(3, 1.0))
+        self.assertListEqual([], self.index.triggered(1, None))
+
+    def test_upsert_and_remove(self):
+        self.index.upsert(3, 1, 30.0)
+        self.index.upsert(6, 1, 12.0)
+        self.assertListEqual([2, 6, 5, 1, 3], self.index.alert_ids[1])
+        self.assertListEqual([10.0, 12.0, 15.0, 20.0, 30.0], self.index.limits[1])
+
+        self.index.remove(4)
+        self.assertNotIn(2, self.index.limits)
+        self.assertDictEqual({'items': 1, 'alerts': 5}, self.index.stats())
+
+    def test_update(self):
+        self.index.update(Mock(id=1, item_id=1, price_limit=20.0, active=False))
+        self.assertListEqual([3, 5], self.index.triggered(1, 12.0))
+
+    @patch('pricealerts.checker.thresholds.AlertModel.thresholds')
+    def test_refresh(self, thresholds):
+        # Alert 2 was deactivated and alert 6 created
+        thresholds.return_value = [(1, 1, 20.0), (3, 1, 15.0), (5, 1, 15.0), (6, 1, 8.0)]
+        self.index.refresh({1})
+
+        thresholds.assert_called_once_with({1})
+        self.assertListEqual([6, 3, 5, 1], self.index.alert_ids[1])
+        self.assertListEqual([4], self.index.alert_ids[2])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+"""
+DeliveryWorkerTest
+
+Only test methods that don't depend on databases or other classes of your app
+"""
+import datetime
+import unittest
+
+from mock import Mock, patch
+
+from pricealerts.delivery.worker import DeliveryError, DeliveryWorker
+from pricealerts.models import OutboxMessageModel
+from tests.unit.unit_base_test import UnitBaseTest
+
+NOW = datetime.datetime(2018, 12, 1, 10, 0)
+
+
+class DeliveryWorkerTest(UnitBaseTest):
+    def setUp(self):
+        self.messages = []
+        for key in ('email:alert-created:1', 'sms:alert-created:1'):
+            message = OutboxMessageModel(key.split(':')[0], key, {'to_name': 'Alex'})
+            message.created = NOW - datetime.timedelta(seconds=2)
+            self.messages.append(message)
+
+        self.send = Mock()
+        self.worker = DeliveryWorker(self.send, max_workers=2, batch=10)
+
+    @patch('pricealerts.delivery.worker.db')
+    @patch('pricealerts.delivery.worker.OutboxMessageModel.claim')
+    def test_run_once_sends_the_messages(self, claim, db):
+        claim.return_value = self.messages
+
+        self.assertEqual(2, self.worker.run_once(NOW))
+        self.send.assert_any_call('email', {'to_name': 'Alex'})
+        self.send.assert_any_call('sms', {'to_name': 'Alex'})
+        self.assertListEqual([OutboxMessageModel.SENT] * 2, [message.status for message in self.messages])
+        db.session.commit.assert_called_once_with()
+
+        stats = self.worker.stats()
+        self.assertEqual(2, stats['sent'])
+        self.assertEqual(2.0, stats['latency_max'])
+
+    @patch('pricealerts.delivery.worker.db')
+    @patch('pricealerts.delivery.worker.OutboxMessageModel.claim')
+    def test_failed_messages_are_retried_then_dead_lettered(self, claim, db):
+        claim.return_value = self.messages[:1]
+        self.send.side_effect = DeliveryError('The email was not sent')
+        message = self.messages[0]
+
+        self.worker.run_once(NOW)
+        self.assertEqual(OutboxMessageModel.PENDING, message.status)
+        self.assertEqual(1, message.attempts)
+        self.assertEqual('The email was not sent', message.last_error)
+        self.assertEqual(NOW + datetime.timedelta(seconds=30), message.next_attempt)
+
+        # The backoff doubles after every failure
+        self.worker.run_once(NOW)
+        self.assertEqual(NOW + datetime.timedelta(seconds=60), message.next_attempt)
+
+        message.attempts = 7
+        self.worker.run_once(NOW)
+        self.assertEqual(OutboxMessageModel.DEAD, message.status)
+        self.assertDictEqual({'sent': 0, 'retried': 2, 'dead': 1, 'failures': 0, 'latency_p50': None,
+                              'latency_p95': None, 'latency_max': None}, self.worker.stats())
+
+    @patch('pricealerts.delivery.worker.db')
+    @patch('pricealerts.delivery.worker.OutboxMessageModel.claim')
+    @patch('pricealerts.delivery.worker.NotificationDispatcher.send_batch_email')
+    def test_batch_retries_only_the_recipients_left(self, send_batch_email, claim, db):
+        recipients = {'alex@uci.cu': {'name': 'Alex'}, 'niobis@gmail.com': {'name': 'Niobis'}}
+        message = OutboxMessageModel(OutboxMessageModel.BATCH, 'batch:price-drop:1:2018-12-01T10:00:00:0',
+                                     {'subject': 'Drop', 'message': 'Hi %recipient.name%', 'recipients': recipients})
+        message.created = NOW
+        claim.return_value = [message]
+        send_batch_email.return_value = ['niobis@gmail.com']
+
+        DeliveryWorker(max_workers=1).run_once(NOW)
+        send_batch_email.assert_called_once_with(subject='Drop', message='Hi %recipient.name%', recipients=recipients)
+        self.assertEqual(OutboxMessageModel.PENDING, message.status)
+        self.assertDictEqual({'niobis@gmail.com': {'name': 'Niobis'}}, message.kwargs()['recipients'])
+
+    @patch('pricealerts.delivery.worker.db')
+    @patch('pricealerts.delivery.worker.OutboxMessageModel')
+    def test_run_cycle_survives_errors_and_reports_at_intervals(self, model, db):
+        model.claim.side_effect = Exception('Connection lost')
+        report = Mock(side_effect=Exception('Snapshot not saved'))
+
+        self.assertEqual(0, self.worker.run_cycle(report))
+        self.assertEqual(1, self.worker.stats()['failures'])
+        self.assertEqual(2, db.session.rollback.call_count)
+
+        model.claim.side_effect = None
+        model.claim.return_value = []
+        self.assertEqual(0, self.worker.run_cycle(report))
+        # The metrics are saved every report_interval, not after every poll
+        report.assert_called_once_with()
+
+
+if __name__ == '__main__':
+    unittest.main()
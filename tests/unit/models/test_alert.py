@@ -4,8 +4,12 @@ AlertTest
 
 Only test methods that don't depend on databases or other classes of your app
 """
+import datetime
 import unittest
 
+from flask import Flask
+from mock import ANY, Mock, patch
+
 from pricealerts.models import AlertModel, UserModel
 from tests.unit.unit_base_test import UnitBaseTest
 
@@ -29,6 +33,55 @@ class AlertTest(UnitBaseTest):
         self.assertEqual(10, self.alert.check_every)
         self.assertEqual(None, self.alert.last_checked)
 
+    @patch('pricealerts.models.db')
+    def test_notify_schedule_skipped_by_the_clock_process(self, db):
+        db.engine.dialect.name = 'postgresql'
+        for notify in (True, False):
+            app = Flask(__name__)
+            app.config['SCHEDULER_NOTIFY'] = notify
+            with app.app_context():
+                self.alert.notify_schedule()
+
+        db.session.execute.assert_called_once_with(ANY, {'channel': ANY, 'payload': '1'})
+
+    def test_next_check(self):
+        last_checked = datetime.datetime(2018, 12, 1, 10, 0)
+        self.alert.last_checked = last_checked
+        self.assertEqual(last_checked + datetime.timedelta(minutes=10), self.alert.next_check)
+
+        self.alert.check_every = 60
+        self.assertEqual(last_checked + datetime.timedelta(minutes=60), self.alert.next_check)
+
+    def test_new_price_limit_rearms(self):
+        self.assertEqual(AlertModel.ARMED, self.alert.trigger_state)
+        self.alert.trigger_state = AlertModel.FIRED
+        self.alert.fired_at = datetime.datetime(2018, 12, 1, 10, 0)
+
+        self.alert.price_limit = 20
+        self.assertEqual(AlertModel.FIRED, self.alert.trigger_state)
+
+        self.alert.price_limit = 15
+        self.assertEqual(AlertModel.ARMED, self.alert.trigger_state)
+        self.assertIsNone(self.alert.fired_at)
+
+    def test_price_drop_batches(self):
+        item = Mock(url='http://johnlewis.com/item/1')
+        item.name = 'Item1'
+        alex, niobis = Mock(username='alexmtnezf@gmail.com'), Mock(username='niobis@gmail.com')
+        alex.name, niobis.name = 'Alex', 'Niobis'
+        alerts = [Mock(item=item, user=alex, contact_email='alex@uci.cu'),
+                  Mock(item=item, user=niobis, contact_email='niobis@gmail.com'),
+                  Mock(item=item, user=alex, contact_email='alex@uci.cu')]
+
+        batches = AlertModel.price_drop_batches(alerts, limit=2)
+        # Every address is notified once
+        self.assertListEqual([['alex@uci.cu', 'alexmtnezf@gmail.com'], ['niobis@gmail.com']],
+                             [list(batch['recipients']) for batch in batches])
+        self.assertDictEqual({'name': 'Niobis', 'contact_email': 'niobis@gmail.com'},
+                             batches[1]['recipients']['niobis@gmail.com'])
+        self.assertIn('%recipient.contact_email%', batches[0]['message'])
+        self.assertIn('Item1', batches[0]['message'])
+
 
 if __name__ == '__main__':
     unittest.main()
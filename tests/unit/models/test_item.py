@@ -6,7 +6,11 @@ Only test methods that don't depend on databases or other classes of your app
 """
 import unittest
 
+from mock import patch, MagicMock
+
 from pricealerts.models import ItemModel
+from pricealerts.utils.extractors import PriceExtractor
+from pricealerts.utils.http_cache import validator_cache
 from tests.unit.unit_base_test import UnitBaseTest
 
 
@@ -29,6 +33,41 @@ class ItemTest(UnitBaseTest):
     def test_item_representation(self):
         self.assertEqual("Item(id='None', name='test')", str(self.item))
 
+    def test_fetch_item_data_not_modified(self):
+        validator_cache.clear()
+        page = MagicMock(status_code=200, headers={'ETag': '"v1"'},
+                         content=b'<html><head><title>test</title></head>'
+                                 b'<body><p class="price price--large">&pound;6.00</p></body></html>')
+        not_modified = MagicMock(status_code=304, headers={})
+
+        with patch('pricealerts.models.http_client.get', side_effect=[page, not_modified]) as mocked_get:
+            self.assertTupleEqual(('test', 6.0, None), ItemModel.fetch_item_data(self.item.url))
+            with patch('pricealerts.utils.parsers.BeautifulSoup') as mocked_soup:
+                self.assertTupleEqual(('test', 6.0, None), ItemModel.fetch_item_data(self.item.url))
+                mocked_soup.assert_not_called()
+
+            self.assertDictEqual({'If-None-Match': '"v1"'}, mocked_get.call_args[1]['headers'])
+
+    def test_fetch_item_data_unchanged_fingerprint(self):
+        validator_cache.clear()
+        extractor = PriceExtractor('p', {'class': 'price price--large'})
+        pages = [MagicMock(status_code=200, headers={},
+                           content='<html><head><title>test</title></head><body><div>{}</div>'
+                                   '<p class="price price--large">&pound;6.00</p></body></html>'.format(ad).encode())
+                 for ad in ('Ad 1', 'Ad 2')]
+
+        with patch('pricealerts.models.http_client.get', side_effect=pages):
+            self.assertTupleEqual(('test', 6.0, None), ItemModel.fetch_item_data(self.item.url, extractor))
+            with patch('pricealerts.utils.parsers.BeautifulSoup') as mocked_soup:
+                self.assertTupleEqual(('test', 6.0, None), ItemModel.fetch_item_data(self.item.url, extractor))
+                mocked_soup.assert_not_called()
+
+        self.assertEqual(1, validator_cache.stats()['unchanged'])
+
+    def test_has_data(self):
+        self.assertTrue(self.item.has_data(('test', 19.99, None)))
+        self.assertFalse(self.item.has_data(('test', 18.99, None)))
+
 
 if __name__ == '__main__':
     unittest.main()
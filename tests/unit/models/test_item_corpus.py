@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+"""
+ItemCorpusTest
+
+Replay the recorded product pages of benchmarks/corpus through ItemModel.fetch_item_data, so extraction regressions
+are caught without hitting the real stores.
+
+Only test methods that don't depend on databases or other classes of your app
+"""
+import unittest
+
+from mock import patch
+
+from benchmarks.corpus import load_corpus
+from benchmarks.stub_store import StubStore
+from pricealerts.models import ItemModel
+from pricealerts.utils.parsers import BACKENDS
+from tests.unit.unit_base_test import UnitBaseTest
+
+
+class ItemCorpusTest(UnitBaseTest):
+    def setUp(self):
+        self.corpus = load_corpus()
+        self.store = StubStore(pages=dict((page.url_path, page.content()) for page in self.corpus)).start()
+
+    def tearDown(self):
+        self.store.stop()
+
+    def test_fetch_item_data_on_corpus(self):
+        for backend in sorted(BACKENDS):
+            for streaming in (False, True):
+                with patch.multiple('pricealerts.models.settings', HTML_PARSER_BACKEND=backend,
+                                    SCRAPER_STREAMING=streaming, SCRAPER_FINGERPRINT=False):
+                    for page in self.corpus:
+                        with self.subTest(backend=backend, streaming=streaming, page=page.path):
+                            self.assertTupleEqual(page.expected, ItemModel.fetch_item_data(
+                                self.store.url(page.url_path), page.extractor))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,171 @@
+# -*- coding: utf-8 -*-
+"""
+BreakerTest
+
+Only test methods that don't depend on databases or other classes of your app
+"""
+import unittest
+
+import requests
+from mock import Mock
+
+from pricealerts.checker.engine import PriceCheckEngine
+from pricealerts.common.errors import ItemNotLoadedError
+from pricealerts.utils.breaker import BreakerRegistry, CircuitOpenError, is_store_failure, is_url_failure
+from tests.unit.unit_base_test import UnitBaseTest
+
+
+class FakeClock(object):
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+class BreakerTest(UnitBaseTest):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.breakers = BreakerRegistry(threshold=2, backoff=60, max_backoff=200, url_backoff=30, clock=self.clock)
+        self.timeout = requests.ConnectTimeout('Timed out')
+
+    def test_is_url_failure(self):
+        self.assertTrue(is_url_failure(ItemNotLoadedError('Not found', status_code=404)))
+        self.assertTrue(is_url_failure(ItemNotLoadedError('Price not found in the product page')))
+        self.assertFalse(is_url_failure(ItemNotLoadedError('Internal server error', status_code=500)))
+        self.assertFalse(is_url_failure(ItemNotLoadedError('Too many requests', status_code=429)))
+        self.assertFalse(is_url_failure(self.timeout))
+        self.assertFalse(is_url_failure(ValueError('Bug in the parser')))
+
+    def test_is_store_failure(self):
+        self.assertTrue(is_store_failure(self.timeout))
+        self.assertTrue(is_store_failure(ItemNotLoadedError('Too many requests', status_code=429)))
+        self.assertFalse(is_store_failure(ItemNotLoadedError('Not found', status_code=404)))
+        self.assertFalse(is_store_failure(ValueError('Bug in the parser')))
+
+    def test_other_errors_are_neither_successes_nor_failures(self):
+        for i in range(2):
+            self.breakers.record_failure('http://store.com/1', self.timeout)
+        self.clock.now += 60
+        self.breakers.allow('http://store.com/1')
+
+        # The probe failed on a bug: the store stays half-open and the next page is the probe
+        self.breakers.record_failure('http://store.com/1', ValueError('Bug in the parser'))
+        self.assertFalse(self.breakers.is_open('http://store.com/2'))
+        self.breakers.allow('http://store.com/2')
+        with self.assertRaises(CircuitOpenError):
+            self.breakers.allow('http://store.com/3')
+        self.breakers.allow('http://other.com/1')
+        self.breakers.record_failure('http://store.com/1', ValueError('Bug in the parser'))
+        self.assertEqual(0, self.breakers.stats()['failing_urls'])
+
+    def test_host_opens_after_threshold(self):
+        self.breakers.record_failure('http://store.com/1', self.timeout)
+        self.breakers.allow('http://store.com/2')
+
+        self.breakers.record_failure('http://store.com/2', self.timeout)
+        self.assertTrue(self.breakers.is_open('http://store.com/3'))
+        with self.assertRaises(CircuitOpenError):
+            self.breakers.allow('http://store.com/3')
+        self.breakers.allow('http://other.com/1')
+
+    def test_half_open_probe_closes_recovered_host(self):
+        for i in range(2):
+            self.breakers.record_failure('http://store.com/1', self.timeout)
+
+        self.clock.now += 60
+        self.breakers.allow('http://store.com/1')
+        # Only one probe is let through
+        with self.assertRaises(CircuitOpenError):
+            self.breakers.allow('http://store.com/2')
+
+        self.breakers.record_success('http://store.com/1')
+        self.assertFalse(self.breakers.is_open('http://store.com/2'))
+        self.breakers.allow('http://store.com/2')
+
+    def test_failed_probe_doubles_backoff(self):
+        for i in range(2):
+            self.breakers.record_failure('http://store.com/1', self.timeout)
+
+        # 60s, then 120s, then capped at 200s
+        for backoff in (60, 120, 200):
+            self.clock.now += backoff - 1
+            with self.assertRaises(CircuitOpenError):
+                self.breakers.allow('http://store.com/1')
+            self.clock.now += 1
+            self.breakers.allow('http://store.com/1')
+            self.breakers.record_failure('http://store.com/1', self.timeout)
+
+    def test_failing_url_does_not_open_host(self):
+        not_found = ItemNotLoadedError('Not found', status_code=404)
+        for i in range(3):
+            self.breakers.record_failure('http://store.com/gone', not_found)
+
+        self.assertFalse(self.breakers.is_open('http://store.com/gone'))
+        self.breakers.allow('http://store.com/item')
+        with self.assertRaises(CircuitOpenError):
+            self.breakers.allow('http://store.com/gone')
+
+        # Third failure in a row: skipped for 30 * 2 ** 2 seconds
+        self.clock.now += 119
+        with self.assertRaises(CircuitOpenError):
+            self.breakers.allow('http://store.com/gone')
+        self.clock.now += 1
+        self.breakers.allow('http://store.com/gone')
+        self.assertEqual(0, self.breakers.stats()['failing_urls'])
+
+    def test_call_records_outcome(self):
+        def load():
+            raise self.timeout
+
+        for i in range(2):
+            with self.assertRaises(requests.ConnectTimeout):
+                self.breakers.call('http://store.com/1', load)
+        with self.assertRaises(CircuitOpenError):
+            self.breakers.call('http://store.com/1', load)
+
+        stats = self.breakers.stats()
+        self.assertEqual('open', stats['hosts']['store.com']['state'])
+        self.assertEqual(60, stats['hosts']['store.com']['retry_in'])
+
+    def test_engine_skips_open_hosts(self):
+        requested = []
+
+        def fetch(url):
+            requested.append(url)
+            if 'dead.com' in url:
+                raise self.timeout
+            return 'Item', 6.0, None
+
+        jobs = [(i, 'http://dead.com/{}'.format(i)) for i in range(5)] + [(5, 'http://alive.com/5')]
+        engine = PriceCheckEngine(fetch, max_workers=1, per_host_limit=1, breakers=self.breakers)
+        results = engine.run(jobs)
+
+        # The circuit opens after the second timeout, the queued pages aren't requested
+        self.assertEqual(2, len([url for url in requested if 'dead.com' in url]))
+        self.assertIsInstance(results[4].error, CircuitOpenError)
+        self.assertTrue(results[5].ok)
+
+        requested[:] = []
+        results = engine.run(jobs)
+        self.assertListEqual(['http://alive.com/5'], requested)
+        self.assertTrue(all(isinstance(results[i].error, CircuitOpenError) for i in range(5)))
+
+    def test_probe_dropped_at_the_deadline_is_released(self):
+        for _ in range(2):
+            self.breakers.record_failure('http://dead.com/1', self.timeout)
+        self.clock.now += 61
+
+        fetch = Mock(return_value=('Item', 6.0, None))
+        engine = PriceCheckEngine(fetch, max_workers=1, per_host_limit=1, breakers=self.breakers)
+        self.assertDictEqual({}, engine.run([(1, 'http://dead.com/1')], deadline=0.0))
+        self.assertEqual(0, fetch.call_count)
+
+        # The next page of the store is its probe
+        self.breakers.allow('http://dead.com/2')
+        with self.assertRaises(CircuitOpenError):
+            self.breakers.allow('http://dead.com/3')
+
+
+if __name__ == '__main__':
+    unittest.main()
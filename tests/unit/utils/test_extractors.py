@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+"""
+ExtractorsTest
+
+Only test methods that don't depend on databases or other classes of your app
+"""
+import unittest
+
+from bs4 import BeautifulSoup
+
+from pricealerts.common.errors import ItemNotLoadedError
+from pricealerts.models import StoreModel
+from pricealerts.utils.extractors import ExtractorRegistry, PriceExtractor, parse_price
+from tests.unit.unit_base_test import UnitBaseTest
+
+EBAY_PAGE = '''<html><head><title>Bauble | eBay</title></head><body>
+<span class="notranslate" itemprop="price" content="12.5">US $12.50</span>
+<img src="/bauble.jpg" alt="Bauble | eBay"></body></html>'''
+
+JOHN_LEWIS_PAGE = '''<html><head><title>Amber Bauble</title></head><body>
+<p class="price price--large">&pound;6.00 - &pound;8.00</p></body></html>'''
+
+
+class ExtractorsTest(UnitBaseTest):
+    def setUp(self):
+        self.store = StoreModel(name='ebay', url_prefix='https://www.ebay.com', tag_name='span',
+                                query_string={'itemprop': 'price'})
+        self.store.id = 1
+
+    def test_parse_price(self):
+        self.assertEqual(45.0, parse_price(' £45.00 - £55.12 '))
+        self.assertIsNone(parse_price('Sold out'))
+
+    def test_extract_with_store_rule(self):
+        extractor = PriceExtractor.from_store(self.store)
+        self.assertTupleEqual(('Bauble | eBay', 12.5, '/bauble.jpg'),
+                              extractor.extract(BeautifulSoup(EBAY_PAGE, 'html.parser')))
+
+    def test_extract_with_generic_rules(self):
+        extractor = PriceExtractor.from_store(self.store)
+        self.assertTupleEqual(('Amber Bauble', 6.0, None),
+                              extractor.extract(BeautifulSoup(JOHN_LEWIS_PAGE, 'html.parser')))
+
+    def test_extract_without_price(self):
+        extractor = PriceExtractor('span', {'itemprop': 'price'}, fallbacks=[])
+        with self.assertRaises(ItemNotLoadedError):
+            extractor.extract(BeautifulSoup(JOHN_LEWIS_PAGE, 'html.parser'))
+
+    def test_registry_compiles_once(self):
+        registry = ExtractorRegistry()
+        extractor = registry.get(self.store)
+        self.assertIs(extractor, registry.get(self.store))
+        self.assertIs(registry.default, registry.get(None))
+
+    def test_registry_recompiles_changed_store(self):
+        registry = ExtractorRegistry()
+        extractor = registry.get(self.store)
+
+        self.store.tag_name = 'div'
+        changed = registry.get(self.store)
+        self.assertIsNot(extractor, changed)
+        self.assertEqual('div', changed.tag_name)
+
+        registry.invalidate(self.store.id)
+        self.assertIsNot(changed, registry.get(self.store))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+"""
+FingerprintTest
+
+Only test methods that don't depend on databases or other classes of your app
+"""
+import re
+import unittest
+
+from pricealerts.utils.extractors import PriceExtractor
+from pricealerts.utils.fingerprint import page_fingerprint, rule_marker
+from tests.unit.unit_base_test import UnitBaseTest
+
+PAGE = '''<html><head><title>Item1</title></head><body>
+<div class="ads">{ads}</div>
+<p class="price price--large">{price}</p>
+<img alt="Item1" src="/item1.jpg"/>
+</body></html>'''
+
+
+def page(price='£6.00', ads='Buy now'):
+    return PAGE.format(price=price, ads=ads).encode('utf-8')
+
+
+class FingerprintTest(UnitBaseTest):
+    def setUp(self):
+        self.extractor = PriceExtractor('p', {'class': 'price price--large'})
+
+    def test_rule_marker(self):
+        self.assertEqual(b'class="price price--large"', rule_marker({'class': 'price price--large', 'id': 'p'}))
+        self.assertIsNone(rule_marker({'aria-label': re.compile('price')}))
+        self.assertIsNone(rule_marker({}))
+
+    def test_fingerprint_ignores_markup_outside_price_region(self):
+        fingerprint = page_fingerprint(page(), self.extractor, window=64)
+
+        self.assertTrue(fingerprint.startswith('region:'))
+        self.assertEqual(fingerprint, page_fingerprint(page(ads='Tracking pixel 42'), self.extractor, window=64))
+        self.assertNotEqual(fingerprint, page_fingerprint(page(price='£5.00'), self.extractor, window=64))
+
+    def test_fingerprint_falls_back_to_body(self):
+        extractor = PriceExtractor()
+        fingerprint = page_fingerprint(page(), extractor)
+
+        self.assertTrue(fingerprint.startswith('body:'))
+        self.assertNotEqual(fingerprint, page_fingerprint(page(ads='Tracking pixel 42'), extractor))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+"""
+ValidatorCacheTest
+
+Only test methods that don't depend on databases or other classes of your app
+"""
+import unittest
+
+from mock import patch
+
+from pricealerts.utils.http_cache import ValidatorCache
+from tests.unit.unit_base_test import UnitBaseTest
+
+
+class ValidatorCacheTest(UnitBaseTest):
+    def setUp(self):
+        self.cache = ValidatorCache(persistent=True)
+        self.url = 'https://www.johnlewis.com/p3527237'
+
+    def test_request_headers_without_validators(self):
+        self.assertDictEqual({}, self.cache.request_headers(self.url))
+        self.assertEqual(1, self.cache.stats()['misses'])
+
+    def test_request_headers_with_validators(self):
+        self.cache.store(self.url, {'ETag': '"abc"', 'Last-Modified': 'Wed, 21 Oct 2015 07:28:00 GMT'},
+                         ('Item1', 6.0, None))
+
+        self.assertDictEqual({'If-None-Match': '"abc"', 'If-Modified-Since': 'Wed, 21 Oct 2015 07:28:00 GMT'},
+                             self.cache.request_headers(self.url))
+        self.assertTupleEqual(('Item1', 6.0, None), self.cache.get(self.url))
+        self.assertDictEqual({'entries': 1, 'hits': 1, 'misses': 0, 'not_modified': 1, 'unchanged': 0},
+                             self.cache.stats())
+
+    def test_store_without_validators_forgets_url(self):
+        self.cache.store(self.url, {'ETag': '"abc"'}, ('Item1', 6.0, None))
+        self.cache.store(self.url, {}, ('Item1', 5.0, None))
+        self.assertIsNone(self.cache.get(self.url))
+
+    def test_get_unchanged_by_fingerprint(self):
+        self.cache.store(self.url, {}, ('Item1', 6.0, None), fingerprint='region:0000abcd')
+
+        self.assertDictEqual({}, self.cache.request_headers(self.url))
+        self.assertIsNone(self.cache.get_unchanged(self.url, 'region:0000ffff'))
+        self.assertTupleEqual(('Item1', 6.0, None), self.cache.get_unchanged(self.url, 'region:0000abcd'))
+        self.assertEqual(1, self.cache.stats()['unchanged'])
+
+    @patch('pricealerts.models.HttpValidatorModel')
+    def test_save_the_pages_changed(self, model):
+        model.save_entries.return_value = True
+        self.cache.store(self.url, {'ETag': '"abc"'}, ('Item1', 6.0, None))
+        self.cache.store('https://www.ebay.com/itm/1', {}, ('Item2', 7.0, None))
+        self.cache.save()
+        self.cache.save()
+
+        model.save_entries.assert_called_once_with({self.url: {'etag': '"abc"', 'last_modified': None,
+                                                               'fingerprint': None, 'data': ['Item1', 6.0, None]}})
+
+        self.cache.store(self.url, {}, ('Item1', 5.0, None))
+        model.save_entries.return_value = False
+        self.cache.save()
+        self.cache.save()
+        self.assertDictEqual({self.url: None}, model.save_entries.call_args[0][0])
+        self.assertEqual(3, model.save_entries.call_count)
+
+    @patch('pricealerts.models.HttpValidatorModel')
+    def test_load(self, model):
+        other_url = 'https://www.ebay.com/itm/1'
+        model.load_entries.return_value = {
+            self.url: {'etag': '"old"', 'last_modified': None, 'fingerprint': None, 'data': ['Item1', 6.0, None]},
+            other_url: {'etag': '"abc"', 'last_modified': None, 'fingerprint': None, 'data': ['Item2', 7.0, None]}
+        }
+        self.cache.store(self.url, {'ETag': '"new"'}, ('Item1', 5.0, None))
+        self.cache.load()
+
+        self.assertDictEqual({'If-None-Match': '"abc"'}, self.cache.request_headers(other_url))
+        # The pages stored before the load are kept
+        self.assertDictEqual({'If-None-Match': '"new"'}, self.cache.request_headers(self.url))
+
+    @patch('pricealerts.models.HttpValidatorModel')
+    def test_memory_cache_is_not_saved(self, model):
+        cache = ValidatorCache()
+        cache.store(self.url, {'ETag': '"abc"'}, ('Item1', 6.0, None))
+        cache.load()
+        cache.save()
+
+        self.assertEqual(0, model.load_entries.call_count + model.save_entries.call_count)
+        self.assertTupleEqual(('Item1', 6.0, None), cache.get(self.url))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+"""
+HttpClientTest
+
+Only test methods that don't depend on databases or other classes of your app
+"""
+import os
+import unittest
+
+from mock import patch
+
+from benchmarks.stub_store import StubStore
+from pricealerts.utils import http_client
+from pricealerts.utils.http_client import PooledSession
+from tests.unit.unit_base_test import UnitBaseTest
+
+
+class HttpClientTest(UnitBaseTest):
+    def setUp(self):
+        self.store = StubStore().start()
+
+    def tearDown(self):
+        self.store.stop()
+
+    def test_session_is_shared_in_the_process(self):
+        self.assertIs(http_client.session(), http_client.session())
+
+    def test_session_is_recreated_after_fork(self):
+        session = http_client.session()
+        with patch('pricealerts.utils.http_client.os.getpid', return_value=os.getpid() + 1):
+            self.assertIsNot(session, http_client.session())
+
+    def test_connections_are_reused(self):
+        session = PooledSession(pool_maxsize=2)
+        for i in range(5):
+            self.assertEqual(200, session.get(self.store.url('/product/{}'.format(i))).status_code)
+
+        self.assertDictEqual({'requests': 5, 'connections': 1, 'reused': 4}, session.connection_stats())
+
+    def test_default_timeout(self):
+        session = PooledSession(timeout=(1, 2))
+        with patch('requests.Session.request') as mocked_request:
+            session.get(self.store.url('/product/1'))
+            self.assertEqual((1, 2), mocked_request.call_args[1]['timeout'])
+
+            session.get(self.store.url('/product/1'), timeout=5)
+            self.assertEqual(5, mocked_request.call_args[1]['timeout'])
+
+
+if __name__ == '__main__':
+    unittest.main()
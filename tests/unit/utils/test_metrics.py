@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+"""
+MetricsTest
+
+Only test methods that don't depend on databases or other classes of your app
+"""
+import unittest
+
+from mock import patch
+
+from pricealerts.utils.metrics import aggregate, MetricsRegistry
+from tests.unit.unit_base_test import UnitBaseTest
+
+
+class MetricsTest(UnitBaseTest):
+    def test_aggregate_sums_counters(self):
+        totals = aggregate([
+            {'cycle': {'alerts': 200, 'duration': 12.5}, 'breakers': {'open': 1, 'state': 'open'}},
+            {'cycle': {'alerts': 150, 'duration': 20.0}, 'breakers': {'open': 0, 'state': 'closed'}},
+            {'cycle': {'alerts': 10, 'duration': None}}
+        ])
+
+        self.assertDictEqual({'cycle': {'alerts': 360, 'duration': 20.0}, 'breakers': {'open': 1}}, totals)
+
+    @patch('pricealerts.utils.metrics.process_name', return_value='clock.1')
+    @patch('pricealerts.utils.metrics.MetricsSnapshotModel')
+    def test_save_keeps_a_snapshot_per_process(self, model, process_name):
+        registry = MetricsRegistry('checker')
+        registry.register('cycle', lambda: {'alerts': 200})
+
+        snapshot = registry.save()
+
+        model.save.assert_called_once_with('checker', 'clock.1', snapshot)
+        self.assertEqual({'alerts': 200}, snapshot['cycle'])
+
+    @patch('pricealerts.utils.metrics.MetricsSnapshotModel')
+    def test_load_adds_the_totals(self, model):
+        model.load.return_value = {
+            'clock.1': {'updated': '2026-10-18T10:00:00', 'cycle': {'alerts': 200}},
+            'clock.2': {'updated': '2026-10-18T10:01:00', 'cycle': {'alerts': 100}}
+        }
+
+        snapshot = MetricsRegistry('checker').load()
+
+        self.assertEqual('2026-10-18T10:01:00', snapshot['updated'])
+        self.assertDictEqual({'cycle': {'alerts': 300}}, snapshot['totals'])
+        self.assertEqual(['clock.1', 'clock.2'], sorted(snapshot['processes']))
+
+    @patch('pricealerts.utils.metrics.MetricsSnapshotModel')
+    def test_load_without_snapshots(self, model):
+        model.load.return_value = {}
+        self.assertIsNone(MetricsRegistry('checker').load())
+        self.assertIsNone(MetricsRegistry().load())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+"""
+NotificationDispatcherTest
+
+Only test methods that don't depend on databases or other classes of your app
+"""
+import json
+import smtplib
+import unittest
+from collections import OrderedDict
+
+from mock import patch
+
+from benchmarks.stub_mailgun import StubMailgun
+from pricealerts.utils.notifications import NotificationDispatcher, personalize
+from tests.unit.unit_base_test import UnitBaseTest
+
+SUBJECT = 'NEW ALERT FOR PRICE DROP'
+MESSAGE = '!Congratulations %recipient.contact_email%, you have a chance to save money !'
+
+
+class NotificationDispatcherTest(UnitBaseTest):
+    def setUp(self):
+        self.mailgun = StubMailgun(batch_limit=3).start()
+        settings = {'API_BASE_URL': self.mailgun.url('/v3/techfitu.com/messages'), 'API_KEY': 'key',
+                    'BRAND_NAME': 'TechFitU', 'PRODUCT_NAME': 'Pricing Alerts', 'EMAIL_FROM': 'alerts@techfitu.com'}
+        patcher = patch('pricealerts.utils.notifications.env', side_effect=lambda key, default=None, **kwargs:
+                        settings.get(key, default))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.recipients = OrderedDict([('alex@uci.cu', {'name': 'Alex', 'contact_email': 'alex@uci.cu'}),
+                                       ('alexmtnezf@gmail.com', {'name': 'Alex', 'contact_email': 'alex@uci.cu'}),
+                                       ('niobis@gmail.com', {'name': 'Niobis', 'contact_email': 'niobis@gmail.com'})])
+
+    def tearDown(self):
+        self.mailgun.stop()
+
+    def test_personalize(self):
+        self.assertEqual('!Congratulations alex@uci.cu, you have a chance to save money !',
+                         personalize(MESSAGE, self.recipients['alex@uci.cu']))
+
+    def test_send_batch_email_with_a_single_request(self):
+        self.assertListEqual([], NotificationDispatcher.send_batch_email(SUBJECT, MESSAGE, self.recipients))
+
+        self.assertEqual(1, len(self.mailgun.requests))
+        path, form = self.mailgun.requests[0]
+        self.assertEqual('/v3/techfitu.com/messages', path)
+        self.assertListEqual(list(self.recipients), form['to'])
+        self.assertListEqual([MESSAGE], form['html'])
+        # Mailgun personalizes the email of every recipient
+        self.assertDictEqual(dict(self.recipients), json.loads(form['recipient-variables'][0]))
+
+    @patch('pricealerts.utils.notifications.NotificationDispatcher.smtp_pool')
+    def test_send_batch_email_falls_back_to_smtp(self, smtp_pool):
+        self.mailgun.status = 500
+        smtp_pool.return_value.send_message.side_effect = [None, smtplib.SMTPRecipientsRefused({}), None]
+
+        self.assertListEqual(['alexmtnezf@gmail.com'],
+                             NotificationDispatcher.send_batch_email(SUBJECT, MESSAGE, self.recipients))
+
+        emails = [call[0][0] for call in smtp_pool.return_value.send_message.call_args_list]
+        self.assertListEqual(list(self.recipients), [msg['To'] for msg in emails])
+        self.assertIn('!Congratulations niobis@gmail.com,', emails[2].get_content())
+
+
+if __name__ == '__main__':
+    unittest.main()
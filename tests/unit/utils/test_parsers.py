@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+"""
+ParsersTest
+
+Only test methods that don't depend on databases or other classes of your app
+"""
+import re
+import unittest
+
+from pricealerts.common.errors import ItemNotLoadedError
+from pricealerts.utils.extractors import PriceExtractor
+from pricealerts.utils.parsers import BACKENDS, get_backend, rule_to_xpath
+from tests.unit.unit_base_test import UnitBaseTest
+
+PAGE = b'''<html><head><title>Amber Bauble</title></head><body>
+<p class="price">&pound;1.00</p>
+<img src="/bauble.jpg" alt="Amber Bauble">
+<p class="price price--large">&pound;6.00</p>
+<span aria-label="price: 7.00">&pound;7.00</span>
+</body></html>'''
+
+
+class ParsersTest(UnitBaseTest):
+    def test_rule_to_xpath(self):
+        self.assertEqual('//span[@itemprop="price"]', rule_to_xpath('span', {'itemprop': 'price'}))
+        self.assertEqual('//span[re:test(@aria-label, "price")]',
+                         rule_to_xpath('span', {'aria-label': re.compile('price')}))
+        self.assertEqual('//p[(@class="price" or contains(concat(" ", normalize-space(@class), " "), " price "))]',
+                         rule_to_xpath('p', {'class': 'price'}))
+
+    def test_backends_extract_the_same_data(self):
+        for name in BACKENDS:
+            backend = get_backend(name)
+            self.assertTupleEqual(('Amber Bauble', 6.0, '/bauble.jpg'),
+                                  backend.extract(PAGE, PriceExtractor('p', {'class': 'price price--large'})), name)
+            self.assertTupleEqual(('Amber Bauble', 7.0, '/bauble.jpg'),
+                                  backend.extract(PAGE, PriceExtractor('span', {'aria-label': re.compile('price')},
+                                                                       fallbacks=[])), name)
+            self.assertEqual('Amber Bauble', backend.title(PAGE), name)
+
+    def test_backends_raise_without_price(self):
+        for name in BACKENDS:
+            with self.assertRaises(ItemNotLoadedError):
+                get_backend(name).extract(PAGE, PriceExtractor('div', {'id': 'price'}, fallbacks=[]))
+
+    def test_unknown_backend(self):
+        self.assertIs(BACKENDS['html.parser'], get_backend('html5lib'))
+
+
+if __name__ == '__main__':
+    unittest.main()
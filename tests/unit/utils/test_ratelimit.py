@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+"""
+RateLimitTest
+
+Only test methods that don't depend on databases or other classes of your app
+"""
+import time
+import unittest
+
+from mock import patch, MagicMock
+
+from pricealerts.checker.engine import PriceCheckEngine
+from pricealerts.utils.ratelimit import HostRateLimiter, TokenBucket
+from tests.unit.unit_base_test import UnitBaseTest
+
+
+class FakeClock(object):
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+class RateLimitTest(UnitBaseTest):
+    def setUp(self):
+        self.clock = FakeClock()
+
+    def test_token_bucket_burst_and_refill(self):
+        bucket = TokenBucket(rate=2, burst=3, clock=self.clock)
+        self.assertListEqual([0.0, 0.0, 0.0], [bucket.reserve() for _ in range(3)])
+        self.assertAlmostEqual(0.5, bucket.reserve())
+
+        self.clock.now += 0.5
+        self.assertEqual(0.0, bucket.reserve())
+        self.assertAlmostEqual(0.5, bucket.reserve())
+
+    def test_limiter_uses_store_limits(self):
+        limiter = HostRateLimiter(rate=10, burst=10, respect_robots=False, clock=self.clock)
+        limiter.configure('www.johnlewis.com', rate=1, burst=1)
+
+        self.assertEqual(0.0, limiter.reserve('www.johnlewis.com'))
+        self.assertAlmostEqual(1.0, limiter.reserve('www.johnlewis.com'))
+        self.assertEqual(0.0, limiter.reserve('www.ebay.com'))
+
+    def test_limiter_splits_limits_between_processes(self):
+        limiter = HostRateLimiter(rate=10, burst=10, respect_robots=False, processes=4, clock=self.clock)
+        limiter.configure('www.johnlewis.com', rate=2, burst=3)
+
+        self.assertEqual(0.0, limiter.reserve('www.johnlewis.com'))
+        self.assertAlmostEqual(2.0, limiter.reserve('www.johnlewis.com'))
+        self.assertEqual(2.5, limiter.bucket('www.ebay.com').rate)
+        self.assertEqual(2, limiter.bucket('www.ebay.com').burst)
+
+    def test_limiter_honours_crawl_delay(self):
+        robots = MagicMock(status_code=200, text='User-agent: *\nCrawl-delay: 4\n')
+        limiter = HostRateLimiter(rate=10, burst=10, respect_robots=True, clock=self.clock)
+        with patch('pricealerts.utils.ratelimit.http_client.get', return_value=robots) as mocked_get:
+            limiter.prepare(['https://www.johnlewis.com/p1'])
+            limiter.prepare(['https://www.johnlewis.com/p2'])
+            mocked_get.assert_called_once_with('https://www.johnlewis.com/robots.txt')
+
+        self.assertEqual(0.0, limiter.reserve('www.johnlewis.com'))
+        self.assertAlmostEqual(4.0, limiter.reserve('www.johnlewis.com'))
+        self.assertEqual(0.25, limiter.stats()['www.johnlewis.com']['rate'])
+        self.assertEqual(1, limiter.stats()['www.johnlewis.com']['burst'])
+
+    def test_engine_spaces_out_requests(self):
+        limiter = HostRateLimiter(rate=50, burst=1, respect_robots=False)
+        fetch = MagicMock(return_value=('Item', 6.0, None))
+        jobs = [(i, 'http://store{}.com/item/{}'.format(i % 2, i)) for i in range(10)]
+
+        start = time.monotonic()
+        results = PriceCheckEngine(fetch, max_workers=4, per_host_limit=4, rate_limiter=limiter).run(jobs)
+
+        self.assertEqual(10, len(results))
+        # 5 pages per host, the first one is sent right away and the others wait 1/50 s each
+        self.assertGreaterEqual(time.monotonic() - start, 0.075)
+        stats = limiter.stats()
+        self.assertEqual(5, stats['store0.com']['requests'])
+        self.assertEqual(0, stats['store0.com']['queued'])
+        self.assertGreater(stats['store1.com']['wait_max'], 0.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+"""
+SMTPConnectionPoolTest
+
+Only test methods that don't depend on databases or other classes of your app
+"""
+import smtplib
+import time
+import unittest
+from email.message import EmailMessage
+
+from mock import Mock
+
+from pricealerts.utils.smtp_pool import SMTPConnectionPool
+from tests.unit.unit_base_test import UnitBaseTest
+
+
+class SMTPConnectionPoolTest(UnitBaseTest):
+    def setUp(self):
+        self.connections = []
+        self.pool = SMTPConnectionPool('smtp.techfitu.com', 465, username='alerts', password='1234', max_size=2,
+                                       check_after=30, max_idle=240, max_messages=3, factory=self.connect)
+        self.msg = EmailMessage()
+
+    def connect(self, host, port, timeout=None):
+        smtp = Mock()
+        smtp.noop.return_value = (250, b'OK')
+        self.connections.append(smtp)
+        return smtp
+
+    def test_connections_are_reused(self):
+        for _ in range(3):
+            self.pool.send_message(self.msg)
+
+        self.assertEqual(1, len(self.connections))
+        self.connections[0].login.assert_called_once_with('alerts', '1234')
+        self.assertEqual(3, self.connections[0].send_message.call_count)
+        # Closed after max_messages
+        self.connections[0].quit.assert_called_once_with()
+        self.assertDictEqual({'sent': 3, 'failed': 0, 'connections': 1, 'reused': 2, 'dropped': 0, 'idle': 0},
+                             self.pool.stats())
+
+    def test_idle_connections_are_checked(self):
+        self.pool.send_message(self.msg)
+        self.pool.idle[0].last_used = time.monotonic() - 60
+        self.connections[0].noop.return_value = (421, b'Closing')
+
+        self.pool.send_message(self.msg)
+        self.assertEqual(2, len(self.connections))
+        self.connections[0].close.assert_called_once_with()
+        self.assertEqual(1, self.pool.stats()['dropped'])
+
+        # Idle for too long, closed without a check
+        self.pool.idle[0].last_used = time.monotonic() - 300
+        self.pool.send_message(self.msg)
+        self.assertEqual(3, len(self.connections))
+        self.connections[1].noop.assert_not_called()
+
+    def test_dropped_connection_is_replaced(self):
+        self.pool.send_message(self.msg)
+        self.connections[0].send_message.side_effect = smtplib.SMTPServerDisconnected('Connection unexpectedly closed')
+
+        self.pool.send_message(self.msg)
+        self.assertEqual(2, len(self.connections))
+        self.connections[1].send_message.assert_called_once_with(self.msg)
+        self.assertEqual(2, self.pool.stats()['sent'])
+
+    def test_failures_are_raised(self):
+        self.pool.factory = Mock(side_effect=smtplib.SMTPConnectError(421, 'Busy'))
+        self.assertRaises(smtplib.SMTPConnectError, self.pool.send_message, self.msg)
+
+        self.pool.factory = self.connect
+        self.pool.send_message(self.msg)
+        self.connections[0].send_message.side_effect = smtplib.SMTPRecipientsRefused({})
+        self.assertRaises(smtplib.SMTPRecipientsRefused, self.pool.send_message, self.msg)
+        # Not reused after a failure
+        self.assertEqual(0, self.pool.stats()['idle'])
+        self.assertEqual(2, self.pool.stats()['failed'])
+
+
+if __name__ == '__main__':
+    unittest.main()
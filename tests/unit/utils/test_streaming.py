@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+"""
+StreamingTest
+
+Only test methods that don't depend on databases or other classes of your app
+"""
+import re
+import unittest
+
+from pricealerts.common.errors import ItemNotLoadedError
+from pricealerts.utils.extractors import PriceExtractor
+from pricealerts.utils.streaming import attrs_match, stream_item_data
+from tests.unit.unit_base_test import UnitBaseTest
+
+PAGE = '''<html><head><title>Amber Bauble</title></head><body>
+<p class="price">&pound;1.00</p>
+<img src="/bauble.jpg" alt="Amber Bauble">
+<p class="price price--large"><span>&pound;6.00</span> <p>each</p></p>
+''' + '<div class="ad"></div>' * 1000 + '</body></html>'
+
+
+class FakeResponse(object):
+    def __init__(self, content, chunk_size=64):
+        self.content = content.encode('utf-8')
+        self.chunk_size = chunk_size
+        self.headers = {'Content-Type': 'text/html; charset=utf-8'}
+        self.encoding = 'utf-8'
+        self.chunks_read = 0
+        self.closed = False
+
+    def iter_content(self, chunk_size=None):
+        for start in range(0, len(self.content), self.chunk_size):
+            self.chunks_read += 1
+            yield self.content[start:start + self.chunk_size]
+
+    def close(self):
+        self.closed = True
+
+
+class StreamingTest(UnitBaseTest):
+    def setUp(self):
+        self.extractor = PriceExtractor('p', {'class': 'price price--large'})
+
+    def test_attrs_match(self):
+        self.assertTrue(attrs_match({'class': 'price'}, {'class': 'price price--large'}))
+        self.assertTrue(attrs_match({'class': 'price price--large'}, {'class': 'price price--large'}))
+        self.assertFalse(attrs_match({'class': 'price price--large'}, {'class': 'price'}))
+        self.assertTrue(attrs_match({'aria-label': re.compile('price')}, {'aria-label': 'price: 6.00'}))
+        self.assertFalse(attrs_match({'itemprop': 'price'}, {}))
+
+    def test_stream_item_data_stops_early(self):
+        response = FakeResponse(PAGE)
+        self.assertTupleEqual(('Amber Bauble', 6.0, '/bauble.jpg'), stream_item_data(response, self.extractor))
+        self.assertLess(response.chunks_read * response.chunk_size, 1000)
+        self.assertTrue(response.closed)
+
+    def test_stream_item_data_reads_whole_page_without_image(self):
+        response = FakeResponse(PAGE.replace('alt="Amber Bauble"', 'alt="Other"'))
+        self.assertTupleEqual(('Amber Bauble', 6.0, None), stream_item_data(response, self.extractor))
+        self.assertGreater(response.chunks_read * response.chunk_size, len(response.content) - response.chunk_size)
+
+    def test_stream_item_data_with_generic_rule(self):
+        extractor = PriceExtractor('span', {'itemprop': 'price'})
+        self.assertTupleEqual(('Amber Bauble', 6.0, '/bauble.jpg'),
+                              stream_item_data(FakeResponse(PAGE), extractor))
+
+    def test_stream_item_data_max_bytes(self):
+        response = FakeResponse(PAGE)
+        with self.assertRaises(ItemNotLoadedError):
+            stream_item_data(response, PriceExtractor('p', {'class': 'price price--large'}, fallbacks=[]),
+                             max_bytes=100)
+        self.assertEqual(2, response.chunks_read)
+
+
+if __name__ == '__main__':
+    unittest.main()